@@ -0,0 +1,364 @@
+"""Process-resident slot availability engine.
+
+For every doctor/service schedule window from today through
+``SCHEDULE_DAYS_AHEAD`` days ahead the engine keeps the fixed slot grid
+(``duration_minutes + buffer_minutes`` steps from the window start) and an
+occupancy bitmap over it, so slot searches can be answered from memory.
+Bookings and cancellations update the bitmaps after their DB commit, and
+those of other workers arrive through change_feed, which reloads the visits
+of the resource-days they touched; the whole state can be rebuilt from the
+DB at startup or on demand.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from change_feed import Change, change_feed
+from config import SCHEDULE_DAYS_AHEAD
+from models import Doctor, Service, Visit
+from schedule_rules import load_windows
+
+logger = logging.getLogger(__name__)
+
+
+class VisitIntervalIndex:
+    """Visits of one resource-day sorted by (start, id), with precomputed ends
+    (start + duration + buffer). Overlap lookups are O(log n) via bisect.
+
+    When several visits overlap a slot, the one that starts first (then the
+    lower visit id) is reported, whatever order the visits were loaded in."""
+
+    __slots__ = ("_starts", "_ends", "_max_ends", "_patients", "_minutes")
+
+    def __init__(self, visits: Iterable[Visit] = ()):
+        # Records of visits not inserted yet (batch booking) have no id.
+        ordered = sorted(visits, key=lambda v: (v.start_datetime, v.id or 0))
+        self._starts = [v.start_datetime for v in ordered]
+        self._ends = [
+            v.start_datetime + timedelta(minutes=v.duration_minutes + v.buffer_minutes)
+            for v in ordered
+        ]
+        self._patients = [v.patient_id for v in ordered]
+        # Running maximum of ends, so intervals that contain later ones are still found.
+        self._max_ends = []
+        running = None
+        for end in self._ends:
+            running = end if running is None or end > running else running
+            self._max_ends.append(running)
+        self._minutes = None
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def conflict(self, start: datetime, end: datetime) -> Optional[int]:
+        """Return the patient_id of the first visit (in start order) overlapping [start, end), or None."""
+        hi = bisect_left(self._starts, end)
+        lo = bisect_right(self._max_ends, start)
+        if lo < hi:
+            return self._patients[lo]
+        return None
+
+    def sweep(self, starts: Iterable[datetime], length: int) -> Iterator[Tuple[datetime, Optional[int]]]:
+        """Walk ascending slot starts and the visits together in one merge pass.
+        Yields (start, busy_patient_id) for slots [start, start + length minutes)."""
+        n = len(self._starts)
+        lo = hi = 0
+        span = timedelta(minutes=length)
+        for start in starts:
+            end = start + span
+            while hi < n and self._starts[hi] < end:
+                hi += 1
+            while lo < n and self._max_ends[lo] <= start:
+                lo += 1
+            yield start, (self._patients[lo] if lo < hi else None)
+
+    def minutes(self, midnight: datetime) -> Tuple[List[float], List[float], List[int]]:
+        """Starts and running-maximum ends as minutes after midnight, plus the
+        patient ids, for array-based overlap checks. Cached per midnight."""
+        if self._minutes is None or self._minutes[0] != midnight:
+            self._minutes = (
+                midnight,
+                [(t - midnight).total_seconds() / 60 for t in self._starts],
+                [(t - midnight).total_seconds() / 60 for t in self._max_ends],
+            )
+        return self._minutes[1], self._minutes[2], self._patients
+
+
+EMPTY_INDEX = VisitIntervalIndex()
+
+# Duck-typed stand-in for Visit rows kept by the engine.
+VisitRecord = namedtuple(
+    "VisitRecord", "id start_datetime duration_minutes buffer_minutes patient_id"
+)
+
+
+def grid_size(window_start: datetime, window_end: datetime, duration: int, interval: int) -> int:
+    """Number of grid slots of length duration, interval minutes apart, that fit the window."""
+    window_minutes = (window_end - window_start).total_seconds() / 60
+    return int((window_minutes - duration) // interval) + 1 if window_minutes >= duration else 0
+
+
+def _load_visits(db: Session, day_from: date, day_to: date,
+                 *filters) -> Dict[Tuple[str, int, date], Dict[int, VisitRecord]]:
+    """Visits starting in [day_from, day_to] per (kind, resource_id, day)."""
+    visits = {}
+    rows = db.query(
+        Visit.id, Visit.visit_type, Visit.doctor_id, Visit.service_id,
+        Visit.start_datetime, Visit.duration_minutes, Visit.buffer_minutes, Visit.patient_id,
+    ).filter(
+        Visit.start_datetime >= datetime.combine(day_from, datetime.min.time()),
+        Visit.start_datetime < datetime.combine(day_to + timedelta(days=1), datetime.min.time()),
+        *filters,
+    )
+    for vid, kind, doctor_id, service_id, start, duration, buffer, patient_id in rows:
+        key = (kind, doctor_id if kind == "DOCTOR" else service_id, start.date())
+        visits.setdefault(key, {})[vid] = VisitRecord(vid, start, duration, buffer, patient_id)
+    return visits
+
+
+class SlotGrid:
+    """Fixed slot grid of one schedule window with a busy bitmap (bit i = slot i busy)."""
+
+    __slots__ = (
+        "resource_id", "clinic_id", "work_date",
+        "window_start", "duration", "interval", "count", "busy",
+    )
+
+    def __init__(self, resource_id, clinic_id, work_date, window_start, window_end, duration, interval):
+        self.resource_id = resource_id
+        self.clinic_id = clinic_id
+        self.work_date = work_date
+        self.window_start = window_start
+        self.duration = duration
+        self.interval = interval
+        self.count = grid_size(window_start, window_end, duration, interval)
+        self.busy = 0
+
+    def start_at(self, i: int) -> datetime:
+        return self.window_start + timedelta(minutes=i * self.interval)
+
+    def first_index(self, time_from: datetime) -> int:
+        """Index of the first grid slot starting at or after time_from."""
+        if time_from <= self.window_start:
+            return 0
+        delta_minutes = (time_from - self.window_start).total_seconds() / 60
+        i = int(delta_minutes / self.interval)
+        if delta_minutes % self.interval > 0:
+            i += 1
+        return i
+
+    def slots(self, time_from: datetime, time_to: datetime) -> Iterator[Tuple[int, datetime, bool]]:
+        """Yield (index, start, is_busy) for grid slots inside [time_from, time_to]."""
+        span = timedelta(minutes=self.duration)
+        busy = self.busy
+        for i in range(self.first_index(time_from), self.count):
+            t = self.start_at(i)
+            if t + span > time_to:
+                break
+            yield i, t, bool(busy >> i & 1)
+
+    def free_slots(self, time_from: datetime, time_to: datetime) -> Iterator[datetime]:
+        """Yield starts of free grid slots inside [time_from, time_to], jumping
+        straight from one clear bit of the bitmap to the next."""
+        span = timedelta(minutes=self.duration)
+        i = self.first_index(time_from)
+        if i >= self.count:
+            return
+        free = (((1 << self.count) - 1) & ~self.busy) >> i
+        while free:
+            skip = (free & -free).bit_length() - 1
+            i += skip
+            t = self.start_at(i)
+            if t + span > time_to:
+                return
+            yield t
+            free >>= skip + 1
+            i += 1
+
+
+class AvailabilityEngine:
+    """In-memory schedule grids and occupancy bitmaps for doctors and services.
+
+    Covers the schedule windows with ``loaded_from <= work_date <= loaded_to``.
+    Callers must fall back to the DB for ranges the engine does not cover.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        # kind -> work_date -> [SlotGrid] ordered by schedule id
+        self._by_date: Dict[str, Dict[date, List[SlotGrid]]] = {"DOCTOR": {}, "SERVICE": {}}
+        # (kind, resource_id, work_date) -> [SlotGrid]
+        self._by_resource_day: Dict[Tuple[str, int, date], List[SlotGrid]] = {}
+        # (kind, resource_id, work_date) -> {visit_id: VisitRecord}
+        self._visits: Dict[Tuple[str, int, date], Dict[int, VisitRecord]] = {}
+        self._indexes: Dict[Tuple[str, int, date], VisitIntervalIndex] = {}
+        # Monotonic time at which the visits of the last rebuild, and of each
+        # resource-day reloaded since, were read; older reloads are dropped.
+        self._built_read_at = 0.0
+        self._read_at: Dict[Tuple[str, int, date], float] = {}
+        self.loaded_from: Optional[date] = None
+        self.loaded_to: Optional[date] = None
+        self.loaded_at: Optional[datetime] = None
+        self.build_ms: Optional[float] = None
+
+    def covers(self, day_from: date, day_to: date) -> bool:
+        return self.loaded_from is not None and self.loaded_from <= day_from and day_to <= self.loaded_to
+
+    def clear(self):
+        with self._lock:
+            self.__init__()
+
+    def rebuild(self, db: Session, day_from: Optional[date] = None, day_to: Optional[date] = None):
+        """Reload schedule windows and visits of [day_from, day_to]
+        (default: today through SCHEDULE_DAYS_AHEAD days ahead). Searches keep
+        using the previous state until the new one is swapped in."""
+        day_from = day_from or date.today()
+        day_to = day_to or day_from + timedelta(days=SCHEDULE_DAYS_AHEAD)
+        with self._rebuild_lock:
+            started = time.perf_counter()
+            by_date = {"DOCTOR": {}, "SERVICE": {}}
+            by_resource_day = {}
+
+            doctors = {
+                did: (duration, duration + buffer)
+                for did, duration, buffer in db.query(
+                    Doctor.id, Doctor.duration_minutes, Doctor.buffer_minutes,
+                ).all()
+            }
+            services = {
+                sid: (clinic_id, duration, duration + buffer)
+                for sid, clinic_id, duration, buffer in db.query(
+                    Service.id, Service.clinic_id, Service.duration_minutes, Service.buffer_minutes,
+                ).all()
+            }
+            for kind in ("DOCTOR", "SERVICE"):
+                for window in load_windows(db, kind, day_from, day_to):
+                    if kind == "DOCTOR":
+                        if window.resource_id not in doctors:
+                            continue
+                        clinic_id = window.clinic_id
+                        duration, interval = doctors[window.resource_id]
+                    else:
+                        if window.resource_id not in services:
+                            continue
+                        clinic_id, duration, interval = services[window.resource_id]
+                    grid = SlotGrid(
+                        window.resource_id, clinic_id, window.work_date,
+                        datetime.combine(window.work_date, window.time_start),
+                        datetime.combine(window.work_date, window.time_end),
+                        duration, interval,
+                    )
+                    by_date[kind].setdefault(window.work_date, []).append(grid)
+                    by_resource_day.setdefault((kind, window.resource_id, window.work_date), []).append(grid)
+
+            read_at = time.monotonic()
+            visits = _load_visits(db, day_from, day_to)
+
+            with self._lock:
+                self._by_date = by_date
+                self._by_resource_day = by_resource_day
+                self._visits = visits
+                self._indexes = {}
+                for key in set(by_resource_day) | set(visits):
+                    self._refresh(key)
+                self._built_read_at = read_at
+                self._read_at = {}
+                self.loaded_from = day_from
+                self.loaded_to = day_to
+                self.loaded_at = datetime.now()
+                self.build_ms = (time.perf_counter() - started) * 1000
+
+        logger.info(
+            "Availability engine built for %s..%s: %s grids, %s visits in %.1f ms.",
+            day_from.isoformat(), day_to.isoformat(), len(by_resource_day),
+            sum(len(v) for v in visits.values()), self.build_ms,
+        )
+
+    def apply_changes(self, db: Session, changes: Iterable[Change]):
+        """Reload the visits of the covered resource-days in changes, which
+        may come from any worker (change_feed listener)."""
+        keys = {
+            (c.kind, c.resource_id, c.work_date) for c in changes if self.covers(c.work_date, c.work_date)
+        }
+        if not keys:
+            return
+        read_at = time.monotonic()
+        resources = []
+        for kind, column in (("DOCTOR", Visit.doctor_id), ("SERVICE", Visit.service_id)):
+            ids = {rid for k, rid, _ in keys if k == kind}
+            if ids:
+                resources.append(and_(Visit.visit_type == kind, column.in_(ids)))
+        days = [day for _, _, day in keys]
+        loaded = _load_visits(db, min(days), max(days), or_(*resources))
+        with self._lock:
+            for key in keys:
+                # Another reload or a rebuild that read the DB later already covers this change.
+                if read_at <= self._read_at.get(key, self._built_read_at):
+                    continue
+                self._read_at[key] = read_at
+                self._visits[key] = loaded.get(key, {})
+                self._refresh(key)
+
+    def _refresh(self, key: Tuple[str, int, date]):
+        """Recompute the visit index and grid bitmaps of one resource-day."""
+        index = VisitIntervalIndex(self._visits.get(key, {}).values())
+        self._indexes[key] = index
+        for grid in self._by_resource_day.get(key, ()):
+            busy = 0
+            starts = (grid.start_at(i) for i in range(grid.count))
+            for i, (_, patient_id) in enumerate(index.sweep(starts, grid.interval)):
+                if patient_id is not None:
+                    busy |= 1 << i
+            grid.busy = busy
+
+    def add_visit(self, kind: str, resource_id: int, record: VisitRecord):
+        if not self.covers(record.start_datetime.date(), record.start_datetime.date()):
+            return
+        key = (kind, resource_id, record.start_datetime.date())
+        with self._lock:
+            self._visits.setdefault(key, {})[record.id] = record
+            self._refresh(key)
+
+    def remove_visit(self, kind: str, resource_id: int, start: datetime, visit_id: int):
+        if not self.covers(start.date(), start.date()):
+            return
+        key = (kind, resource_id, start.date())
+        with self._lock:
+            day_visits = self._visits.get(key)
+            if day_visits is None or day_visits.pop(visit_id, None) is None:
+                return
+            self._refresh(key)
+
+    def grids(self, kind: str, day_from: date, day_to: date) -> Iterator[SlotGrid]:
+        """Yield schedule grids of the given kind with day_from <= work_date <= day_to."""
+        by_date = self._by_date[kind]
+        day = day_from
+        while day <= day_to:
+            yield from by_date.get(day, ())
+            day += timedelta(days=1)
+
+    def index(self, kind: str, resource_id: int, work_date: date) -> VisitIntervalIndex:
+        return self._indexes.get((kind, resource_id, work_date), EMPTY_INDEX)
+
+    def status(self) -> dict:
+        return {
+            "loaded_from": self.loaded_from.isoformat() if self.loaded_from else None,
+            "loaded_to": self.loaded_to.isoformat() if self.loaded_to else None,
+            "loaded_at": self.loaded_at.strftime("%Y-%m-%dT%H:%M:%S") if self.loaded_at else None,
+            "build_ms": round(self.build_ms, 1) if self.build_ms is not None else None,
+            "grids": sum(len(g) for g in self._by_resource_day.values()),
+            "visits": sum(len(v) for v in self._visits.values()),
+        }
+
+
+availability_engine = AvailabilityEngine()
+change_feed.add_listener(availability_engine.apply_changes)
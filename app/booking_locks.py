@@ -0,0 +1,171 @@
+"""Per resource-day serialization of bookings.
+
+The unique visit keys only reject identical start times, so two bookings with
+overlapping but different starts for the same doctor or service could both
+pass the overlap check and commit. Bookings therefore hold a lock on every
+(kind, resource_id, day) they touch from the overlap check to the commit:
+
+* within the process a striped lock, so bookings of different resources
+  almost never contend and no lock object is created per resource-day;
+* across workers a MySQL named lock (``GET_LOCK``) per resource-day. The
+  session would return its connection to the pool on commit, before the
+  lock could be released, so the lock's connection is checked out first and
+  the session (if it has no transaction yet) is bound to it while the lock
+  is held: the booking runs on that one connection and takes a single pool
+  slot.
+
+Each path takes exactly one set of locks. ``resource_days_locked`` is for
+sync sessions and may block its thread. ``resource_days_locked_async`` is for
+AsyncSessions (ASYNC_DB=1), whose booking code runs on the event loop thread:
+it waits on asyncio stripes and takes the named locks through the async
+driver, and the caller then runs the unlocked booking code. The two stripe
+sets do not exclude each other, so a process books either through one path
+or the other (on MySQL the named locks still cover both).
+"""
+
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date
+from typing import Iterable, List, Tuple
+import asyncio
+import threading
+import zlib
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config import BOOKING_LOCK_STRIPES, BOOKING_LOCK_TIMEOUT, BOOKING_NAMED_LOCKS
+
+ResourceDay = Tuple[str, int, date]
+
+
+class LockTimeout(Exception):
+    """A resource-day lock was not acquired within BOOKING_LOCK_TIMEOUT."""
+
+
+def lock_name(key: ResourceDay) -> str:
+    kind, resource_id, day = key
+    return f"fh:book:{kind}:{resource_id}:{day.isoformat()}"
+
+
+class StripedLocks:
+    def __init__(self, stripes: int):
+        self.stripes = stripes
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._async_locks = [asyncio.Lock() for _ in range(stripes)]
+
+    def stripe(self, key: ResourceDay) -> int:
+        return zlib.crc32(lock_name(key).encode()) % self.stripes
+
+    def _stripes(self, keys: Iterable[ResourceDay]) -> List[int]:
+        # Always acquire in ascending order so multi-key holders cannot deadlock.
+        return sorted({self.stripe(k) for k in keys})
+
+    @contextmanager
+    def hold(self, keys: Iterable[ResourceDay], timeout: float):
+        held = []
+        try:
+            for i in self._stripes(keys):
+                if not self._locks[i].acquire(timeout=timeout):
+                    raise LockTimeout(f"stripe {i}")
+                held.append(i)
+            yield
+        finally:
+            for i in reversed(held):
+                self._locks[i].release()
+
+    @asynccontextmanager
+    async def hold_async(self, keys: Iterable[ResourceDay], timeout: float):
+        held = []
+        try:
+            for i in self._stripes(keys):
+                try:
+                    await asyncio.wait_for(self._async_locks[i].acquire(), timeout)
+                except asyncio.TimeoutError:
+                    raise LockTimeout(f"stripe {i}") from None
+                held.append(i)
+            yield
+        finally:
+            for i in reversed(held):
+                self._async_locks[i].release()
+
+
+booking_stripes = StripedLocks(BOOKING_LOCK_STRIPES)
+
+
+@contextmanager
+def _named_locks(db: Session, keys: List[ResourceDay], timeout: float):
+    bind = db.get_bind()
+    if not BOOKING_NAMED_LOCKS or bind.dialect.name != "mysql":
+        yield
+        return
+    names = sorted({lock_name(k) for k in keys})
+    with bind.connect() as conn:
+        held = []
+        previous = db.bind
+        try:
+            for name in names:
+                got = conn.execute(
+                    text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": timeout},
+                ).scalar()
+                if got != 1:
+                    raise LockTimeout(name)
+                held.append(name)
+            conn.commit()
+            if not db.in_transaction():
+                db.bind = conn
+            yield
+        finally:
+            if db.bind is conn:
+                # Ends what the booking left open here, e.g. reads after its commit.
+                db.rollback()
+                db.bind = previous
+            for name in reversed(held):
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+
+
+@asynccontextmanager
+async def _named_locks_async(db: AsyncSession, keys: List[ResourceDay], timeout: float):
+    bind = db.bind
+    if not BOOKING_NAMED_LOCKS or bind.dialect.name != "mysql":
+        yield
+        return
+    names = sorted({lock_name(k) for k in keys})
+    async with bind.connect() as conn:
+        held = []
+        previous = db.bind, db.sync_session.bind
+        try:
+            for name in names:
+                got = (await conn.execute(
+                    text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": timeout},
+                )).scalar()
+                if got != 1:
+                    raise LockTimeout(name)
+                held.append(name)
+            await conn.commit()
+            if not db.in_transaction():
+                db.bind, db.sync_session.bind = conn, conn.sync_connection
+            yield
+        finally:
+            if db.bind is conn:
+                await db.rollback()
+                db.bind, db.sync_session.bind = previous
+            for name in reversed(held):
+                await conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+
+
+@contextmanager
+def resource_days_locked(db: Session, keys: Iterable[ResourceDay], timeout: float = BOOKING_LOCK_TIMEOUT):
+    """Hold the process and DB locks of keys; raises LockTimeout."""
+    keys = list(keys)
+    with booking_stripes.hold(keys, timeout), _named_locks(db, keys, timeout):
+        yield
+
+
+@asynccontextmanager
+async def resource_days_locked_async(db: AsyncSession, keys: Iterable[ResourceDay],
+                                     timeout: float = BOOKING_LOCK_TIMEOUT):
+    """resource_days_locked for an AsyncSession, without blocking the event loop."""
+    keys = list(keys)
+    async with booking_stripes.hold_async(keys, timeout), _named_locks_async(db, keys, timeout):
+        yield
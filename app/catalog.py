@@ -0,0 +1,259 @@
+"""In-process reference-data catalog.
+
+Clinics, directions, doctors and services only change through manual DB
+edits, so they are loaded into an immutable, versioned snapshot that is
+reused until its TTL expires or an admin invalidates it. The snapshot also
+carries the direction -> doctors index and each doctor's display name and
+directions string, so hot paths never join these tables.
+"""
+
+from typing import Callable, Dict, List, Optional, Set
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+
+from sqlalchemy.orm import Session
+
+from config import CATALOG_TTL_SECONDS
+from models import Clinic, Direction, Doctor, Service, doctor_direction
+
+logger = logging.getLogger(__name__)
+
+
+def fold(value: Optional[str]) -> str:
+    """Case- and accent-insensitive form, close to MySQL's utf8mb4_unicode_ci."""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+class ClinicEntry:
+    __slots__ = ("id", "name", "district", "address")
+
+    def __init__(self, id, name, district, address):
+        self.id = id
+        self.name = name
+        self.district = district
+        self.address = address
+
+
+class DirectionEntry:
+    __slots__ = ("id", "name")
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class DoctorEntry:
+    __slots__ = (
+        "id", "first_name", "last_name", "middle_name", "bio_text", "photo_path",
+        "duration_minutes", "buffer_minutes", "directions",
+        "full_name", "directions_str", "_folded_names",
+    )
+
+    def __init__(self, id, first_name, last_name, middle_name, bio_text, photo_path,
+                 duration_minutes, buffer_minutes, directions):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.middle_name = middle_name
+        self.bio_text = bio_text
+        self.photo_path = photo_path
+        self.duration_minutes = duration_minutes
+        self.buffer_minutes = buffer_minutes
+        self.directions = directions
+        parts = [last_name, first_name]
+        if middle_name:
+            parts.append(middle_name)
+        self.full_name = " ".join(parts)
+        self.directions_str = ", ".join(d.name for d in directions)
+        self._folded_names = [fold(n) for n in (first_name, last_name, middle_name) if n]
+
+    def name_matches(self, pattern: str) -> bool:
+        """Same as ilike('%pattern%') on any of the name fields."""
+        pattern = fold(pattern)
+        return any(pattern in n for n in self._folded_names)
+
+
+class ServiceEntry:
+    __slots__ = ("id", "name", "clinic_id", "clinic", "duration_minutes", "buffer_minutes")
+
+    def __init__(self, id, name, clinic, duration_minutes, buffer_minutes):
+        self.id = id
+        self.name = name
+        self.clinic_id = clinic.id
+        self.clinic = clinic
+        self.duration_minutes = duration_minutes
+        self.buffer_minutes = buffer_minutes
+
+
+class Catalog:
+    """Immutable snapshot of the reference tables. Lists are in display order."""
+
+    def __init__(self, version: int, digest: str, clinics: List[ClinicEntry], directions: List[DirectionEntry],
+                 doctors: List[DoctorEntry], services: List[ServiceEntry]):
+        self.version = version
+        # Same on every worker for the same rows, unlike the per-process version.
+        self.digest = digest
+        self.clinic_list = sorted(clinics, key=lambda c: (fold(c.name), c.id))
+        self.direction_list = sorted(directions, key=lambda d: (fold(d.name), d.id))
+        self.doctor_list = sorted(doctors, key=lambda d: (fold(d.last_name), fold(d.first_name), d.id))
+        self.service_list = sorted(services, key=lambda s: (fold(s.name), s.id))
+        self.clinics: Dict[int, ClinicEntry] = {c.id: c for c in clinics}
+        self.directions: Dict[int, DirectionEntry] = {d.id: d for d in directions}
+        self.doctors: Dict[int, DoctorEntry] = {d.id: d for d in doctors}
+        self.services: Dict[int, ServiceEntry] = {s.id: s for s in services}
+        self.direction_doctors: Dict[int, Set[int]] = {}
+        for doc in doctors:
+            for d in doc.directions:
+                self.direction_doctors.setdefault(d.id, set()).add(doc.id)
+        self.districts = sorted({c.district for c in clinics})
+
+    def match_clinics(self, district: Optional[str] = None, clinic_id: Optional[int] = None) -> List[ClinicEntry]:
+        district = fold(district) if district else None
+        return [
+            c for c in self.clinic_list
+            if (not district or fold(c.district) == district) and (not clinic_id or c.id == clinic_id)
+        ]
+
+    def match_doctors(self, direction_id: Optional[int] = None, name: Optional[str] = None,
+                      split_words: bool = False, doctor_id: Optional[int] = None) -> List[DoctorEntry]:
+        """Doctors filtered like the SQL queries they replace. With split_words
+        every word of name must match some name field ("Hans Müller" or "Müller Hans")."""
+        words = []
+        if name:
+            words = name.strip().split() if split_words else [name]
+        allowed = self.direction_doctors.get(direction_id, set()) if direction_id else None
+        return [
+            d for d in self.doctor_list
+            if (allowed is None or d.id in allowed)
+            and (not doctor_id or d.id == doctor_id)
+            and all(d.name_matches(w) for w in words)
+        ]
+
+    def match_services(self, district: Optional[str] = None, clinic_id: Optional[int] = None,
+                       service_id: Optional[int] = None, name: Optional[str] = None) -> List[ServiceEntry]:
+        district = fold(district) if district else None
+        name = fold(name) if name else None
+        return [
+            s for s in self.service_list
+            if (not district or fold(s.clinic.district) == district)
+            and (not clinic_id or s.clinic_id == clinic_id)
+            and (not service_id or s.id == service_id)
+            and (not name or name in fold(s.name))
+        ]
+
+
+def _digest(*tables: List[tuple]) -> str:
+    """Hash of the loaded rows; workers that read the same data get the same digest."""
+    digest = hashlib.sha1()
+    for rows in tables:
+        # Rows start with their unique key, so sorting never compares the other columns.
+        for row in sorted(rows):
+            digest.update(repr(row).encode())
+        digest.update(b"|")
+    return digest.hexdigest()[:16]
+
+
+def load_catalog(db: Session, version: int) -> Catalog:
+    clinic_rows = [tuple(row) for row in db.query(Clinic.id, Clinic.name, Clinic.district, Clinic.address)]
+    direction_rows = [tuple(row) for row in db.query(Direction.id, Direction.name)]
+    link_rows = [
+        tuple(row) for row in db.query(doctor_direction.c.doctor_id, doctor_direction.c.direction_id)
+    ]
+    doctor_rows = [
+        tuple(row) for row in db.query(
+            Doctor.id, Doctor.first_name, Doctor.last_name, Doctor.middle_name, Doctor.bio_text,
+            Doctor.photo_path, Doctor.duration_minutes, Doctor.buffer_minutes,
+        )
+    ]
+    service_rows = [
+        tuple(row) for row in db.query(
+            Service.id, Service.name, Service.clinic_id, Service.duration_minutes, Service.buffer_minutes,
+        )
+    ]
+
+    clinics = [ClinicEntry(*row) for row in clinic_rows]
+    directions = [DirectionEntry(*row) for row in direction_rows]
+    by_id = {d.id: d for d in directions}
+    doctor_dirs: Dict[int, List[DirectionEntry]] = {}
+    for doctor_id, direction_id in sorted(link_rows):
+        doctor_dirs.setdefault(doctor_id, []).append(by_id[direction_id])
+    doctors = [DoctorEntry(*row, directions=doctor_dirs.get(row[0], [])) for row in doctor_rows]
+    clinics_by_id = {c.id: c for c in clinics}
+    services = [
+        ServiceEntry(sid, name, clinics_by_id[clinic_id], duration, buffer)
+        for sid, name, clinic_id, duration, buffer in service_rows
+    ]
+    digest = _digest(clinic_rows, direction_rows, link_rows, doctor_rows, service_rows)
+    return Catalog(version, digest, clinics, directions, doctors, services)
+
+
+class CatalogCache:
+    """Holds the current Catalog and reloads it after ttl seconds or on invalidate().
+    The version only moves when a reload finds different rows (or on invalidate())."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._catalog: Optional[Catalog] = None
+        self._expires = 0.0
+        self._version = 0
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def add_listener(self, callback: Callable[[], None]):
+        """Call callback whenever the version changes, for caches derived from the catalog."""
+        self._listeners.append(callback)
+
+    def fresh(self) -> Optional[Catalog]:
+        """The loaded catalog, or None if get() would reload it."""
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() < self._expires:
+            return catalog
+        return None
+
+    def get(self, db: Session) -> Catalog:
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() < self._expires:
+            return catalog
+        with self._lock:
+            if self._catalog is None or time.monotonic() >= self._expires:
+                if self._reload(db, force=False):
+                    for callback in self._listeners:
+                        callback()
+            return self._catalog
+
+    def _reload(self, db: Session, force: bool) -> bool:
+        """Load the tables again (caller holds _lock). Unless force, a snapshot
+        with the same rows is kept with its version; returns whether it changed."""
+        catalog = load_catalog(db, self._version + 1)
+        self._expires = time.monotonic() + self.ttl
+        if not force and self._catalog is not None and catalog.digest == self._catalog.digest:
+            return False
+        self._version = catalog.version
+        self._catalog = catalog
+        logger.info(
+            "Reference catalog v%s loaded: %s clinics, %s doctors, %s services.",
+            self._version, len(catalog.clinics), len(catalog.doctors), len(catalog.services),
+        )
+        return True
+
+    def invalidate(self, db: Session) -> int:
+        """Reload the snapshot now and return its new version."""
+        with self._lock:
+            self._reload(db, force=True)
+            version = self._version
+        for callback in self._listeners:
+            callback()
+        return version
+
+
+reference_catalog = CatalogCache(CATALOG_TTL_SECONDS)
@@ -0,0 +1,137 @@
+"""Cross-worker feed of booking changes.
+
+Every booking and cancellation adds a ``resource_day_change`` row (kind,
+resource, day) in its own transaction. The availability engine and other
+process-resident state cannot see what other workers commit, so before they
+serve from memory the worker reads the rows it has not seen yet (``poll``,
+one primary-key range query) and hands them to the registered listeners,
+which refresh or invalidate just those resource-days.
+
+Auto-increment ids are assigned at insert but become visible at commit, so a
+lower id can show up after a higher one. Ids a poll skipped are kept as gaps
+and asked for again until they appear or ``GAP_SECONDS`` pass (a rolled back
+booking never fills its id); ``position`` never moves past an open gap.
+Direct DB edits of visits or schedules do not go through the feed.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+import threading
+import time
+
+from sqlalchemy import func, insert, or_
+from sqlalchemy.orm import Session
+
+from models import ResourceDayChange
+
+# Seconds an id skipped by a poll is waited for.
+GAP_SECONDS = 10.0
+# Larger jumps between ids (e.g. auto_increment_increment > 1) are not tracked as gaps.
+MAX_GAPS = 1000
+# Changes older than this are pruned by the schedule extender; every worker
+# polls at least once per extender run.
+RETENTION = timedelta(days=1)
+
+
+class Change(NamedTuple):
+    id: int
+    kind: str
+    resource_id: int
+    work_date: date
+
+
+def record_changes(db: Session, keys: Iterable[tuple]):
+    """Add a change row per (kind, resource_id, day) to db's transaction; the caller commits."""
+    now = datetime.now()
+    rows = [
+        {"resource_type": kind, "resource_id": resource_id, "work_date": day, "created_at": now}
+        for kind, resource_id, day in set(keys)
+    ]
+    if rows:
+        db.execute(insert(ResourceDayChange), rows)
+
+
+def prune_changes(db: Session) -> int:
+    """Delete changes older than RETENTION and commit; returns the number deleted."""
+    deleted = (
+        db.query(ResourceDayChange)
+        .filter(ResourceDayChange.created_at < datetime.now() - RETENTION)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+class ChangeFeed:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.last_id: Optional[int] = None
+        # id -> monotonic time after which it is given up
+        self._gaps: Dict[int, float] = {}
+        self._listeners: List[Callable[[Session, List[Change]], None]] = []
+        # monotonic time of the last poll that found changes
+        self._last_change_at = 0.0
+
+    @property
+    def position(self) -> int:
+        """Every change with an id up to this has been passed to the listeners."""
+        with self._lock:
+            if self.last_id is None:
+                return 0
+            return min(self._gaps) - 1 if self._gaps else self.last_id
+
+    def recent_change(self, seconds: float) -> bool:
+        """True if a poll within the last seconds found changes, e.g. while a replica may still miss them."""
+        return time.monotonic() - self._last_change_at < seconds
+
+    def add_listener(self, callback: Callable[[Session, List[Change]], None]):
+        """Call callback(db, changes) with the new changes of every poll."""
+        self._listeners.append(callback)
+
+    def poll(self, db: Session) -> List[Change]:
+        """Read the changes not seen yet and pass them to the listeners.
+        The first poll only records the current end of the feed."""
+        with self._lock:
+            last, gaps = self.last_id, list(self._gaps)
+        if last is None:
+            end = db.query(func.max(ResourceDayChange.id)).scalar() or 0
+            with self._lock:
+                if self.last_id is None:
+                    self.last_id = end
+            return []
+
+        condition = ResourceDayChange.id > last
+        if gaps:
+            condition = or_(condition, ResourceDayChange.id.in_(gaps))
+        changes = [
+            Change(*row)
+            for row in db.query(
+                ResourceDayChange.id, ResourceDayChange.resource_type,
+                ResourceDayChange.resource_id, ResourceDayChange.work_date,
+            ).filter(condition).order_by(ResourceDayChange.id)
+        ]
+
+        now = time.monotonic()
+        with self._lock:
+            seen = {c.id for c in changes}
+            for change_id in seen:
+                self._gaps.pop(change_id, None)
+            top = changes[-1].id if changes else last
+            if top - last <= MAX_GAPS:
+                for missing in range(last + 1, top):
+                    if missing not in seen:
+                        self._gaps.setdefault(missing, now + GAP_SECONDS)
+            for change_id, deadline in list(self._gaps.items()):
+                if deadline < now:
+                    del self._gaps[change_id]
+            self.last_id = max(self.last_id, top)
+            if changes:
+                self._last_change_at = now
+
+        if changes:
+            for callback in self._listeners:
+                callback(db, changes)
+        return changes
+
+
+change_feed = ChangeFeed()
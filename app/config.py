@@ -6,6 +6,58 @@ DB_NAME = os.getenv("DB_NAME", "family_health")
 DB_USER = os.getenv("DB_USER", "family_health")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "demo_pw")
 APP_PORT = int(os.getenv("APP_PORT", "8080"))
+# Days ahead covered by the availability engine, the slot table and /slots/next by default;
+# schedule rules themselves are expanded for any requested range.
 SCHEDULE_DAYS_AHEAD = int(os.getenv("SCHEDULE_DAYS_AHEAD", "14"))
+# Seconds between background schedule extension runs (the first starts with the app); 0: only that one.
+SCHEDULE_EXTEND_INTERVAL = float(os.getenv("SCHEDULE_EXTEND_INTERVAL", "3600"))
+# Answer slot searches from the in-process availability engine; every worker follows the others'
+# bookings through the resource_day_change feed.
+AVAILABILITY_ENGINE = os.getenv("AVAILABILITY_ENGINE", "1") == "1"
+# Keep a materialized `slot` table and book/search through it instead of computing grids.
+SLOT_TABLE = os.getenv("SLOT_TABLE", "0") == "1"
+# Compute slot grids and overlaps with NumPy arrays when numpy is installed.
+VECTOR_SLOTS = os.getenv("VECTOR_SLOTS", "1") == "1"
+# Serve slot search, booking and visit listing through an async engine (aiomysql or asyncmy).
+ASYNC_DB = os.getenv("ASYNC_DB", "0") == "1"
+ASYNC_DB_DRIVER = os.getenv("ASYNC_DB_DRIVER", "aiomysql")
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "20"))
+# Entries of the slot search result cache; 0 disables it.
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+# Bookings lock their (resource, day): striped in-process locks plus MySQL named locks across workers.
+BOOKING_LOCK_STRIPES = int(os.getenv("BOOKING_LOCK_STRIPES", "256"))
+BOOKING_LOCK_TIMEOUT = float(os.getenv("BOOKING_LOCK_TIMEOUT", "5"))
+BOOKING_NAMED_LOCKS = os.getenv("BOOKING_NAMED_LOCKS", "1") == "1"
+# Per-request SQL statistics: X-DB-Queries / Server-Timing headers, slow-query log, N+1 warnings.
+QUERY_STATS = os.getenv("QUERY_STATS", "1") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+# Reference data (clinics, directions, doctors, services) is reloaded after this many seconds.
+CATALOG_TTL_SECONDS = int(os.getenv("CATALOG_TTL_SECONDS", "300"))
+# Cache-Control of the reference data and slot search responses (both carry ETags).
+REFERENCE_CACHE_CONTROL = os.getenv("REFERENCE_CACHE_CONTROL", "public, max-age=60")
+SLOTS_CACHE_CONTROL = os.getenv("SLOTS_CACHE_CONTROL", "private, no-cache")
+
+# Connection pool of the sync engines (primary and replica).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds after which pooled connections are replaced (-1: never); keep below MySQL's wait_timeout.
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# Optional read replica for slot search, reference data and visit lists; empty means none.
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST", "")
+DB_REPLICA_PORT = int(os.getenv("DB_REPLICA_PORT", str(DB_PORT)))
+# After a booking or cancellation the patient's reads go to the primary for this many seconds.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
 
 DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
+ASYNC_DATABASE_URL = f"mysql+{ASYNC_DB_DRIVER}://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
+REPLICA_DATABASE_URL = (
+    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}?charset=utf8mb4"
+    if DB_REPLICA_HOST else None
+)
+ASYNC_REPLICA_DATABASE_URL = (
+    f"mysql+{ASYNC_DB_DRIVER}://{DB_USER}:{DB_PASSWORD}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}?charset=utf8mb4"
+    if DB_REPLICA_HOST else None
+)
@@ -1,173 +1,331 @@
+import functools
 import logging
+import threading
 import time
-from datetime import date, time as dt_time, timedelta
+from datetime import date, timedelta
+from typing import List, Optional
 
-from sqlalchemy import create_engine, text
+import anyio
+from sqlalchemy import UniqueConstraint, create_engine, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.schema import AddConstraint
+from starlette.requests import Request
 
-from config import DATABASE_URL, SCHEDULE_DAYS_AHEAD
-from models import DoctorSchedule, ServiceSchedule
+from config import (
+    ASYNC_DATABASE_URL, ASYNC_DB, ASYNC_DB_POOL_SIZE, ASYNC_REPLICA_DATABASE_URL, DATABASE_URL,
+    DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT, QUERY_STATS,
+    READ_YOUR_WRITES_SECONDS, REPLICA_DATABASE_URL, SCHEDULE_DAYS_AHEAD, SLOT_TABLE,
+)
+from metrics import timed_pool, watch_pool
+from models import Base, ResourceDayChange, ScheduleRule, ScheduleRuleException, Slot
+import query_stats
+from schedule_rules import template_rules
+from slot_table import materialize_slots
 
 logger = logging.getLogger(__name__)
 
+# engine / SessionLocal talk to the primary; the read_* and *Read* variants to
+# the replica, or to the primary as well when no replica is configured.
 engine = None
 SessionLocal = None
+read_engine = None
+ReadSessionLocal = None
+async_engine = None
+AsyncSessionLocal = None
+async_read_engine = None
+AsyncReadSessionLocal = None
 
 
 def ensure_schema_compatibility():
     with engine.begin() as conn:
         # Telegram user ids do not fit into MySQL INT for all accounts.
         conn.execute(text("ALTER TABLE visit MODIFY COLUMN patient_id BIGINT NOT NULL"))
+    # Volumes initialized before the slot table existed.
+    Slot.__table__.create(bind=engine, checkfirst=True)
+    # ... and before schedule rules.
+    ScheduleRule.__table__.create(bind=engine, checkfirst=True)
+    ScheduleRuleException.__table__.create(bind=engine, checkfirst=True)
+    # ... and before the booking change feed.
+    ResourceDayChange.__table__.create(bind=engine, checkfirst=True)
+    ensure_indexes()
 
 
-def _doctor_schedule_templates(work_date: date):
-    weekday = work_date.isoweekday()
-    is_weekday = weekday <= 5
+def ensure_indexes():
+    # Volumes initialized with an older 01_schema.sql lack the query indexes
+    # and unique keys declared on the models; MySQL has no CREATE INDEX IF NOT EXISTS.
+    with engine.begin() as conn:
+        existing = {
+            (table_name, index_name)
+            for table_name, index_name in conn.execute(text(
+                "SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM information_schema.statistics "
+                "WHERE TABLE_SCHEMA = DATABASE()"
+            ))
+        }
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if (table.name, index.name) not in existing:
+                    index.create(bind=conn)
+                    logger.info("Created index %s on %s.", index.name, table.name)
+            for constraint in table.constraints:
+                if isinstance(constraint, UniqueConstraint) and (table.name, constraint.name) not in existing:
+                    columns = [c.name for c in constraint.columns]
+                    duplicates = _duplicates(conn, table, columns)
+                    if duplicates:
+                        # Which copy to keep is not ours to decide; the key waits for a cleanup.
+                        logger.error(
+                            "Not creating unique key %s on %s: rows repeat (%s), e.g. %s. "
+                            "Remove the duplicates and restart.",
+                            constraint.name, table.name, ", ".join(columns), duplicates,
+                        )
+                        continue
+                    conn.execute(AddConstraint(constraint))
+                    logger.info("Created unique key %s on %s.", constraint.name, table.name)
 
-    templates = [
-        (1, 1, dt_time(9, 0), dt_time(17, 0)),
-        (6, 3, dt_time(8, 0), dt_time(14, 0)),
-    ]
-    if is_weekday:
-        templates.extend([
-            (2, 1, dt_time(10, 0), dt_time(18, 0)),
-            (3, 2, dt_time(8, 0), dt_time(16, 0)),
-            (4, 3, dt_time(9, 0), dt_time(15, 0)),
-            (8, 2, dt_time(8, 0), dt_time(16, 0)),
-            (9, 1, dt_time(11, 0), dt_time(19, 0)),
-        ])
-    if weekday in (1, 3, 5):
-        templates.extend([
-            (5, 1, dt_time(10, 0), dt_time(14, 0)),
-            (10, 3, dt_time(9, 0), dt_time(15, 0)),
-        ])
-    if weekday in (2, 4):
-        templates.append((7, 2, dt_time(9, 0), dt_time(17, 0)))
-    return templates
-
-
-def _service_schedule_templates(work_date: date):
-    weekday = work_date.isoweekday()
-    is_weekday = weekday <= 5
-
-    templates = [
-        (1, dt_time(7, 0), dt_time(12, 0)),
-        (5, dt_time(8, 0), dt_time(16, 0)),
+
+def _duplicates(conn, table, columns, sample: int = 5) -> list:
+    """Up to sample value combinations of columns that occur in more than one row, with their counts."""
+    cols = ", ".join(columns)
+    return [
+        tuple(row) for row in conn.execute(text(
+            f"SELECT {cols}, COUNT(*) FROM {table.name} GROUP BY {cols} HAVING COUNT(*) > 1 LIMIT {sample}"
+        ))
     ]
-    if is_weekday:
-        templates.extend([
-            (2, dt_time(8, 0), dt_time(17, 0)),
-            (3, dt_time(8, 0), dt_time(20, 0)),
-            (4, dt_time(8, 0), dt_time(18, 0)),
-            (6, dt_time(9, 0), dt_time(15, 0)),
-        ])
-    return templates
 
 
-def ensure_future_schedules(days_ahead: int = SCHEDULE_DAYS_AHEAD):
-    today = date.today()
-    target_end = today + timedelta(days=max(days_ahead - 1, 0))
+def _insert_missing(db, table, rows: List[dict]) -> int:
+    """Insert rows with one multi-row INSERT, skipping those whose key already
+    exists. Commits and returns the number of rows inserted."""
+    stmt = insert(table).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+    inserted = db.execute(stmt.values(rows)).rowcount
+    db.commit()
+    return inserted
 
+
+def seed_schedule_rules() -> int:
+    """Seed the demo rules into an empty schedule rule table; returns the
+    number inserted. Safe to run from several workers at once."""
     db = SessionLocal()
     try:
-        existing_doctor_keys = {
-            (doctor_id, clinic_id, work_date, time_start, time_end)
-            for doctor_id, clinic_id, work_date, time_start, time_end in (
-                db.query(
-                    DoctorSchedule.doctor_id,
-                    DoctorSchedule.clinic_id,
-                    DoctorSchedule.work_date,
-                    DoctorSchedule.time_start,
-                    DoctorSchedule.time_end,
-                )
-                .filter(DoctorSchedule.work_date >= today, DoctorSchedule.work_date <= target_end)
-                .all()
-            )
-        }
-        existing_service_keys = {
-            (service_id, work_date, time_start, time_end)
-            for service_id, work_date, time_start, time_end in (
-                db.query(
-                    ServiceSchedule.service_id,
-                    ServiceSchedule.work_date,
-                    ServiceSchedule.time_start,
-                    ServiceSchedule.time_end,
-                )
-                .filter(ServiceSchedule.work_date >= today, ServiceSchedule.work_date <= target_end)
-                .all()
-            )
-        }
+        if db.query(ScheduleRule.id).first() is not None:
+            return 0
+        seeded = _insert_missing(db, ScheduleRule.__table__, template_rules(date.today()))
+        if seeded:
+            logger.info("Seeded %s schedule rules.", seeded)
+        return seeded
+    finally:
+        db.close()
 
-        new_doctor_rows = []
-        new_service_rows = []
-
-        current = today
-        while current <= target_end:
-            if current.isoweekday() != 7:
-                for doctor_id, clinic_id, time_start, time_end in _doctor_schedule_templates(current):
-                    key = (doctor_id, clinic_id, current, time_start, time_end)
-                    if key not in existing_doctor_keys:
-                        new_doctor_rows.append(
-                            DoctorSchedule(
-                                doctor_id=doctor_id,
-                                clinic_id=clinic_id,
-                                work_date=current,
-                                time_start=time_start,
-                                time_end=time_end,
-                            )
-                        )
-                        existing_doctor_keys.add(key)
-
-                for service_id, time_start, time_end in _service_schedule_templates(current):
-                    key = (service_id, current, time_start, time_end)
-                    if key not in existing_service_keys:
-                        new_service_rows.append(
-                            ServiceSchedule(
-                                service_id=service_id,
-                                work_date=current,
-                                time_start=time_start,
-                                time_end=time_end,
-                            )
-                        )
-                        existing_service_keys.add(key)
-
-            current += timedelta(days=1)
-
-        if new_doctor_rows or new_service_rows:
-            db.add_all(new_doctor_rows + new_service_rows)
-            db.commit()
-            logger.info(
-                "Extended schedules through %s (%s doctor rows, %s service rows).",
-                target_end.isoformat(),
-                len(new_doctor_rows),
-                len(new_service_rows),
-            )
+
+def ensure_future_schedules(days_ahead: int = SCHEDULE_DAYS_AHEAD) -> dict:
+    """Seed the demo schedule rules into an empty rule table and, with
+    SLOT_TABLE, bring the slots of the next days_ahead days plus one (see
+    slot_table.horizon) in line with the schedules. Returns the number of
+    rows changed per kind. Run by schedule_extender."""
+    today = date.today()
+    target_end = today + timedelta(days=days_ahead)
+    changes = {"rules_seeded": seed_schedule_rules(), "slots_materialized": 0, "slots_removed": 0}
+
+    db = SessionLocal()
+    try:
+        if SLOT_TABLE:
+            # Also backfills windows created before the table was enabled.
+            changes["slots_materialized"], changes["slots_removed"] = materialize_slots(db, today, target_end)
+            if changes["slots_materialized"] or changes["slots_removed"]:
+                db.commit()
     finally:
         db.close()
+    return changes
+
+
+def _create_engine(url: str, name: str):
+    created = create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        poolclass=timed_pool(QueuePool, name),
+    )
+    watch_pool(name, created.pool)
+    if QUERY_STATS:
+        query_stats.install(created)
+    return created
 
 
 def init_db(max_retries: int = 30, retry_delay: float = 2.0):
-    global engine, SessionLocal
+    global engine, SessionLocal, read_engine, ReadSessionLocal
+    # The engines are built once; retries only probe them again, so a failed
+    # attempt leaves no pool (or metrics and statement hooks) behind.
+    engine = _create_engine(DATABASE_URL, "sync")
+    read_engine = _create_engine(REPLICA_DATABASE_URL, "sync_read") if REPLICA_DATABASE_URL else engine
     for attempt in range(1, max_retries + 1):
         try:
-            engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_size=5)
             with engine.connect() as conn:
                 conn.execute(text("SELECT 1"))
             ensure_schema_compatibility()
             SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
-            ensure_future_schedules()
-            logger.info("Database connection established.")
+            if read_engine is not engine:
+                with read_engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                ReadSessionLocal = sessionmaker(bind=read_engine, autocommit=False, autoflush=False)
+            else:
+                ReadSessionLocal = SessionLocal
+            logger.info("Database connection established%s.", " (with read replica)" if REPLICA_DATABASE_URL else "")
             return
         except Exception as e:
             logger.warning(f"DB connect attempt {attempt}/{max_retries} failed: {e}")
             if attempt < max_retries:
                 time.sleep(retry_delay)
+    engine.dispose()
+    if read_engine is not engine:
+        read_engine.dispose()
     raise RuntimeError("Could not connect to database after retries.")
 
 
+def _create_async_engine(url: str, name: str):
+    created = create_async_engine(
+        url,
+        pool_size=ASYNC_DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        poolclass=timed_pool(AsyncAdaptedQueuePool, name),
+    )
+    watch_pool(name, created.pool)
+    if QUERY_STATS:
+        query_stats.install(created.sync_engine)
+    return created
+
+
+def init_async_db():
+    # Schema and schedules are maintained through the sync engine in init_db.
+    global async_engine, AsyncSessionLocal, async_read_engine, AsyncReadSessionLocal
+    async_engine = _create_async_engine(ASYNC_DATABASE_URL, "async")
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False)
+    if ASYNC_REPLICA_DATABASE_URL:
+        async_read_engine = _create_async_engine(ASYNC_REPLICA_DATABASE_URL, "async_read")
+        AsyncReadSessionLocal = async_sessionmaker(bind=async_read_engine, autoflush=False)
+    else:
+        async_read_engine, AsyncReadSessionLocal = async_engine, AsyncSessionLocal
+    logger.info("Async database engine created (pool_size=%s).", ASYNC_DB_POOL_SIZE)
+
+
+class _PrimaryPins:
+    """Patients whose reads stay on the primary for a while after they wrote.
+
+    Replica lag would otherwise hide a booking or cancellation from the
+    visit list or search that follows it. Kept per worker process.
+    """
+
+    MAX_ENTRIES = 10000
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._lock = threading.Lock()
+        self._until = {}
+
+    def note_write(self, patient_id: int):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._until) >= self.MAX_ENTRIES:
+                self._until = {p: t for p, t in self._until.items() if t > now}
+            self._until[patient_id] = now + self.seconds
+
+    def pinned(self, patient_id: Optional[int]) -> bool:
+        return patient_id is not None and self._until.get(patient_id, 0.0) > time.monotonic()
+
+
+primary_pins = _PrimaryPins(READ_YOUR_WRITES_SECONDS)
+
+
+def note_write(patient_id: int):
+    """Record a committed booking or cancellation of patient_id."""
+    primary_pins.note_write(patient_id)
+
+
+def _request_patient(request: Request) -> Optional[int]:
+    try:
+        return int(request.query_params["patient_id"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _use_replica(request: Request, replica_engine, primary_engine) -> bool:
+    if replica_engine is None or replica_engine is primary_engine:
+        return False
+    return not primary_pins.pinned(_request_patient(request))
+
+
+def is_replica(db) -> bool:
+    """Whether db was opened on the read replica."""
+    return db.info.get("replica", False)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints: the replica unless the caller wrote recently."""
+    replica = _use_replica(request, read_engine, engine)
+    db = ReadSessionLocal() if replica else SessionLocal()
+    db.info["replica"] = replica
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db(request: Request):
+    replica = _use_replica(request, async_read_engine, async_engine)
+    async with (AsyncReadSessionLocal() if replica else AsyncSessionLocal()) as db:
+        db.info["replica"] = replica
+        yield db
+
+
+# Session dependencies of the async endpoints: an AsyncSession with ASYNC_DB,
+# otherwise a sync Session whose queries run_db moves to a worker thread.
+get_session = get_async_db if ASYNC_DB else get_db
+get_read_session = get_async_read_db if ASYNC_DB else get_read_db
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """Call fn(session, *args, **kwargs) without blocking the event loop.
+
+    For an AsyncSession fn runs against the async driver via run_sync, so
+    its ORM code is unchanged; for a sync Session it runs in a worker thread.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await anyio.to_thread.run_sync(functools.partial(fn, db, *args, **kwargs))
+
+
+async def run_primary(db, fn, *args, **kwargs):
+    """run_db, but on a short-lived primary session if db is a replica session."""
+    if not is_replica(db):
+        return await run_db(db, fn, *args, **kwargs)
+    if isinstance(db, AsyncSession):
+        async with AsyncSessionLocal() as primary:
+            return await primary.run_sync(fn, *args, **kwargs)
+
+    def call():
+        primary = SessionLocal()
+        try:
+            return fn(primary, *args, **kwargs)
+        finally:
+            primary.close()
+
+    return await anyio.to_thread.run_sync(call)
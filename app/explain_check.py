@@ -0,0 +1,120 @@
+"""Query plan regression check.
+
+Runs the hot query paths of slot_service and main against the configured
+database, captures every SELECT they issue, EXPLAINs it and fails when MySQL
+reports a full table scan (type=ALL) on a schedule or visit table.
+
+Usage (inside the app container):
+
+    python explain_check.py
+
+tests/test_query_plans.py runs the same check under pytest. The optimizer
+may still prefer scans on near-empty tables, so run it against a
+realistically sized dataset. All writes are rolled back.
+"""
+
+import logging
+import re
+import sys
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import database
+from schedule_rules import load_windows
+
+# Reference tables hold a handful of rows and are expected to be scanned.
+CHECKED_TABLES = {"doctor_schedule", "service_schedule", "visit", "slot"}
+
+
+def _scenarios(db: Session):
+    """Exercise every hot query shape once. Yields (name, callable)."""
+    from slot_service import book_visit, iter_doctor_slots, iter_service_slots, list_visits
+
+    day = date.today() + timedelta(days=1)
+    time_from = datetime.combine(day, datetime.min.time())
+    time_to = time_from + timedelta(days=14)
+    doctor_sched = next(iter(load_windows(db, "DOCTOR", day, day + timedelta(days=14))), None)
+    service_sched = next(iter(load_windows(db, "SERVICE", day, day + timedelta(days=14))), None)
+
+    yield "search doctors", lambda: list(iter_doctor_slots(db, time_from, time_to))
+    yield "search doctors by clinic/direction", lambda: list(
+        iter_doctor_slots(db, time_from, time_to, clinic_id=1, direction_id=2)
+    )
+    yield "search services", lambda: list(iter_service_slots(db, time_from, time_to, service_id=1))
+    if doctor_sched:
+        yield "book doctor visit", lambda: book_visit(
+            db, 1, "DOCTOR", doctor_sched.resource_id, None, doctor_sched.clinic_id,
+            datetime.combine(doctor_sched.work_date, doctor_sched.time_start),
+        )
+    if service_sched:
+        yield "book service visit", lambda: book_visit(
+            db, 1, "SERVICE", None, service_sched.resource_id, None,
+            datetime.combine(service_sched.work_date, service_sched.time_start),
+        )
+    yield "list patient visits", lambda: list_visits(db, datetime.now(), time_to, patient_id=1)
+
+
+def _full_scans(conn, statement: str, parameters) -> list:
+    rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).mappings().all()
+    scans = []
+    for row in rows:
+        # Joined eager loads alias tables as <name>_<n>.
+        table = re.sub(r"_\d+$", "", row["table"] or "")
+        if row["type"] == "ALL" and table in CHECKED_TABLES:
+            scans.append(row["table"])
+    return scans
+
+
+def check_plans(conn) -> Iterator[Tuple[str, int, List[Tuple[List[str], str]]]]:
+    """Run every scenario on conn inside a transaction that is rolled back.
+    Yields (scenario, queries checked, [(scanned tables, statement)])."""
+    outer = conn.begin()
+    db = Session(bind=conn, join_transaction_mode="create_savepoint")
+    try:
+        for name, run in _scenarios(db):
+            captured = []
+
+            def capture(conn_, cursor, statement, parameters, context, executemany):
+                if statement.lstrip().upper().startswith("SELECT"):
+                    captured.append((statement, parameters))
+
+            event.listen(conn, "before_cursor_execute", capture)
+            try:
+                run()
+            finally:
+                event.remove(conn, "before_cursor_execute", capture)
+
+            bad = []
+            for statement, parameters in captured:
+                scans = _full_scans(conn, statement, parameters)
+                if scans:
+                    bad.append((scans, " ".join(statement.split())))
+            yield name, len(captured), bad
+    finally:
+        db.close()
+        outer.rollback()
+
+
+def main() -> int:
+    database.init_db(max_retries=1)
+    failures = 0
+    with database.engine.connect() as conn:
+        for name, checked, bad in check_plans(conn):
+            for scans, sql in bad:
+                print(f"FAIL {name}: full scan on {', '.join(scans)}\n  {sql[:300]}")
+            failures += len(bad)
+            print(f"{'FAIL' if bad else 'ok  '} {name}: {checked} queries checked")
+
+    if failures:
+        print(f"{failures} queries fall back to full table scans.")
+        return 1
+    print("No full table scans on schedule or visit tables.")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
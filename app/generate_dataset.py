@@ -0,0 +1,302 @@
+"""Synthetic large-scale dataset generator.
+
+Replaces all clinics, directions, doctors, services, schedules, visits (and
+slot rows) in the configured database with a generated dataset of the
+requested size, e.g. 500 doctors with 90 days of schedules:
+
+    python generate_dataset.py --reset --clinics 40 --doctors 500 --services 200 \\
+        --days 90 --occupancy 0.3 --seed 42
+
+The output only depends on the arguments (including --start, default
+today), so a seed reproduces the same dataset. Rows are written with
+chunked multi-row INSERTs.
+
+Schedules are written as materialized doctor_schedule / service_schedule
+rows for the generated days. Doctors 1-10 and services 1-6 keep the demo
+weekly patterns of schedule_rules.DOCTOR_TEMPLATES / SERVICE_TEMPLATES, whose
+rules (kept in schedule_rule) continue them past the generated days; hence
+the minimum sizes. Occupancy is the share of grid slots booked by random
+patients. Restart the app afterwards (or rebuild the availability engine and
+invalidate the catalog) to pick up the new data.
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Iterable, Iterator, List
+
+from sqlalchemy import delete, insert, text
+from sqlalchemy.orm import Session
+
+import database
+from config import SLOT_TABLE
+from schedule_rules import DOCTOR_TEMPLATES, SERVICE_TEMPLATES
+from models import (
+    Clinic, Direction, Doctor, DoctorSchedule, Service, ServiceSchedule, Slot, Visit, doctor_direction,
+)
+from slot_table import materialize_slots
+
+logger = logging.getLogger("generate_dataset")
+
+# Smallest dataset that still contains every resource the schedule templates use.
+MIN_CLINICS, MIN_DOCTORS, MIN_SERVICES = 3, 10, 6
+TEMPLATE_DOCTORS = range(1, 11)
+TEMPLATE_SERVICES = range(1, 7)
+
+DISTRICTS = [
+    "Mitte", "Charlottenburg", "Pankow", "Kreuzberg", "Neukölln", "Spandau", "Steglitz",
+    "Tempelhof", "Lichtenberg", "Reinickendorf", "Treptow", "Marzahn",
+]
+STREETS = ["Friedrichstr.", "Kantstr.", "Breite Str.", "Hauptstr.", "Schloßstr.", "Karl-Marx-Str.", "Turmstr."]
+DIRECTIONS = [
+    "Therapist", "Cardiologist", "Neurologist", "Dermatologist", "Pediatrician", "ENT Specialist",
+    "Gynecologist", "Ophthalmologist", "Orthopedist", "Urologist", "Endocrinologist", "Psychiatrist",
+    "Gastroenterologist", "Pulmonologist", "Rheumatologist", "Allergist",
+]
+FIRST_NAMES = [
+    "Hans", "Anna", "Thomas", "Julia", "Michael", "Sabine", "Klaus", "Elisabeth", "Peter", "Katharina",
+    "Stefan", "Monika", "Andreas", "Petra", "Jürgen", "Ursula", "Frank", "Claudia", "Uwe", "Renate",
+    "Jens", "Birgit", "Lukas", "Lea", "Jonas", "Mia", "Felix", "Sophie", "Maximilian", "Emma",
+]
+LAST_NAMES = [
+    "Müller", "Schmidt", "Fischer", "Weber", "Wagner", "Becker", "Hoffmann", "Schröder", "Koch",
+    "Zimmermann", "Schneider", "Meyer", "Schulz", "Bauer", "Richter", "Klein", "Wolf", "Neumann",
+    "Schwarz", "Braun", "Krüger", "Hofmann", "Hartmann", "Lange", "Schmitt", "Werner", "Krause", "Lehmann",
+]
+SERVICES = [
+    "Blood Test", "Ultrasound", "MRI", "CT Scan", "X-Ray", "ECG", "Vaccination", "Allergy Test",
+    "Lung Function Test", "Hearing Test", "Eye Exam", "Bone Density Scan", "Holter Monitor", "Physiotherapy",
+]
+DURATIONS = [15, 20, 25, 30, 35, 40, 45]
+BUFFERS = [0, 5, 5, 10, 15]
+
+
+def chunked_insert(db: Session, table, rows: Iterable[dict], chunk: int) -> int:
+    """Insert rows with one multi-row INSERT per chunk. Returns the row count."""
+    total = 0
+    batch: List[dict] = []
+    started = time.monotonic()
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk:
+            db.execute(insert(table), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        db.execute(insert(table), batch)
+        total += len(batch)
+    db.commit()
+    elapsed = time.monotonic() - started
+    logger.info("%s: %s rows in %.1fs (%.0f rows/s).", getattr(table, "name", table), total, elapsed,
+                total / elapsed if elapsed else 0)
+    return total
+
+
+def reset(db: Session):
+    """Delete all reference, schedule, visit and slot rows."""
+    mysql = db.get_bind().dialect.name == "mysql"
+    tables = [Slot.__table__, Visit.__table__, DoctorSchedule.__table__, ServiceSchedule.__table__,
+              doctor_direction, Service.__table__, Doctor.__table__, Direction.__table__, Clinic.__table__]
+    if mysql:
+        db.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+    try:
+        for table in tables:
+            db.execute(text(f"TRUNCATE TABLE {table.name}") if mysql else delete(table))
+    finally:
+        if mysql:
+            db.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+    db.commit()
+
+
+class Generator:
+    def __init__(self, args):
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.start = args.start
+        self.end = args.start + timedelta(days=args.days - 1)
+        self.created_at = datetime.combine(args.start, dt_time(0, 0))
+        self.doctors = []    # (id, duration, buffer)
+        self.services = []   # (id, clinic_id, duration, buffer)
+        self.doctor_patterns = {}
+        self.service_patterns = {}
+
+    def clinics(self) -> Iterator[dict]:
+        for i in range(1, self.args.clinics + 1):
+            district = DISTRICTS[(i - 1) % len(DISTRICTS)]
+            yield {
+                "id": i,
+                "name": f"Family Health {district}" + (f" {i}" if i > len(DISTRICTS) else ""),
+                "district": district,
+                "address": f"{self.rnd.choice(STREETS)} {self.rnd.randint(1, 200)}, Berlin",
+            }
+
+    def directions(self) -> Iterator[dict]:
+        for i, name in enumerate(DIRECTIONS[:self.args.directions], 1):
+            yield {"id": i, "name": name}
+
+    def doctor_rows(self) -> Iterator[dict]:
+        for i in range(1, self.args.doctors + 1):
+            first, last = self.rnd.choice(FIRST_NAMES), self.rnd.choice(LAST_NAMES)
+            duration, buffer = self.rnd.choice(DURATIONS), self.rnd.choice(BUFFERS)
+            self.doctors.append((i, duration, buffer))
+            # Works at one clinic on 3-5 weekdays, 4-9 hours from 07:00-11:00.
+            self.doctor_patterns[i] = (
+                self.rnd.randint(1, self.args.clinics),
+                set(self.rnd.sample(range(1, 7), self.rnd.randint(3, 5))),
+                self.rnd.randint(7, 11),
+                self.rnd.randint(4, 9),
+            )
+            yield {
+                "id": i, "first_name": first, "last_name": last, "middle_name": None,
+                "bio_text": f"{last}, {first}: generated doctor profile.", "photo_path": None,
+                "duration_minutes": duration, "buffer_minutes": buffer,
+            }
+
+    def doctor_directions(self) -> Iterator[dict]:
+        for doctor_id, _, _ in self.doctors:
+            count = min(self.rnd.choice((1, 1, 1, 2, 2, 3)), self.args.directions)
+            for direction_id in sorted(self.rnd.sample(range(1, self.args.directions + 1), count)):
+                yield {"doctor_id": doctor_id, "direction_id": direction_id}
+
+    def service_rows(self) -> Iterator[dict]:
+        for i in range(1, self.args.services + 1):
+            clinic_id = self.rnd.randint(1, self.args.clinics)
+            duration, buffer = self.rnd.choice(DURATIONS), self.rnd.choice(BUFFERS)
+            self.services.append((i, clinic_id, duration, buffer))
+            self.service_patterns[i] = (
+                set(self.rnd.sample(range(1, 7), self.rnd.randint(4, 6))),
+                self.rnd.randint(7, 10),
+                self.rnd.randint(5, 10),
+            )
+            yield {
+                "id": i, "name": f"{self.rnd.choice(SERVICES)} {i}", "clinic_id": clinic_id,
+                "duration_minutes": duration, "buffer_minutes": buffer,
+            }
+
+    def _days(self) -> Iterator[date]:
+        day = self.start
+        while day <= self.end:
+            # Like the demo schedule rules, nobody works on Sundays.
+            if day.isoweekday() != 7:
+                yield day
+            day += timedelta(days=1)
+
+    def doctor_windows(self) -> Iterator[tuple]:
+        """(doctor_id, clinic_id, day, time_start, time_end)"""
+        for day in self._days():
+            for doctor_id, clinic_id, mask, t_start, t_end in DOCTOR_TEMPLATES:
+                if mask >> day.weekday() & 1 and doctor_id <= self.args.doctors:
+                    yield doctor_id, clinic_id, day, t_start, t_end
+            for doctor_id, _, _ in self.doctors:
+                if doctor_id in TEMPLATE_DOCTORS:
+                    continue
+                clinic_id, weekdays, hour, hours = self.doctor_patterns[doctor_id]
+                if day.isoweekday() in weekdays:
+                    yield doctor_id, clinic_id, day, dt_time(hour, 0), dt_time(hour + hours, 0)
+
+    def service_windows(self) -> Iterator[tuple]:
+        """(service_id, day, time_start, time_end)"""
+        for day in self._days():
+            for service_id, mask, t_start, t_end in SERVICE_TEMPLATES:
+                if mask >> day.weekday() & 1 and service_id <= self.args.services:
+                    yield service_id, day, t_start, t_end
+            for service_id, _, _, _ in self.services:
+                if service_id in TEMPLATE_SERVICES:
+                    continue
+                weekdays, hour, hours = self.service_patterns[service_id]
+                if day.isoweekday() in weekdays:
+                    yield service_id, day, dt_time(hour, 0), dt_time(hour + hours, 0)
+
+    def doctor_schedules(self) -> Iterator[dict]:
+        for doctor_id, clinic_id, day, t_start, t_end in self.doctor_windows():
+            yield {"doctor_id": doctor_id, "clinic_id": clinic_id, "work_date": day,
+                   "time_start": t_start, "time_end": t_end}
+
+    def service_schedules(self) -> Iterator[dict]:
+        for service_id, day, t_start, t_end in self.service_windows():
+            yield {"service_id": service_id, "work_date": day, "time_start": t_start, "time_end": t_end}
+
+    def _book(self, kind: str, rid: int, clinic_id: int, day: date, t_start, t_end,
+              duration: int, buffer: int) -> Iterator[dict]:
+        start = datetime.combine(day, t_start)
+        end = datetime.combine(day, t_end)
+        step = timedelta(minutes=duration + buffer)
+        while start + timedelta(minutes=duration) <= end:
+            if self.rnd.random() < self.args.occupancy:
+                yield {
+                    "patient_id": self.rnd.randint(1, self.args.patients),
+                    "visit_type": kind,
+                    "doctor_id": rid if kind == "DOCTOR" else None,
+                    "service_id": rid if kind == "SERVICE" else None,
+                    "clinic_id": clinic_id,
+                    "start_datetime": start,
+                    "duration_minutes": duration,
+                    "buffer_minutes": buffer,
+                    "created_at": self.created_at,
+                }
+            start += step
+
+    def visits(self) -> Iterator[dict]:
+        """Grid slots of every window, each booked with probability --occupancy."""
+        doctors = {d[0]: d[1:] for d in self.doctors}
+        services = {s[0]: s[1:] for s in self.services}
+        for doctor_id, clinic_id, day, t_start, t_end in self.doctor_windows():
+            yield from self._book("DOCTOR", doctor_id, clinic_id, day, t_start, t_end, *doctors[doctor_id])
+        for service_id, day, t_start, t_end in self.service_windows():
+            clinic_id, duration, buffer = services[service_id]
+            yield from self._book("SERVICE", service_id, clinic_id, day, t_start, t_end, duration, buffer)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--reset", action="store_true", help="required: existing data is deleted")
+    parser.add_argument("--clinics", type=int, default=20)
+    parser.add_argument("--directions", type=int, default=len(DIRECTIONS))
+    parser.add_argument("--doctors", type=int, default=500)
+    parser.add_argument("--services", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--occupancy", type=float, default=0.3, help="share of grid slots booked (0-1)")
+    parser.add_argument("--patients", type=int, default=50000, help="patient ids are drawn from 1..N")
+    parser.add_argument("--start", type=date.fromisoformat, default=date.today(), help="first day (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--chunk", type=int, default=5000, help="rows per INSERT")
+    args = parser.parse_args()
+
+    if not args.reset:
+        parser.error("--reset is required; the generator replaces all existing data")
+    if args.clinics < MIN_CLINICS or args.doctors < MIN_DOCTORS or args.services < MIN_SERVICES:
+        parser.error(f"need at least {MIN_CLINICS} clinics, {MIN_DOCTORS} doctors and {MIN_SERVICES} services")
+    if not 1 <= args.directions <= len(DIRECTIONS):
+        parser.error(f"--directions must be between 1 and {len(DIRECTIONS)}")
+    if not 0 <= args.occupancy <= 1:
+        parser.error("--occupancy must be between 0 and 1")
+
+    database.init_db(max_retries=1)
+    gen = Generator(args)
+    db = database.SessionLocal()
+    started = time.monotonic()
+    try:
+        reset(db)
+        chunked_insert(db, Clinic.__table__, gen.clinics(), args.chunk)
+        chunked_insert(db, Direction.__table__, gen.directions(), args.chunk)
+        chunked_insert(db, Doctor.__table__, gen.doctor_rows(), args.chunk)
+        chunked_insert(db, doctor_direction, gen.doctor_directions(), args.chunk)
+        chunked_insert(db, Service.__table__, gen.service_rows(), args.chunk)
+        chunked_insert(db, DoctorSchedule.__table__, gen.doctor_schedules(), args.chunk)
+        chunked_insert(db, ServiceSchedule.__table__, gen.service_schedules(), args.chunk)
+        chunked_insert(db, Visit.__table__, gen.visits(), args.chunk)
+        if SLOT_TABLE:
+            materialize_slots(db, gen.start, gen.end)
+            db.commit()
+    finally:
+        db.close()
+    logger.info("Dataset generated in %.1fs.", time.monotonic() - started)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    sys.exit(main())
@@ -1,24 +1,43 @@
+import itertools
 import logging
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import FastAPI, Depends, Query, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Depends, Query, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
 
-from config import APP_PORT
-from database import init_db, get_db
-from models import Clinic, Direction, Doctor, Service, Visit, doctor_direction
+import database
+from availability import availability_engine
+from catalog import Catalog, reference_catalog
+from change_feed import change_feed, record_changes
+from config import (
+    APP_PORT, ASYNC_DB, AVAILABILITY_ENGINE, QUERY_STATS, READ_YOUR_WRITES_SECONDS, REFERENCE_CACHE_CONTROL,
+    SCHEDULE_DAYS_AHEAD, SLOT_TABLE, SLOTS_CACHE_CONTROL,
+)
+from database import (
+    init_async_db, init_db, get_db, get_read_db, get_read_session, get_session, is_replica, note_write,
+    run_db, run_primary,
+)
+from models import Visit
 from schemas import (
-    SlotSearchResponse, BookVisitRequest, BookVisitResponse,
-    VisitListResponse, VisitItem, DeleteResponse, ErrorResponse,
-    ClinicItem, DirectionItem, DoctorItem, ServiceItem,
+    SlotSearchResponse, NextSlotsResponse, BookVisitRequest, BookVisitResponse,
+    VisitListResponse, DeleteResponse, ErrorResponse,
+    ClinicItem, DirectionItem, DoctorItem, ServiceItem, AvailabilityStatus, CatalogStatus,
+    SearchCacheStats, BatchBookRequest, BatchBookResponse, BatchModeEnum, ScheduleExtenderStatus,
 )
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, booking_outcomes, count_slots, registry
+from query_stats import QueryStatsMiddleware
+from responses import TrustedJSONResponse, dumps
+from schedule_extender import schedule_extender
+from search_cache import MAX_CACHED_ITEMS, search_cache, search_key
+from slot_table import release_slots
 from slot_service import (
-    search_doctor_slots, search_service_slots, book_visit, _doctor_name,
+    iter_doctor_slots_async, iter_service_slots_async, book_visit_async, list_visits_async,
+    _doctor_name, decode_cursor, paginate_slots, next_doctor_slots_async, next_service_slots_async,
+    search_resource_ids, compact_slots, book_visits_async, BATCH_ABORTED, LOCK_TIMEOUT,
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -31,6 +50,10 @@ app = FastAPI(
     openapi_url="/openapi.json",
 )
 
+if QUERY_STATS:
+    app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 templates = Jinja2Templates(directory="templates")
 
 # Mount static files for doctor photos
@@ -39,9 +62,38 @@ app.mount("/photos", StaticFiles(directory="/data/photos"), name="photos")
 app.mount("/images", StaticFiles(directory="/data/images"), name="images")
 
 
+def rebuild_availability():
+    db = database.SessionLocal()
+    try:
+        # Bookings committed from here on reach the engine through the feed.
+        change_feed.poll(db)
+        availability_engine.rebuild(db)
+    finally:
+        db.close()
+
+
+async def catch_up(db):
+    """Apply other workers' bookings before answering from process memory.
+    Reads the primary, so the engine never goes back to a lagging replica's state."""
+    if AVAILABILITY_ENGINE or search_cache.enabled:
+        await run_primary(db, change_feed.poll)
+
+
 @app.on_event("startup")
 def startup():
     init_db()
+    if ASYNC_DB:
+        init_async_db()
+    # Upgraded volumes get their schedule rules before the engine expands them.
+    schedule_extender.prepare()
+    if AVAILABILITY_ENGINE:
+        rebuild_availability()
+    schedule_extender.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    schedule_extender.stop()
 
 
 # ---------------------------------------------------------------------------
@@ -54,45 +106,86 @@ def error_response(status_code: int, error: str, message: str):
     )
 
 
+# ---------------------------------------------------------------------------
+# Conditional GET helpers
+# ---------------------------------------------------------------------------
+# Tags are derived from shared data, so every worker issues and accepts the same ones.
+def catalog_etag(catalog: Catalog) -> str:
+    return f'"catalog-{catalog.digest}"'
+
+
+def slots_etag(change: int, catalog: Catalog) -> str:
+    """Tag of slot results as of a change feed position and schedule rule fingerprint."""
+    rules = ".".join(str(n) for n in schedule_extender.rules_seen or ())
+    return f'"slots-{change}-{catalog.digest}-{rules}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {t.strip() for t in header.split(",")}
+    return "*" in tags or etag in tags or "W/" + etag in tags
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def set_cache_headers(response: Response, etag: str, cache_control: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+def catalog_not_modified(request: Request) -> Optional[Response]:
+    """304 if the client already has the current catalog; never touches the DB."""
+    catalog = reference_catalog.fresh()
+    if catalog is not None:
+        etag = catalog_etag(catalog)
+        if etag_matches(request, etag):
+            return not_modified(etag, REFERENCE_CACHE_CONTROL)
+    return None
+
+
 # ---------------------------------------------------------------------------
 # Reference data endpoints
 # ---------------------------------------------------------------------------
 @app.get("/api/v1/clinics", response_model=list[ClinicItem], tags=["Reference Data"])
-def list_clinics(db: Session = Depends(get_db)):
-    rows = db.query(Clinic).order_by(Clinic.name).all()
+def list_clinics(request: Request, response: Response, db: Session = Depends(get_read_db)):
+    unchanged = catalog_not_modified(request)
+    if unchanged:
+        return unchanged
+    catalog = reference_catalog.get(db)
+    set_cache_headers(response, catalog_etag(catalog), REFERENCE_CACHE_CONTROL)
+    rows = catalog.clinic_list
     return [ClinicItem(id=c.id, name=c.name, district=c.district, address=c.address) for c in rows]
 
 
 @app.get("/api/v1/directions", response_model=list[DirectionItem], tags=["Reference Data"])
-def list_directions(db: Session = Depends(get_db)):
-    rows = db.query(Direction).order_by(Direction.name).all()
+def list_directions(request: Request, response: Response, db: Session = Depends(get_read_db)):
+    unchanged = catalog_not_modified(request)
+    if unchanged:
+        return unchanged
+    catalog = reference_catalog.get(db)
+    set_cache_headers(response, catalog_etag(catalog), REFERENCE_CACHE_CONTROL)
+    rows = catalog.direction_list
     return [DirectionItem(id=d.id, name=d.name) for d in rows]
 
 
 @app.get("/api/v1/doctors", response_model=list[DoctorItem], tags=["Reference Data"])
 def list_doctors(
+    request: Request,
+    response: Response,
     direction_id: Optional[int] = Query(None),
     name: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    q = db.query(Doctor)
-    if direction_id:
-        q = q.filter(
-            Doctor.id.in_(
-                db.query(doctor_direction.c.doctor_id)
-                .filter(doctor_direction.c.direction_id == direction_id)
-            )
-        )
-    if name:
-        pattern = f"%{name}%"
-        q = q.filter(
-            or_(
-                Doctor.first_name.ilike(pattern),
-                Doctor.last_name.ilike(pattern),
-                Doctor.middle_name.ilike(pattern),
-            )
-        )
-    rows = q.order_by(Doctor.last_name, Doctor.first_name).all()
+    unchanged = catalog_not_modified(request)
+    if unchanged:
+        return unchanged
+    catalog = reference_catalog.get(db)
+    set_cache_headers(response, catalog_etag(catalog), REFERENCE_CACHE_CONTROL)
+    rows = catalog.match_doctors(direction_id, name)
     result = []
     for doc in rows:
         result.append(DoctorItem(
@@ -111,16 +204,18 @@ def list_doctors(
 
 @app.get("/api/v1/services", response_model=list[ServiceItem], tags=["Reference Data"])
 def list_services(
+    request: Request,
+    response: Response,
     clinic_id: Optional[int] = Query(None),
     name: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    q = db.query(Service)
-    if clinic_id:
-        q = q.filter(Service.clinic_id == clinic_id)
-    if name:
-        q = q.filter(Service.name.ilike(f"%{name}%"))
-    rows = q.order_by(Service.name).all()
+    unchanged = catalog_not_modified(request)
+    if unchanged:
+        return unchanged
+    catalog = reference_catalog.get(db)
+    set_cache_headers(response, catalog_etag(catalog), REFERENCE_CACHE_CONTROL)
+    rows = catalog.match_services(clinic_id=clinic_id, name=name)
     return [
         ServiceItem(
             id=s.id, name=s.name, clinic_id=s.clinic_id,
@@ -136,7 +231,9 @@ def list_services(
 # Slots search
 # ---------------------------------------------------------------------------
 @app.get("/api/v1/slots/search", response_model=SlotSearchResponse, tags=["Slots"])
-def api_search_slots(
+async def api_search_slots(
+    request: Request,
+    response: Response,
     patient_id: int = Query(...),
     type: str = Query(..., pattern="^(doctor|service)$"),
     time_from: str = Query(...),
@@ -147,11 +244,25 @@ def api_search_slots(
     doctor_name: Optional[str] = Query(None),
     service_id: Optional[int] = Query(None),
     include_busy: bool = Query(False),
-    db: Session = Depends(get_db),
+    stream: Optional[str] = Query(None, pattern="^ndjson$"),
+    format: Optional[str] = Query(
+        None, pattern="^compact$",
+        description=(
+            "compact: every doctor/service at a clinic once in `resources` (with duration_minutes), "
+            "then one entry per slot in the parallel arrays `resource` (index into resources) and "
+            "`start` (minutes after `base`), plus `is_free`, a base64 little-endian bitmask with "
+            "bit i set when slot i is free. Admin busy searches add `busy_patient_id`."
+        ),
+    ),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = Query(None),
+    db=Depends(get_read_session),
 ):
     is_admin = patient_id == 0
     if include_busy and not is_admin:
         return error_response(403, "forbidden", "include_busy is only available for admin.")
+    if stream and format:
+        return error_response(400, "invalid_request", "stream and format cannot be combined.")
 
     try:
         tf = datetime.fromisoformat(time_from)
@@ -159,8 +270,40 @@ def api_search_slots(
     except ValueError:
         return error_response(400, "invalid_request", "Invalid datetime format. Use ISO 8601.")
 
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            return error_response(400, "invalid_request", "Invalid cursor.")
+        # Nothing before the cursor's slot start needs to be generated again.
+        tf = max(tf, datetime.fromisoformat(after[0]))
+
+    await catch_up(db)
+    key = search_key(
+        type, tf, tt, district, clinic_id, direction_id, doctor_name, service_id,
+        include_busy and is_admin, limit, after,
+    )
+    cached = search_cache.get(key) if search_cache.enabled else None
+    if cached is not None:
+        page, next_cursor, etag = cached
+        if etag_matches(request, etag):
+            return not_modified(etag, SLOTS_CACHE_CONTROL)
+        set_cache_headers(response, etag, SLOTS_CACHE_CONTROL)
+        return _slots_response(iter(page), next_cursor, stream, format, include_busy and is_admin, response)
+
+    # Without a cache entry a tag is only known to be current if nothing changed since.
+    version = search_cache.version
+    etag = slots_etag(version.change, await run_db(db, reference_catalog.get))
+    if etag_matches(request, etag):
+        return not_modified(etag, SLOTS_CACHE_CONTROL)
+    # A replica result right after a change may predate it; it gets no tag and is not cached.
+    current = not (is_replica(db) and change_feed.recent_change(READ_YOUR_WRITES_SECONDS))
+    if current:
+        set_cache_headers(response, etag, SLOTS_CACHE_CONTROL)
+    else:
+        response.headers["Cache-Control"] = SLOTS_CACHE_CONTROL
     if type == "doctor":
-        items = search_doctor_slots(
+        items = await iter_doctor_slots_async(
             db, tf, tt,
             district=district,
             clinic_id=clinic_id,
@@ -168,28 +311,115 @@ def api_search_slots(
             doctor_name=doctor_name,
             include_busy=include_busy,
             is_admin=is_admin,
+            limit=limit,
         )
     else:
-        items = search_service_slots(
+        items = await iter_service_slots_async(
             db, tf, tt,
             district=district,
             clinic_id=clinic_id,
             service_id=service_id,
             include_busy=include_busy,
             is_admin=is_admin,
+            limit=limit,
+        )
+
+    items, next_cursor = paginate_slots(count_slots(items, type), limit, after)
+
+    if search_cache.enabled and current:
+        page = list(itertools.islice(items, MAX_CACHED_ITEMS + 1))
+        if len(page) <= MAX_CACHED_ITEMS:
+            resource_ids = await run_db(
+                db, search_resource_ids, type, district, clinic_id, direction_id, doctor_name, service_id,
+            )
+            search_cache.put(
+                key, (page, next_cursor, etag), type.upper(), resource_ids, tf.date(), tt.date(), version,
+            )
+        items = itertools.chain(page, items)
+
+    return _slots_response(items, next_cursor, stream, format, include_busy and is_admin, response)
+
+
+def _slots_response(items, next_cursor: Optional[str], stream: Optional[str], format: Optional[str],
+                    with_busy: bool, response: Response):
+    if format == "compact":
+        content = compact_slots(items, with_busy)
+        content["next_cursor"] = next_cursor
+        return TrustedJSONResponse(content, headers=dict(response.headers))
+    if stream == "ndjson":
+        # One SlotItem per line, written as the merge produces them.
+        headers = dict(response.headers)
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return StreamingResponse(
+            (dumps(item) + b"\n" for item in items),
+            media_type="application/x-ndjson",
+            headers=headers,
+        )
+    return TrustedJSONResponse({"items": list(items), "next_cursor": next_cursor}, headers=dict(response.headers))
+
+
+@app.get("/api/v1/slots/next", response_model=NextSlotsResponse, tags=["Slots"])
+async def api_next_slots(
+    patient_id: int = Query(...),
+    type: Optional[str] = Query(None, pattern="^(doctor|service)$"),
+    time_from: Optional[str] = Query(None),
+    days: int = Query(SCHEDULE_DAYS_AHEAD, ge=1, le=366),
+    district: Optional[str] = Query(None),
+    clinic_id: Optional[int] = Query(None),
+    direction_id: Optional[int] = Query(None),
+    doctor_id: Optional[int] = Query(None),
+    service_id: Optional[int] = Query(None),
+    db=Depends(get_read_session),
+):
+    """Earliest free slot per matching doctor or service within `days` from time_from."""
+    if type is None:
+        type = "service" if service_id else "doctor"
+
+    try:
+        tf = datetime.fromisoformat(time_from) if time_from else datetime.now().replace(microsecond=0)
+    except ValueError:
+        return error_response(400, "invalid_request", "Invalid datetime format. Use ISO 8601.")
+    tt = datetime.combine(tf.date() + timedelta(days=days), datetime.min.time())
+
+    await catch_up(db)
+    if type == "doctor":
+        items = await next_doctor_slots_async(
+            db, tf, tt,
+            district=district,
+            clinic_id=clinic_id,
+            direction_id=direction_id,
+            doctor_id=doctor_id,
+        )
+    else:
+        items = await next_service_slots_async(
+            db, tf, tt,
+            district=district,
+            clinic_id=clinic_id,
+            service_id=service_id,
         )
 
-    return {"items": items}
+    return TrustedJSONResponse({"items": items})
 
 
 # ---------------------------------------------------------------------------
 # Visits
 # ---------------------------------------------------------------------------
+BOOKING_ERROR_CODES = {
+    "invalid_request": 400,
+    "not_found": 404,
+    "slot_busy": 409,
+    "not_in_schedule": 409,
+    BATCH_ABORTED: 424,
+    LOCK_TIMEOUT: 503,
+}
+
+
 @app.post("/api/v1/visits", response_model=BookVisitResponse, tags=["Visits"])
-def api_book_visit(
+async def api_book_visit(
     body: BookVisitRequest,
     patient_id: int = Query(...),
-    db: Session = Depends(get_db),
+    db=Depends(get_session),
 ):
     if patient_id <= 0:
         return error_response(400, "invalid_request", "patient_id must be > 0 for booking.")
@@ -199,7 +429,7 @@ def api_book_visit(
     except ValueError:
         return error_response(400, "invalid_request", "Invalid datetime format.")
 
-    visit_id, err = book_visit(
+    visit_id, err = await book_visit_async(
         db,
         patient_id=patient_id,
         visit_type=body.visit_type.value,
@@ -208,25 +438,66 @@ def api_book_visit(
         clinic_id=body.clinic_id,
         start=start_dt,
     )
+    booking_outcomes.inc(outcome=err or "booked")
     if err:
-        code_map = {
-            "invalid_request": 400,
-            "not_found": 404,
-            "slot_busy": 409,
-            "not_in_schedule": 409,
-        }
-        return error_response(code_map.get(err, 500), err, f"Booking failed: {err}")
+        return error_response(BOOKING_ERROR_CODES.get(err, 500), err, f"Booking failed: {err}")
+    note_write(patient_id)
 
     return {"visit_id": visit_id, "status": "booked"}
 
 
+@app.post("/api/v1/visits/batch", response_model=BatchBookResponse, tags=["Visits"])
+async def api_book_visits(
+    body: BatchBookRequest,
+    patient_id: int = Query(...),
+    db=Depends(get_session),
+):
+    """Book several visits for one patient in one request.
+
+    all_or_nothing books every item or none; best_effort books what it can.
+    Each item reports the status code its single booking would have had.
+    """
+    if patient_id <= 0:
+        return error_response(400, "invalid_request", "patient_id must be > 0 for booking.")
+
+    items = []
+    for item in body.items:
+        try:
+            start_dt = datetime.fromisoformat(item.start)
+        except ValueError:
+            start_dt = None
+        items.append({
+            "visit_type": item.visit_type.value,
+            "doctor_id": item.doctor_id,
+            "service_id": item.service_id,
+            "clinic_id": item.clinic_id,
+            "start": start_dt,
+        })
+
+    results = await book_visits_async(
+        db, patient_id=patient_id, items=items, atomic=body.mode == BatchModeEnum.ALL_OR_NOTHING,
+    )
+    out = []
+    for index, (visit_id, err) in enumerate(results):
+        booking_outcomes.inc(outcome=err or "booked")
+        if err:
+            out.append({"index": index, "status_code": BOOKING_ERROR_CODES.get(err, 500), "visit_id": None, "error": err})
+        else:
+            out.append({"index": index, "status_code": 200, "visit_id": visit_id, "error": None})
+    booked = sum(1 for r in out if r["error"] is None)
+    if booked:
+        note_write(patient_id)
+    status = "booked" if booked == len(out) else "partial" if booked else "failed"
+    return {"status": status, "items": out}
+
+
 @app.get("/api/v1/visits", response_model=VisitListResponse, tags=["Visits"])
-def api_list_visits(
+async def api_list_visits(
     patient_id: int = Query(...),
     time_from: Optional[str] = Query(None),
     time_to: Optional[str] = Query(None),
     scope: str = Query("mine"),
-    db: Session = Depends(get_db),
+    db=Depends(get_read_session),
 ):
     is_admin = patient_id == 0
 
@@ -240,14 +511,7 @@ def api_list_visits(
     except ValueError:
         return error_response(400, "invalid_request", "Invalid datetime format.")
 
-    q = db.query(Visit).filter(
-        Visit.start_datetime >= tf,
-        Visit.start_datetime <= tt,
-    )
-    if scope != "all":
-        q = q.filter(Visit.patient_id == patient_id)
-
-    visits = q.order_by(Visit.start_datetime).all()
+    visits = await list_visits_async(db, tf, tt, None if scope == "all" else patient_id)
 
     items = []
     for v in visits:
@@ -262,7 +526,7 @@ def api_list_visits(
         if v.service:
             svc_name = v.service.name
         end_dt = v.start_datetime + timedelta(minutes=v.duration_minutes)
-        items.append(VisitItem(
+        items.append(dict(
             visit_id=v.id,
             patient_id=v.patient_id,
             visit_type=v.visit_type,
@@ -278,7 +542,7 @@ def api_list_visits(
             end=end_dt.strftime("%Y-%m-%dT%H:%M:%S"),
         ))
 
-    return {"items": items}
+    return TrustedJSONResponse({"items": items})
 
 
 @app.delete("/api/v1/visits/{visit_id}", response_model=DeleteResponse, tags=["Visits"])
@@ -295,11 +559,67 @@ def api_cancel_visit(
     if not is_admin and visit.patient_id != patient_id:
         return error_response(403, "forbidden", "You can only cancel your own visits.")
 
+    resource_id = visit.doctor_id if visit.visit_type == "DOCTOR" else visit.service_id
+    visit_type, start, owner = visit.visit_type, visit.start_datetime, visit.patient_id
+    if SLOT_TABLE:
+        release_slots(db, visit_id)
     db.delete(visit)
+    record_changes(db, [(visit_type, resource_id, start.date())])
     db.commit()
+    note_write(owner)
+    availability_engine.remove_visit(visit_type, resource_id, start, visit_id)
     return {"status": "deleted"}
 
 
+# ---------------------------------------------------------------------------
+# Admin
+# ---------------------------------------------------------------------------
+@app.post("/api/v1/admin/availability/rebuild", response_model=AvailabilityStatus, tags=["Admin"])
+def api_rebuild_availability(patient_id: int = Query(...)):
+    if patient_id != 0:
+        return error_response(403, "forbidden", "Only admin can rebuild availability.")
+    if not AVAILABILITY_ENGINE:
+        return error_response(409, "disabled", "Availability engine is disabled.")
+    rebuild_availability()
+    search_cache.clear()
+    return availability_engine.status()
+
+
+@app.get("/api/v1/admin/schedules/extender", response_model=ScheduleExtenderStatus, tags=["Admin"])
+def api_schedule_extender_status(patient_id: int = Query(...)):
+    if patient_id != 0:
+        return error_response(403, "forbidden", "Only admin can read the schedule extender status.")
+    return schedule_extender.status()
+
+
+@app.post("/api/v1/admin/schedules/extend", response_model=ScheduleExtenderStatus, tags=["Admin"])
+def api_extend_schedules(patient_id: int = Query(...)):
+    if patient_id != 0:
+        return error_response(403, "forbidden", "Only admin can extend schedules.")
+    schedule_extender.run_once()
+    return schedule_extender.status()
+
+
+@app.post("/api/v1/admin/catalog/invalidate", response_model=CatalogStatus, tags=["Admin"])
+def api_invalidate_catalog(patient_id: int = Query(...), db: Session = Depends(get_db)):
+    if patient_id != 0:
+        return error_response(403, "forbidden", "Only admin can invalidate the catalog.")
+    return {"version": reference_catalog.invalidate(db)}
+
+
+@app.get("/api/v1/admin/search-cache", response_model=SearchCacheStats, tags=["Admin"])
+def api_search_cache_stats(patient_id: int = Query(...)):
+    if patient_id != 0:
+        return error_response(403, "forbidden", "Only admin can read cache stats.")
+    return search_cache.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 # ---------------------------------------------------------------------------
 # Web UI pages
 # ---------------------------------------------------------------------------
@@ -309,17 +629,14 @@ def page_index(request: Request):
 
 
 @app.get("/search", response_class=HTMLResponse, include_in_schema=False)
-def page_search(request: Request, db: Session = Depends(get_db)):
-    clinics = db.query(Clinic).order_by(Clinic.name).all()
-    directions = db.query(Direction).order_by(Direction.name).all()
-    services = db.query(Service).order_by(Service.name).all()
-    districts = sorted(set(c.district for c in clinics))
+def page_search(request: Request, db: Session = Depends(get_read_db)):
+    catalog = reference_catalog.get(db)
     return templates.TemplateResponse("search.html", {
         "request": request,
-        "clinics": clinics,
-        "directions": directions,
-        "services": services,
-        "districts": districts,
+        "clinics": catalog.clinic_list,
+        "directions": catalog.direction_list,
+        "services": catalog.service_list,
+        "districts": catalog.districts,
     })
 
 
@@ -329,11 +646,10 @@ def page_visits(request: Request):
 
 
 @app.get("/doctors", response_class=HTMLResponse, include_in_schema=False)
-def page_doctors(request: Request, db: Session = Depends(get_db)):
-    doctors = db.query(Doctor).order_by(Doctor.last_name, Doctor.first_name).all()
+def page_doctors(request: Request, db: Session = Depends(get_read_db)):
     return templates.TemplateResponse("doctors.html", {
         "request": request,
-        "doctors": doctors,
+        "doctors": reference_catalog.get(db).doctor_list,
     })
 
 
@@ -0,0 +1,260 @@
+"""Prometheus metrics without a client library.
+
+Counters, gauges and histograms are kept in process memory and rendered in
+the Prometheus text exposition format (0.0.4) by ``GET /metrics``.
+``MetricsMiddleware`` records request latency per route template and
+status plus the number of in-flight requests; the DB pools, slot search and
+booking code report through the module-level metrics below. Like the other
+in-process state, values are per worker.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+import math
+import threading
+import time
+
+from sqlalchemy.pool import Pool
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time from callbacks registered with track()."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callbacks: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def track(self, callback: Callable[[], float], **labels):
+        with self._lock:
+            self._callbacks[self._key(labels)] = callback
+
+    def samples(self):
+        values = dict(self._values)
+        for key, callback in self._callbacks.items():
+            values[key] = callback()
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> ([count per bucket], sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            counts[i] += 1
+            total[0] += value
+
+    def samples(self):
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total[0])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status.",
+    ("method", "route", "status"),
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.",
+))
+db_pool_checked_out = registry.register(Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool.", ("engine",),
+))
+db_pool_overflow = registry.register(Gauge(
+    "db_pool_overflow", "Connections open beyond pool_size.", ("engine",),
+))
+db_pool_size = registry.register(Gauge(
+    "db_pool_size", "Configured pool size.", ("engine",),
+))
+db_pool_wait = registry.register(Histogram(
+    "db_pool_wait_seconds", "Time to get a connection from the pool, including connecting.", ("engine",),
+))
+slot_search_slots = registry.register(Histogram(
+    "slot_search_slots", "Slots generated per computed (not cached) slot search.", ("type",),
+    buckets=COUNT_BUCKETS,
+))
+booking_outcomes = registry.register(Counter(
+    "booking_outcomes_total", "Booking attempts by outcome (booked or error code).", ("outcome",),
+))
+schedule_extender_runs = registry.register(Counter(
+    "schedule_extender_runs_total", "Schedule extender runs by result.", ("result",),
+))
+schedule_extender_duration = registry.register(Histogram(
+    "schedule_extender_duration_seconds", "Duration of schedule extender runs.",
+    buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+))
+schedule_extender_last_run = registry.register(Gauge(
+    "schedule_extender_last_run_timestamp_seconds", "Unix time the last schedule extender run finished.",
+))
+
+
+def watch_pool(engine_name: str, pool: Pool):
+    """Report the pool's checked-out, overflow and size gauges at scrape time."""
+    db_pool_checked_out.track(pool.checkedout, engine=engine_name)
+    # overflow() counts up from -pool_size while the pool is still filling.
+    db_pool_overflow.track(lambda: max(pool.overflow(), 0), engine=engine_name)
+    db_pool_size.track(pool.size, engine=engine_name)
+
+
+def timed_pool(base: type, engine_name: str) -> type:
+    """Subclass of pool class base that records db_pool_wait_seconds on every checkout."""
+
+    class TimedPool(base):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                db_pool_wait.observe(time.perf_counter() - started, engine=engine_name)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def count_slots(items: Iterable[dict], slot_type: str) -> Iterator[dict]:
+    """Pass items through and observe how many were consumed once the iterator ends."""
+    n = 0
+    try:
+        for item in items:
+            n += 1
+            yield item
+    finally:
+        slot_search_slots.observe(n, type=slot_type)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency (until the last body chunk) per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            # The router stores the matched route in the scope and mounts set
+            # root_path; other paths share one label so arbitrary URLs cannot
+            # grow the series count.
+            route = getattr(scope.get("route"), "path", None) or scope.get("root_path") or "unmatched"
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                method=scope["method"], route=route, status=str(status[0]),
+            )
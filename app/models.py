@@ -1,6 +1,6 @@
 from sqlalchemy import (
     BigInteger, Column, Integer, String, Text, Date, Time, DateTime, Enum, ForeignKey,
-    Table
+    Index, Table, UniqueConstraint
 )
 from sqlalchemy.orm import relationship, declarative_base
 
@@ -55,6 +55,13 @@ class Service(Base):
 
 class DoctorSchedule(Base):
     __tablename__ = "doctor_schedule"
+    __table_args__ = (
+        Index("idx_doctor_schedule_date", "work_date", "clinic_id", "doctor_id"),
+        Index("idx_doctor_schedule_doctor_date", "doctor_id", "work_date"),
+        UniqueConstraint(
+            "doctor_id", "work_date", "clinic_id", "time_start", "time_end", name="uq_doctor_schedule_window",
+        ),
+    )
     id = Column(Integer, primary_key=True)
     doctor_id = Column(Integer, ForeignKey("doctor.id"), nullable=False)
     clinic_id = Column(Integer, ForeignKey("clinic.id"), nullable=False)
@@ -68,6 +75,11 @@ class DoctorSchedule(Base):
 
 class ServiceSchedule(Base):
     __tablename__ = "service_schedule"
+    __table_args__ = (
+        Index("idx_service_schedule_date", "work_date", "service_id"),
+        Index("idx_service_schedule_service_date", "service_id", "work_date"),
+        UniqueConstraint("service_id", "work_date", "time_start", "time_end", name="uq_service_schedule_window"),
+    )
     id = Column(Integer, primary_key=True)
     service_id = Column(Integer, ForeignKey("service.id"), nullable=False)
     work_date = Column(Date, nullable=False)
@@ -77,8 +89,41 @@ class ServiceSchedule(Base):
     service = relationship("Service", lazy="joined")
 
 
+class ScheduleRule(Base):
+    """Weekly recurring schedule window of a doctor (at a clinic) or a service."""
+    __tablename__ = "schedule_rule"
+    __table_args__ = (
+        Index("idx_schedule_rule_resource", "resource_type", "resource_id"),
+    )
+    id = Column(Integer, primary_key=True)
+    resource_type = Column(Enum("DOCTOR", "SERVICE"), nullable=False)
+    resource_id = Column(Integer, nullable=False)
+    # Doctor rules only; services work at their own clinic.
+    clinic_id = Column(Integer, ForeignKey("clinic.id"))
+    # Bit 0 = Monday ... bit 6 = Sunday.
+    weekday_mask = Column(Integer, nullable=False)
+    time_start = Column(Time, nullable=False)
+    time_end = Column(Time, nullable=False)
+    valid_from = Column(Date, nullable=False)
+    # Inclusive; NULL = open-ended.
+    valid_to = Column(Date)
+
+
+class ScheduleRuleException(Base):
+    """Date on which a schedule rule does not apply."""
+    __tablename__ = "schedule_rule_exception"
+    rule_id = Column(Integer, ForeignKey("schedule_rule.id"), primary_key=True)
+    exception_date = Column(Date, primary_key=True)
+
+
 class Visit(Base):
     __tablename__ = "visit"
+    __table_args__ = (
+        Index("idx_visit_doctor_start", "visit_type", "doctor_id", "start_datetime"),
+        Index("idx_visit_service_start", "visit_type", "service_id", "start_datetime"),
+        Index("idx_visit_patient_start", "patient_id", "start_datetime"),
+        Index("idx_visit_start", "start_datetime"),
+    )
     id = Column(Integer, primary_key=True)
     patient_id = Column(BigInteger, nullable=False)
     visit_type = Column(Enum("DOCTOR", "SERVICE"), nullable=False)
@@ -93,3 +138,34 @@ class Visit(Base):
     doctor = relationship("Doctor", lazy="joined")
     service = relationship("Service", lazy="joined")
     clinic = relationship("Clinic", lazy="joined")
+
+
+class Slot(Base):
+    """Materialized grid slot, only filled when SLOT_TABLE is enabled."""
+    __tablename__ = "slot"
+    __table_args__ = (
+        UniqueConstraint("resource_type", "resource_id", "start_datetime", name="uq_slot_resource_start"),
+        Index("idx_slot_search", "resource_type", "state", "start_datetime"),
+        Index("idx_slot_visit", "visit_id"),
+    )
+    id = Column(Integer, primary_key=True)
+    resource_type = Column(Enum("DOCTOR", "SERVICE"), nullable=False)
+    resource_id = Column(Integer, nullable=False)
+    clinic_id = Column(Integer, ForeignKey("clinic.id"), nullable=False)
+    start_datetime = Column(DateTime, nullable=False)
+    end_datetime = Column(DateTime, nullable=False)
+    state = Column(Enum("FREE", "BUSY"), nullable=False, default="FREE")
+    visit_id = Column(Integer)
+
+
+class ResourceDayChange(Base):
+    """Booking or cancellation on a doctor or service day, for other workers to catch up on."""
+    __tablename__ = "resource_day_change"
+    __table_args__ = (
+        Index("idx_resource_day_change_created", "created_at"),
+    )
+    id = Column(Integer, primary_key=True)
+    resource_type = Column(Enum("DOCTOR", "SERVICE"), nullable=False)
+    resource_id = Column(Integer, nullable=False)
+    work_date = Column(Date, nullable=False)
+    created_at = Column(DateTime, nullable=False)
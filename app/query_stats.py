@@ -0,0 +1,129 @@
+"""Per-request SQL statistics.
+
+Engine event hooks time every statement. Inside an HTTP request (tracked by
+``QueryStatsMiddleware`` through a context variable, which follows the
+request into ``run_db`` worker threads and ``run_sync`` greenlets) they add
+up the statement count and DB time, which the response carries as
+``X-DB-Queries`` and ``Server-Timing: db;dur=...`` headers, and count
+statement shapes: a shape that runs more than ``N_PLUS_ONE_THRESHOLD``
+times in one request is logged as a likely N+1 pattern. Statements slower
+than ``SLOW_QUERY_MS`` are logged whether or not a request is active.
+Statements that raise (e.g. the IntegrityError of a lost booking race) are
+counted and timed like the others.
+
+Headers are written when the response starts, so statements issued while a
+streaming body is produced are logged but not counted in them.
+"""
+
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+import logging
+import re
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import N_PLUS_ONE_THRESHOLD, SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("slow_query")
+
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:%s|\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:%s|\?|%\(\w+\)s|:\w+)\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Statement with whitespace collapsed and IN lists of any length folded to (...)."""
+    return _PLACEHOLDER_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "shapes", "_lock")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.shapes: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, statement: str, seconds: float):
+        shape = statement_shape(statement)
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+            self.shapes[shape] += 1
+
+    def repeated(self, threshold: int):
+        """(shape, count) of every statement shape that ran more than threshold times."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, so a statement that fails before
+    # after_cursor_execute leaves nothing behind on the pooled connection.
+    context.query_started = time.perf_counter()
+
+
+def _record(statement: str, elapsed: float, failed: bool = False):
+    stats = _current.get()
+    if stats is not None:
+        stats.add(statement, elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_logger.warning(
+            "%.1f ms%s: %s", elapsed * 1000, " (failed)" if failed else "", _WHITESPACE.sub(" ", statement)[:1000],
+        )
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record(statement, time.perf_counter() - context.query_started)
+
+
+def _handle_error(exception_context):
+    started = getattr(exception_context.execution_context, "query_started", None)
+    if started is not None and exception_context.statement is not None:
+        _record(exception_context.statement, time.perf_counter() - started, failed=True)
+
+
+def install(engine: Engine):
+    """Time the statements of engine (for an AsyncEngine pass its sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware collecting RequestStats for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.queries).encode()))
+                headers.append((b"server-timing", f"db;dur={stats.db_seconds * 1000:.1f}".encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            for shape, count in stats.repeated(N_PLUS_ONE_THRESHOLD):
+                logger.warning(
+                    "Possible N+1: %s %s ran the same statement %s times: %s",
+                    scope["method"], scope["path"], count, shape[:300],
+                )
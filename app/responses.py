@@ -0,0 +1,32 @@
+"""Response classes for large payloads the app builds itself."""
+
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class TrustedJSONResponse(Response):
+    """JSON response for slot and visit dicts built by slot_service.
+
+    Returning it from an endpoint skips FastAPI's response_model validation
+    and jsonable_encoder pass, which dominate large responses; the route's
+    response_model still defines the OpenAPI schema. Serialized with orjson
+    when it is installed.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,214 @@
+"""Background schedule horizon maintenance.
+
+``database.ensure_future_schedules`` seeds the demo rules into an empty
+schedule rule table and, with SLOT_TABLE, materializes the slots of the next
+SCHEDULE_DAYS_AHEAD days. ``ScheduleExtender`` runs it on a daemon thread,
+once right after startup and then every SCHEDULE_EXTEND_INTERVAL seconds, so
+startup does not wait for it and a long-running process keeps its horizon.
+
+Across workers a MySQL named lock taken without waiting (``GET_LOCK`` with
+timeout 0, on a dedicated connection) elects the worker that does the DB
+work (including pruning old change_feed rows); the others skip that run. The
+lock goes away with its connection, so a crashed leader never blocks the next
+run. Every worker first polls the change feed, then compares the schedule
+rule fingerprint with the one it last saw: when the rules changed (on any
+worker) or its horizon has become short it rebuilds its own availability
+engine, and it clears its search cache when anything changed. ``prepare()``
+seeds the rules on startup, before the engine is first built.
+
+``status()`` (admin endpoint) reports the current phase and the last run's
+timing and changes; the schedule_extender_* metrics carry the same timing.
+"""
+
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Iterator, Optional
+import logging
+import threading
+import time
+
+from sqlalchemy import text
+
+import database
+from availability import availability_engine
+from change_feed import change_feed, prune_changes
+from config import AVAILABILITY_ENGINE, SCHEDULE_DAYS_AHEAD, SCHEDULE_EXTEND_INTERVAL
+from metrics import schedule_extender_duration, schedule_extender_last_run, schedule_extender_runs
+from schedule_rules import rules_fingerprint
+from search_cache import search_cache
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK = "fh:schedule_extender"
+
+# Results of a run.
+EXTENDED = "extended"
+UNCHANGED = "unchanged"
+NOT_LEADER = "not_leader"
+FAILED = "failed"
+
+
+@contextmanager
+def leader_lock(bind) -> Iterator[bool]:
+    """Yield True if this worker got the extender lock, False if another worker holds it.
+    Without MySQL there is nobody to coordinate with and the lock is always granted."""
+    if bind.dialect.name != "mysql":
+        yield True
+        return
+    with bind.connect() as conn:
+        got = conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": LEADER_LOCK}).scalar()
+        if got != 1:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LEADER_LOCK})
+
+
+def _horizon_short() -> bool:
+    engine_to = availability_engine.loaded_to
+    return engine_to is not None and engine_to < date.today() + timedelta(days=SCHEDULE_DAYS_AHEAD)
+
+
+class ScheduleExtender:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.phase = "idle"
+        self.runs = 0
+        self.last_result: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.last_started_at: Optional[datetime] = None
+        self.last_finished_at: Optional[datetime] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_changes: dict = {}
+        # rules_fingerprint() as of the engine build and search cache
+        self.rules_seen: Optional[tuple] = None
+
+    def prepare(self):
+        """Seed the schedule rules of an empty table and note their fingerprint.
+        Call on startup before the availability engine is first built."""
+        database.seed_schedule_rules()
+        self.rules_seen = self._rules_fingerprint()
+
+    def _rules_fingerprint(self) -> tuple:
+        db = database.SessionLocal()
+        try:
+            return rules_fingerprint(db)
+        finally:
+            db.close()
+
+    def start(self):
+        """Start the background thread; its first run begins immediately."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="schedule-extender", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_once()
+            if self.interval <= 0 or self._stop.wait(self.interval):
+                return
+
+    def run_once(self) -> str:
+        """Run one extension now (waiting for a run in progress) and return its result."""
+        with self._run_lock:
+            started = time.perf_counter()
+            self.last_started_at = datetime.now()
+            self.last_error = None
+            self.last_changes = {}
+            try:
+                result = self._run()
+            except Exception as e:
+                logger.exception("Schedule extension failed.")
+                self.last_error = f"{type(e).__name__}: {e}"
+                result = FAILED
+            finally:
+                self.phase = "idle"
+            elapsed = time.perf_counter() - started
+            self.runs += 1
+            self.last_result = result
+            self.last_finished_at = datetime.now()
+            self.last_duration_ms = elapsed * 1000
+            schedule_extender_runs.inc(result=result)
+            schedule_extender_duration.observe(elapsed)
+            schedule_extender_last_run.set(time.time())
+            logger.info("Schedule extension %s in %.1f ms %s.", result, self.last_duration_ms, self.last_changes)
+            return result
+
+    def _run(self) -> str:
+        self.phase = "catching up"
+        db = database.SessionLocal()
+        try:
+            # Workers that serve no searches still follow the change feed
+            # once per run, well within its retention.
+            change_feed.poll(db)
+        finally:
+            db.close()
+
+        self.phase = "electing"
+        with leader_lock(database.engine) as leader:
+            if leader:
+                self.phase = "extending"
+                self.last_changes.update(database.ensure_future_schedules())
+                db = database.SessionLocal()
+                try:
+                    self.last_changes["changes_pruned"] = prune_changes(db)
+                finally:
+                    db.close()
+        changed = any(self.last_changes.get(k) for k in ("slots_materialized", "slots_removed"))
+
+        # Rules may have been changed by the leader, an admin or another worker.
+        fingerprint = self._rules_fingerprint()
+        rules_changed = fingerprint != self.rules_seen
+        self.rules_seen = fingerprint
+        if rules_changed:
+            self.last_changes["rules_changed"] = True
+            changed = True
+
+        if AVAILABILITY_ENGINE and (rules_changed or _horizon_short()):
+            self.phase = "rebuilding engine"
+            db = database.SessionLocal()
+            try:
+                availability_engine.rebuild(db)
+            finally:
+                db.close()
+            self.last_changes["engine_rebuilt"] = True
+            changed = True
+        if changed:
+            search_cache.clear()
+
+        if not leader:
+            return NOT_LEADER
+        return EXTENDED if changed else UNCHANGED
+
+    def status(self) -> dict:
+        def stamp(value: Optional[datetime]) -> Optional[str]:
+            return value.strftime("%Y-%m-%dT%H:%M:%S") if value else None
+
+        return {
+            "running": self._thread is not None,
+            "interval_s": self.interval,
+            "phase": self.phase,
+            "runs": self.runs,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+            "last_started_at": stamp(self.last_started_at),
+            "last_finished_at": stamp(self.last_finished_at),
+            "last_duration_ms": round(self.last_duration_ms, 1) if self.last_duration_ms is not None else None,
+            "last_changes": self.last_changes,
+        }
+
+
+schedule_extender = ScheduleExtender(SCHEDULE_EXTEND_INTERVAL)
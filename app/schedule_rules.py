@@ -0,0 +1,177 @@
+"""Recurring schedule rules, expanded for the requested dates only.
+
+A ``schedule_rule`` row describes one weekly window of a doctor (at a
+clinic) or a service: the weekdays it applies to (bit mask, Monday = bit 0),
+the time window, a validity range and exception dates
+(``schedule_rule_exception``). ``load_windows`` turns the rules into concrete
+windows for just the date range a search or booking asks about, so looking
+further ahead costs nothing to store.
+
+Rows of ``doctor_schedule`` / ``service_schedule`` stay as materialized
+overrides: when a resource has any row on a day, that day's rule windows are
+ignored for it and the rows apply instead. A day off is an exception date
+without rows; changed hours are an exception date plus rows, or just rows.
+"""
+
+from datetime import date, time as dt_time, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import DoctorSchedule, ScheduleRule, ScheduleRuleException, ServiceSchedule
+
+
+class Window(NamedTuple):
+    """One schedule window; clinic_id is None for services."""
+    resource_id: int
+    clinic_id: Optional[int]
+    work_date: date
+    time_start: dt_time
+    time_end: dt_time
+
+
+def weekday_mask(*isoweekdays: int) -> int:
+    """Mask of ISO weekdays (1 = Monday ... 7 = Sunday)."""
+    mask = 0
+    for day in isoweekdays:
+        mask |= 1 << (day - 1)
+    return mask
+
+
+MON_SAT = weekday_mask(1, 2, 3, 4, 5, 6)
+MON_FRI = weekday_mask(1, 2, 3, 4, 5)
+MON_WED_FRI = weekday_mask(1, 3, 5)
+TUE_THU = weekday_mask(2, 4)
+
+# Demo weekly patterns: (doctor_id, clinic_id, weekday_mask, time_start, time_end)
+# and (service_id, weekday_mask, time_start, time_end).
+DOCTOR_TEMPLATES = [
+    (1, 1, MON_SAT, dt_time(9, 0), dt_time(17, 0)),
+    (2, 1, MON_FRI, dt_time(10, 0), dt_time(18, 0)),
+    (3, 2, MON_FRI, dt_time(8, 0), dt_time(16, 0)),
+    (4, 3, MON_FRI, dt_time(9, 0), dt_time(15, 0)),
+    (5, 1, MON_WED_FRI, dt_time(10, 0), dt_time(14, 0)),
+    (6, 3, MON_SAT, dt_time(8, 0), dt_time(14, 0)),
+    (7, 2, TUE_THU, dt_time(9, 0), dt_time(17, 0)),
+    (8, 2, MON_FRI, dt_time(8, 0), dt_time(16, 0)),
+    (9, 1, MON_FRI, dt_time(11, 0), dt_time(19, 0)),
+    (10, 3, MON_WED_FRI, dt_time(9, 0), dt_time(15, 0)),
+]
+SERVICE_TEMPLATES = [
+    (1, MON_SAT, dt_time(7, 0), dt_time(12, 0)),
+    (2, MON_FRI, dt_time(8, 0), dt_time(17, 0)),
+    (3, MON_FRI, dt_time(8, 0), dt_time(20, 0)),
+    (4, MON_FRI, dt_time(8, 0), dt_time(18, 0)),
+    (5, MON_SAT, dt_time(8, 0), dt_time(16, 0)),
+    (6, MON_FRI, dt_time(9, 0), dt_time(15, 0)),
+]
+
+
+def template_rules(valid_from: date) -> List[dict]:
+    """schedule_rule rows of the demo patterns, open-ended from valid_from.
+    Ids are fixed (doctors first, then services), so inserting them twice
+    with INSERT IGNORE adds them once."""
+    rows = [
+        {"resource_type": "DOCTOR", "resource_id": doctor_id, "clinic_id": clinic_id, "weekday_mask": mask,
+         "time_start": time_start, "time_end": time_end}
+        for doctor_id, clinic_id, mask, time_start, time_end in DOCTOR_TEMPLATES
+    ] + [
+        {"resource_type": "SERVICE", "resource_id": service_id, "clinic_id": None, "weekday_mask": mask,
+         "time_start": time_start, "time_end": time_end}
+        for service_id, mask, time_start, time_end in SERVICE_TEMPLATES
+    ]
+    for rule_id, row in enumerate(rows, 1):
+        row.update(id=rule_id, valid_from=valid_from, valid_to=None)
+    return rows
+
+
+def rules_fingerprint(db: Session) -> Tuple[int, int, int]:
+    """(rule count, highest rule id, exception count). Changes when rules or
+    exceptions are added or deleted; edits of existing rows go unnoticed."""
+    count, top = db.query(func.count(ScheduleRule.id), func.max(ScheduleRule.id)).one()
+    exceptions = db.query(func.count()).select_from(ScheduleRuleException).scalar()
+    return count, top or 0, exceptions
+
+
+def _materialized(db: Session, kind: str, day_from: date, day_to: date,
+                  resource_ids: Optional[Iterable[int]]) -> List[Window]:
+    if kind == "DOCTOR":
+        query = db.query(
+            DoctorSchedule.doctor_id, DoctorSchedule.clinic_id, DoctorSchedule.work_date,
+            DoctorSchedule.time_start, DoctorSchedule.time_end,
+        ).filter(DoctorSchedule.work_date >= day_from, DoctorSchedule.work_date <= day_to)
+        if resource_ids is not None:
+            query = query.filter(DoctorSchedule.doctor_id.in_(resource_ids))
+        return [Window(*row) for row in query.order_by(DoctorSchedule.id)]
+    query = db.query(
+        ServiceSchedule.service_id, ServiceSchedule.work_date,
+        ServiceSchedule.time_start, ServiceSchedule.time_end,
+    ).filter(ServiceSchedule.work_date >= day_from, ServiceSchedule.work_date <= day_to)
+    if resource_ids is not None:
+        query = query.filter(ServiceSchedule.service_id.in_(resource_ids))
+    return [
+        Window(service_id, None, work_date, time_start, time_end)
+        for service_id, work_date, time_start, time_end in query.order_by(ServiceSchedule.id)
+    ]
+
+
+def _rules(db: Session, kind: str, day_from: date, day_to: date,
+           resource_ids: Optional[Iterable[int]]) -> Tuple[list, Dict[int, Set[date]]]:
+    """Rules of kind valid somewhere in [day_from, day_to] and their exception dates there."""
+    query = db.query(
+        ScheduleRule.id, ScheduleRule.resource_id, ScheduleRule.clinic_id, ScheduleRule.weekday_mask,
+        ScheduleRule.time_start, ScheduleRule.time_end, ScheduleRule.valid_from, ScheduleRule.valid_to,
+    ).filter(
+        ScheduleRule.resource_type == kind,
+        ScheduleRule.valid_from <= day_to,
+        (ScheduleRule.valid_to.is_(None)) | (ScheduleRule.valid_to >= day_from),
+    )
+    if resource_ids is not None:
+        query = query.filter(ScheduleRule.resource_id.in_(resource_ids))
+    rules = query.order_by(ScheduleRule.id).all()
+    exceptions: Dict[int, Set[date]] = {}
+    if rules:
+        for rule_id, exception_date in db.query(
+            ScheduleRuleException.rule_id, ScheduleRuleException.exception_date,
+        ).filter(
+            ScheduleRuleException.rule_id.in_([r.id for r in rules]),
+            ScheduleRuleException.exception_date >= day_from,
+            ScheduleRuleException.exception_date <= day_to,
+        ):
+            exceptions.setdefault(rule_id, set()).add(exception_date)
+    return rules, exceptions
+
+
+def load_windows(db: Session, kind: str, day_from: date, day_to: date,
+                 resource_ids: Optional[Iterable[int]] = None,
+                 clinic_ids: Optional[Iterable[int]] = None) -> List[Window]:
+    """Schedule windows of kind ("DOCTOR" or "SERVICE") with
+    day_from <= work_date <= day_to, ordered by (work_date, time_start,
+    resource_id). resource_ids and clinic_ids (doctors only) narrow the
+    result; None means all."""
+    if resource_ids is not None:
+        resource_ids = list(resource_ids)
+    clinic_ids = set(clinic_ids) if clinic_ids is not None else None
+
+    # Overrides are looked up for every clinic: a row at another clinic
+    # still replaces the rules of that resource-day.
+    materialized = _materialized(db, kind, day_from, day_to, resource_ids)
+    overridden = {(w.resource_id, w.work_date) for w in materialized}
+    windows = [w for w in materialized if clinic_ids is None or w.clinic_id in clinic_ids]
+
+    rules, exceptions = _rules(db, kind, day_from, day_to, resource_ids)
+    one_day = timedelta(days=1)
+    for rule_id, resource_id, clinic_id, mask, time_start, time_end, valid_from, valid_to in rules:
+        if clinic_ids is not None and clinic_id not in clinic_ids:
+            continue
+        skip = exceptions.get(rule_id, ())
+        day = max(day_from, valid_from)
+        last = min(day_to, valid_to) if valid_to else day_to
+        while day <= last:
+            if mask >> day.weekday() & 1 and day not in skip and (resource_id, day) not in overridden:
+                windows.append(Window(resource_id, clinic_id, day, time_start, time_end))
+            day += one_day
+
+    windows.sort(key=lambda w: (w.work_date, w.time_start, w.resource_id))
+    return windows
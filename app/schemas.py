@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -29,6 +29,11 @@ class SlotItem(BaseModel):
 
 class SlotSearchResponse(BaseModel):
     items: List[SlotItem]
+    next_cursor: Optional[str] = None
+
+
+class NextSlotsResponse(BaseModel):
+    items: List[SlotItem]
 
 
 class BookVisitRequest(BaseModel):
@@ -44,6 +49,28 @@ class BookVisitResponse(BaseModel):
     status: str = "booked"
 
 
+class BatchModeEnum(str, Enum):
+    ALL_OR_NOTHING = "all_or_nothing"
+    BEST_EFFORT = "best_effort"
+
+
+class BatchBookRequest(BaseModel):
+    mode: BatchModeEnum = BatchModeEnum.ALL_OR_NOTHING
+    items: List[BookVisitRequest] = Field(..., min_length=1, max_length=50)
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    status_code: int
+    visit_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BatchBookResponse(BaseModel):
+    status: str
+    items: List[BatchItemResult]
+
+
 class VisitItem(BaseModel):
     visit_id: int
     patient_id: int
@@ -104,3 +131,40 @@ class ServiceItem(BaseModel):
     clinic_name: str
     duration_minutes: int
     buffer_minutes: int
+
+
+class AvailabilityStatus(BaseModel):
+    loaded_from: Optional[str] = None
+    loaded_to: Optional[str] = None
+    loaded_at: Optional[str] = None
+    build_ms: Optional[float] = None
+    grids: int
+    visits: int
+
+
+class ScheduleExtenderStatus(BaseModel):
+    running: bool
+    interval_s: float
+    phase: str
+    runs: int
+    last_result: Optional[str] = None
+    last_error: Optional[str] = None
+    last_started_at: Optional[str] = None
+    last_finished_at: Optional[str] = None
+    last_duration_ms: Optional[float] = None
+    last_changes: dict = {}
+
+
+class CatalogStatus(BaseModel):
+    version: int
+
+
+class SearchCacheStats(BaseModel):
+    enabled: bool
+    max_entries: int
+    entries: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    hit_ratio: Optional[float] = None
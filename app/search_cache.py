@@ -0,0 +1,165 @@
+"""Bounded LRU cache of slot search results.
+
+Entries are keyed by the normalized search parameters and depend on the
+(kind, resource_id, day) pairs the search covered. Versions are change_feed
+ids, which every worker sees for every booking or cancellation: an entry
+remembers the feed position at which its computation started and is stale
+once any of its resource-days has a newer change, whichever worker made it.
+clear() only affects this worker; it also rejects results whose
+computation started before it.
+"""
+
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+import threading
+
+from sqlalchemy.orm import Session
+
+from catalog import fold, reference_catalog
+from change_feed import Change, change_feed
+from config import SEARCH_CACHE_SIZE
+
+# Larger results are served but not cached.
+MAX_CACHED_ITEMS = 1000
+
+
+def search_key(slot_type: str, time_from: datetime, time_to: datetime, district: Optional[str],
+               clinic_id: Optional[int], direction_id: Optional[int], doctor_name: Optional[str],
+               service_id: Optional[int], with_busy: bool, limit: Optional[int],
+               after: Optional[tuple]) -> tuple:
+    """Cache key of a slot search; filters that cannot change the result are dropped."""
+    doctor = slot_type == "doctor"
+    return (
+        slot_type,
+        time_from.isoformat(),
+        time_to.isoformat(),
+        fold(district) or None,
+        clinic_id or None,
+        (direction_id or None) if doctor else None,
+        (" ".join(fold(doctor_name).split()) or None) if doctor else None,
+        None if doctor else (service_id or None),
+        with_busy,
+        limit,
+        after,
+    )
+
+
+class Version(NamedTuple):
+    """change: feed position the result includes; generation: local clear() count."""
+    change: int
+    generation: int
+
+
+class _Entry:
+    __slots__ = ("value", "kind", "resource_ids", "day_from", "day_to", "version")
+
+    def __init__(self, value, kind, resource_ids, day_from, day_to, version):
+        self.value = value
+        self.kind = kind
+        self.resource_ids = resource_ids
+        self.day_from = day_from
+        self.day_to = day_to
+        self.version = version
+
+
+class SearchCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._generation = 0
+        # (kind, resource_id, day) -> id of its last change
+        self._resource_days: Dict[Tuple[str, int, date], int] = {}
+        # (kind, day) -> newest change id of any resource on that day
+        self._days: Dict[Tuple[str, date], int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def version(self) -> Version:
+        """Take this after polling the change feed, before computing a result, and pass it to put()."""
+        return Version(change_feed.position, self._generation)
+
+    def _stale(self, entry: _Entry) -> bool:
+        change = entry.version.change
+        day = entry.day_from
+        while day <= entry.day_to:
+            if self._days.get((entry.kind, day), 0) > change:
+                for rid in entry.resource_ids:
+                    if self._resource_days.get((entry.kind, rid, day), 0) > change:
+                        return True
+            day += timedelta(days=1)
+        return False
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._stale(entry):
+                del self._entries[key]
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: Hashable, value, kind: str, resource_ids: Iterable[int],
+            day_from: date, day_to: date, version: Version):
+        """Store a result computed from data as of version, for the given resource-days."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if version.generation != self._generation:
+                return
+            self._entries[key] = _Entry(value, kind, frozenset(resource_ids), day_from, day_to, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def apply_changes(self, db: Session, changes: List[Change]):
+        """change_feed listener: mark the changed resource-days."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for change in changes:
+                key = (change.kind, change.resource_id, change.work_date)
+                self._resource_days[key] = max(self._resource_days.get(key, 0), change.id)
+                day_key = (change.kind, change.work_date)
+                self._days[day_key] = max(self._days.get(day_key, 0), change.id)
+
+    def clear(self):
+        """Drop all entries, e.g. after schedules or reference data changed."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._resource_days.clear()
+            self._days.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+search_cache = SearchCache(SEARCH_CACHE_SIZE)
+change_feed.add_listener(search_cache.apply_changes)
+# Cached slots embed doctor, service and clinic names.
+reference_catalog.add_listener(search_cache.clear)
@@ -1,17 +1,28 @@
 """Slot generation and booking logic."""
 
+from collections import defaultdict
 from datetime import datetime, timedelta, date, time as dt_time
-from typing import List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import base64
+import heapq
+import itertools
+import json
 import logging
 from sqlalchemy.exc import DataError, IntegrityError
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, lazyload
+from sqlalchemy import and_, insert, or_
 
-from models import (
-    Doctor, Service, Clinic, Direction,
-    DoctorSchedule, ServiceSchedule, Visit,
-    doctor_direction,
-)
+from availability import EMPTY_INDEX, VisitIntervalIndex, VisitRecord, availability_engine, grid_size
+from booking_locks import LockTimeout, ResourceDay, resource_days_locked, resource_days_locked_async
+from change_feed import record_changes
+from catalog import ClinicEntry, DoctorEntry, ServiceEntry, reference_catalog
+from config import SLOT_TABLE
+from database import run_db
+from models import Doctor, Visit
+from schedule_rules import Window, load_windows
+import slot_table
+import vector_slots
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +38,10 @@ def _doctor_name(doc: Doctor) -> str:
     return " ".join(parts)
 
 
+def _visit_record(v: Visit) -> VisitRecord:
+    return VisitRecord(v.id, v.start_datetime, v.duration_minutes, v.buffer_minutes, v.patient_id)
+
+
 def _get_doctor_visits(db: Session, doctor_id: int, day: date) -> List[Visit]:
     return (
         db.query(Visit)
@@ -53,18 +68,412 @@ def _get_service_visits(db: Session, service_id: int, day: date) -> List[Visit]:
     )
 
 
-def _overlaps(start: datetime, duration: int, buffer: int, visits: List[Visit]) -> Optional[int]:
-    """Check if [start, start+duration+buffer) overlaps any visit interval.
-    Returns the patient_id of the conflicting visit, or None if free."""
-    end = start + timedelta(minutes=duration + buffer)
+def _load_visits_by_day(
+    db: Session,
+    visit_type: str,
+    resource_column,
+    resource_ids: Iterable[int],
+    day_from: date,
+    day_to: date,
+) -> Dict[Tuple[int, date], VisitIntervalIndex]:
+    """Load all visits of the given resources in [day_from, day_to] with one query.
+    Returns an interval index per (resource_id, work_date)."""
+    resource_ids = set(resource_ids)
+    if not resource_ids:
+        return {}
+    visits = (
+        db.query(Visit)
+        .options(lazyload("*"))
+        .filter(
+            Visit.visit_type == visit_type,
+            resource_column.in_(resource_ids),
+            Visit.start_datetime >= _combine(day_from, dt_time(0, 0)),
+            Visit.start_datetime < _combine(day_to + timedelta(days=1), dt_time(0, 0)),
+        )
+        .all()
+    )
+    grouped: Dict[Tuple[int, date], List[Visit]] = defaultdict(list)
     for v in visits:
-        v_end = v.start_datetime + timedelta(minutes=v.duration_minutes + v.buffer_minutes)
-        if start < v_end and end > v.start_datetime:
-            return v.patient_id
-    return None
+        resource_id = v.doctor_id if visit_type == "DOCTOR" else v.service_id
+        grouped[(resource_id, v.start_datetime.date())].append(v)
+    return {key: VisitIntervalIndex(day_visits) for key, day_visits in grouped.items()}
+
+
+def _load_doctor_visits(
+    db: Session, doctor_ids: Iterable[int], day_from: date, day_to: date
+) -> Dict[Tuple[int, date], VisitIntervalIndex]:
+    return _load_visits_by_day(db, "DOCTOR", Visit.doctor_id, doctor_ids, day_from, day_to)
+
+
+def _load_service_visits(
+    db: Session, service_ids: Iterable[int], day_from: date, day_to: date
+) -> Dict[Tuple[int, date], VisitIntervalIndex]:
+    return _load_visits_by_day(db, "SERVICE", Visit.service_id, service_ids, day_from, day_to)
+
+
+def _slot_starts(
+    window_start: datetime,
+    window_end: datetime,
+    time_from: datetime,
+    time_to: datetime,
+    duration: int,
+    slot_interval: int,
+) -> Iterator[datetime]:
+    """Yield grid-aligned slot starts of a schedule window that fit into [time_from, time_to]."""
+    # Align first slot to grid, but not before time_from
+    if time_from > window_start:
+        # Calculate how many intervals from window_start to time_from
+        delta_minutes = (time_from - window_start).total_seconds() / 60
+        intervals_to_skip = int(delta_minutes / slot_interval)
+        # If time_from falls within an interval, move to next interval
+        if delta_minutes % slot_interval > 0:
+            intervals_to_skip += 1
+        t = window_start + timedelta(minutes=intervals_to_skip * slot_interval)
+    else:
+        t = window_start
+
+    while t + timedelta(minutes=duration) <= window_end:
+        # Only include slots that start at or after time_from and end at or before time_to
+        if t >= time_from and t + timedelta(minutes=duration) <= time_to:
+            yield t
+        t += timedelta(minutes=slot_interval)
+
+
+def _stamps(t: datetime, duration: int) -> Tuple[str, str]:
+    """Start and end strings of a slot starting at t."""
+    return t.strftime("%Y-%m-%dT%H:%M:%S"), (t + timedelta(minutes=duration)).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _doctor_slot(doc: DoctorEntry, clinic: ClinicEntry, start: str, end: str,
+                 busy_pid: Optional[int], is_admin: bool) -> dict:
+    return {
+        "slot_type": "DOCTOR",
+        "clinic_id": clinic.id,
+        "clinic_name": clinic.name,
+        "district": clinic.district,
+        "doctor_id": doc.id,
+        "doctor_name": doc.full_name,
+        "doctor_directions": doc.directions_str,
+        "doctor_photo": doc.photo_path,
+        "doctor_bio": doc.bio_text,
+        "service_id": None,
+        "service_name": None,
+        "start": start,
+        "end": end,
+        "is_free": busy_pid is None,
+        "busy_patient_id": busy_pid if is_admin else None,
+    }
+
+
+def _service_slot(svc: ServiceEntry, clinic: ClinicEntry, start: str, end: str,
+                  busy_pid: Optional[int], is_admin: bool) -> dict:
+    return {
+        "slot_type": "SERVICE",
+        "clinic_id": clinic.id,
+        "clinic_name": clinic.name,
+        "district": clinic.district,
+        "doctor_id": None,
+        "doctor_name": None,
+        "doctor_directions": None,
+        "doctor_photo": None,
+        "doctor_bio": None,
+        "service_id": svc.id,
+        "service_name": svc.name,
+        "start": start,
+        "end": end,
+        "is_free": busy_pid is None,
+        "busy_patient_id": busy_pid if is_admin else None,
+    }
+
+
+def _slot_order(slot: dict) -> Tuple[str, str, int, int]:
+    return (
+        slot["start"],
+        slot["doctor_name"] or slot["service_name"] or "",
+        slot["doctor_id"] or slot["service_id"],
+        slot["clinic_id"],
+    )
+
+
+def encode_cursor(slot: dict) -> str:
+    """Opaque cursor pointing just past the given slot."""
+    raw = json.dumps(list(_slot_order(slot)), ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[str, str, int, int]]:
+    """Return the slot order key stored in a cursor, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        start, name, resource_id, clinic_id = json.loads(raw)
+        datetime.fromisoformat(start)
+    except (ValueError, TypeError):
+        return None
+    if not (isinstance(name, str) and isinstance(resource_id, int) and isinstance(clinic_id, int)):
+        return None
+    return start, name, resource_id, clinic_id
+
+
+def paginate_slots(items: Iterator[dict], limit: Optional[int] = None,
+                   after: Optional[Tuple[str, str, int, int]] = None) -> Tuple[Iterator[dict], Optional[str]]:
+    """Skip slots up to the cursor key and stop after limit slots.
+
+    Returns (slots, next_cursor). Only limit + 1 slots are ever pulled from
+    the underlying merge, so generation stops as soon as the page is full.
+    """
+    if after is not None:
+        items = itertools.dropwhile(lambda s: _slot_order(s) <= after, items)
+    if limit is None:
+        return items, None
+    page = list(itertools.islice(items, limit + 1))
+    if len(page) > limit:
+        return iter(page[:limit]), encode_cursor(page[limit - 1])
+    return iter(page), None
+
+
+# Per-resource fields of a slot; compact_slots sends them once per resource.
+_RESOURCE_FIELDS = (
+    "slot_type", "clinic_id", "clinic_name", "district",
+    "doctor_id", "doctor_name", "doctor_directions", "doctor_photo", "doctor_bio",
+    "service_id", "service_name",
+)
+
+
+def compact_slots(items: Iterable[dict], with_busy: bool = False) -> dict:
+    """Columnar form of slot dicts for format=compact.
+
+    Every (doctor or service, clinic) appears once in resources; slots become
+    parallel columns of resource indexes and start offsets in minutes from
+    base (midnight of the first slot's day), and is_free is a base64
+    little-endian bitmask with bit i set when slot i is free.
+    """
+    resources = []
+    index = {}
+    resource_column = []
+    start_column = []
+    busy_column = []
+    free = 0
+    base = None
+    n = 0
+    for slot in items:
+        t = datetime.fromisoformat(slot["start"])
+        if base is None:
+            base = datetime.combine(t.date(), dt_time.min)
+        key = (slot["slot_type"], slot["doctor_id"] or slot["service_id"], slot["clinic_id"])
+        i = index.get(key)
+        if i is None:
+            i = index[key] = len(resources)
+            resource = {field: slot[field] for field in _RESOURCE_FIELDS}
+            resource["duration_minutes"] = int(
+                (datetime.fromisoformat(slot["end"]) - t).total_seconds() // 60
+            )
+            resources.append(resource)
+        resource_column.append(i)
+        start_column.append(int((t - base).total_seconds() // 60))
+        if slot["is_free"]:
+            free |= 1 << n
+        if with_busy:
+            busy_column.append(slot["busy_patient_id"])
+        n += 1
+
+    result = {
+        "format": "compact",
+        "base": base.strftime("%Y-%m-%dT%H:%M:%S") if base else None,
+        "resources": resources,
+        "resource": resource_column,
+        "start": start_column,
+        "is_free": base64.b64encode(free.to_bytes((n + 7) // 8, "little")).decode("ascii"),
+    }
+    if with_busy:
+        result["busy_patient_id"] = busy_column
+    return result
+
+
+def _grid_stream(grid, resource, clinic, visits: VisitIntervalIndex, time_from: datetime,
+                 time_to: datetime, with_busy: bool, is_admin: bool, make_slot) -> Iterator[dict]:
+    """Slots of one availability engine grid, in start order."""
+    if not with_busy:
+        for t in grid.free_slots(time_from, time_to):
+            yield make_slot(resource, clinic, *_stamps(t, grid.duration), None, is_admin)
+        return
+    if vector_slots.ENABLED:
+        for start, end, busy_pid in vector_slots.window_slots(
+            grid.window_start, grid.count, grid.duration, grid.interval, visits, time_from, time_to, True,
+        ):
+            yield make_slot(resource, clinic, start, end, busy_pid, is_admin)
+        return
+    span = timedelta(minutes=grid.interval)
+    for _, t, busy in grid.slots(time_from, time_to):
+        busy_pid = visits.conflict(t, t + span) if busy else None
+        yield make_slot(resource, clinic, *_stamps(t, grid.duration), busy_pid, is_admin)
+
+
+def _schedule_stream(resource, clinic, window_start: datetime, window_end: datetime,
+                     visits: VisitIntervalIndex, time_from: datetime, time_to: datetime,
+                     with_busy: bool, is_admin: bool, make_slot) -> Iterator[dict]:
+    """Slots of one schedule row computed from its visits, in start order."""
+    # Generate fixed time slots based on duration + buffer
+    duration = resource.duration_minutes
+    slot_interval = duration + resource.buffer_minutes
+    if vector_slots.ENABLED:
+        count = grid_size(window_start, window_end, duration, slot_interval)
+        for start, end, busy_pid in vector_slots.window_slots(
+            window_start, count, duration, slot_interval, visits, time_from, time_to, with_busy,
+        ):
+            yield make_slot(resource, clinic, start, end, busy_pid, is_admin)
+        return
+    starts = _slot_starts(window_start, window_end, time_from, time_to, duration, slot_interval)
+    for t, busy_pid in visits.sweep(starts, slot_interval):
+        if busy_pid is None or with_busy:
+            yield make_slot(resource, clinic, *_stamps(t, duration), busy_pid, is_admin)
+
+
+def _memory_day_streams(kind: str, resources: dict, clinics: dict, time_from: datetime,
+                        time_to: datetime, with_busy: bool, is_admin: bool,
+                        make_slot) -> Iterator[List[Iterator[dict]]]:
+    """Per-grid slot streams answered from the availability engine bitmaps,
+    produced one day at a time."""
+    day = time_from.date()
+    while day <= time_to.date():
+        streams = []
+        for grid in availability_engine.grids(kind, day, day):
+            resource = resources.get(grid.resource_id)
+            clinic = clinics.get(grid.clinic_id)
+            if resource is None or clinic is None:
+                continue
+            visits = availability_engine.index(kind, grid.resource_id, grid.work_date)
+            streams.append(_grid_stream(
+                grid, resource, clinic, visits, time_from, time_to, with_busy, is_admin, make_slot,
+            ))
+        yield streams
+        day += timedelta(days=1)
+
+
+def _row_stream(resource, clinic, slots: List[Tuple[datetime, Optional[int]]], is_admin: bool,
+                make_slot) -> Iterator[dict]:
+    for t, busy_pid in slots:
+        yield make_slot(resource, clinic, *_stamps(t, resource.duration_minutes), busy_pid, is_admin)
+
+
+def _slot_table_day_streams(rows: List[slot_table.SlotRow], resources: dict, clinics: dict,
+                            is_admin: bool, make_slot) -> List[List[Iterator[dict]]]:
+    """Per resource-day slot streams over materialized slot rows, in date order."""
+    by_day = defaultdict(lambda: defaultdict(list))
+    for resource_id, clinic_id, t, busy_pid in rows:
+        if resource_id in resources and clinic_id in clinics:
+            by_day[t.date()][(resource_id, clinic_id)].append((t, busy_pid))
+    return [
+        [
+            _row_stream(resources[resource_id], clinics[clinic_id], slots, is_admin, make_slot)
+            for (resource_id, clinic_id), slots in by_day[day].items()
+        ]
+        for day in sorted(by_day)
+    ]
+
+
+def _merge_slots(day_streams: Iterable[List[Iterator[dict]]]) -> Iterator[dict]:
+    """K-way merge of per-schedule slot streams into one stream in slot order.
+
+    Slots never cross midnight, so each day is merged on its own and days are
+    chained; a consumer that stops early never touches later days.
+    """
+    for streams in day_streams:
+        yield from heapq.merge(*streams, key=_slot_order)
+
+
+def _schedule_day_streams(windows: List[Window], make_stream) -> List[List[Iterator[dict]]]:
+    """Group lazy per-window streams by work_date, in date order."""
+    by_day = defaultdict(list)
+    for window in windows:
+        by_day[window.work_date].append(make_stream(window))
+    return [by_day[day] for day in sorted(by_day)]
+
+
+def _table_rows_suffice(rows: List[slot_table.SlotRow], time_from: datetime, limit: Optional[int],
+                        first_only: bool, resources: dict) -> bool:
+    """Whether slot table rows alone answer the request, so the part of the
+    range after the horizon need not be read."""
+    if first_only:
+        return {row[0] for row in rows} >= set(resources)
+    return limit is not None and sum(1 for row in rows if row[2] > time_from) > limit
+
 
+def _doctor_day_streams(
+    db: Session,
+    time_from: datetime,
+    time_to: datetime,
+    district: Optional[str],
+    clinic_id: Optional[int],
+    direction_id: Optional[int],
+    doctor_name: Optional[str],
+    doctor_id: Optional[int],
+    with_busy: bool,
+    is_admin: bool,
+    limit: Optional[int] = None,
+    first_only: bool = False,
+) -> Tuple[set, Iterable[List[Iterator[dict]]]]:
+    """Candidate doctor ids and their per-schedule slot streams grouped by day.
+    All DB reads happen here; the streams themselves only touch memory.
+
+    limit and first_only only narrow what is read from the slot table: enough
+    rows for limit + 1 slots, or the first free slot of each doctor."""
+    catalog = reference_catalog.get(db)
+    doctors = {
+        d.id: d for d in catalog.match_doctors(direction_id, doctor_name, split_words=True, doctor_id=doctor_id)
+    }
+    clinics = {c.id: c for c in catalog.match_clinics(district, clinic_id)}
+    if not doctors or not clinics:
+        return set(), []
+
+    if SLOT_TABLE and time_from < slot_table.horizon_end():
+        doctor_ids = list(doctors) if len(doctors) < len(catalog.doctors) else None
+        clinic_ids = list(clinics) if len(clinics) < len(catalog.clinics) else None
+        table_to = min(time_to, slot_table.horizon_end())
+        if first_only:
+            rows = slot_table.first_free_slots(db, "DOCTOR", time_from, table_to, doctor_ids, clinic_ids)
+        else:
+            rows = slot_table.search_slots(
+                db, "DOCTOR", time_from, table_to, doctor_ids, clinic_ids, with_busy, limit,
+            )
+        day_streams = _slot_table_day_streams(rows, doctors, clinics, is_admin, _doctor_slot)
+        if table_to == time_to or _table_rows_suffice(rows, time_from, limit, first_only, doctors):
+            return set(doctors), day_streams
+        # The rest of the range is after the horizon.
+        later_ids, later = _doctor_window_streams(
+            db, catalog, doctors, clinics, table_to, time_to, with_busy, is_admin,
+        )
+        return set(doctors) | later_ids, itertools.chain(day_streams, later)
+
+    return _doctor_window_streams(db, catalog, doctors, clinics, time_from, time_to, with_busy, is_admin)
+
+
+def _doctor_window_streams(db: Session, catalog, doctors: dict, clinics: dict, time_from: datetime,
+                           time_to: datetime, with_busy: bool, is_admin: bool):
+    """_doctor_day_streams from the availability engine or the schedule windows."""
+    if availability_engine.covers(time_from.date(), time_to.date()):
+        # Schedules and occupancy come from memory.
+        return set(doctors), _memory_day_streams(
+            "DOCTOR", doctors, clinics, time_from, time_to, with_busy, is_admin, _doctor_slot,
+        )
+
+    windows = load_windows(
+        db, "DOCTOR", time_from.date(), time_to.date(),
+        doctors if len(doctors) < len(catalog.doctors) else None,
+        clinics if len(clinics) < len(catalog.clinics) else None,
+    )
+    windows = [w for w in windows if w.resource_id in doctors and w.clinic_id in clinics]
+    doctor_ids = {w.resource_id for w in windows}
+    visits_by_day = _load_doctor_visits(db, doctor_ids, time_from.date(), time_to.date())
 
-def search_doctor_slots(
+    return doctor_ids, _schedule_day_streams(windows, lambda window: _schedule_stream(
+        doctors[window.resource_id], clinics[window.clinic_id],
+        _combine(window.work_date, window.time_start), _combine(window.work_date, window.time_end),
+        visits_by_day.get((window.resource_id, window.work_date), EMPTY_INDEX),
+        time_from, time_to, with_busy, is_admin, _doctor_slot,
+    ))
+
+
+def iter_doctor_slots(
     db: Session,
     time_from: datetime,
     time_to: datetime,
@@ -72,116 +481,88 @@ def search_doctor_slots(
     clinic_id: Optional[int] = None,
     direction_id: Optional[int] = None,
     doctor_name: Optional[str] = None,
+    doctor_id: Optional[int] = None,
     include_busy: bool = False,
     is_admin: bool = False,
-) -> list:
-    query = db.query(DoctorSchedule).join(Doctor).join(Clinic)
-
-    if district:
-        query = query.filter(Clinic.district == district)
-    if clinic_id:
-        query = query.filter(DoctorSchedule.clinic_id == clinic_id)
-    if direction_id:
-        query = query.filter(
-            Doctor.id.in_(
-                db.query(doctor_direction.c.doctor_id)
-                .filter(doctor_direction.c.direction_id == direction_id)
-            )
-        )
-    if doctor_name:
-        # Split doctor_name into words to handle "First Last" or "Last First" searches
-        name_parts = doctor_name.strip().split()
-
-        if len(name_parts) == 1:
-            # Single word: search in any name field
-            pattern = f"%{name_parts[0]}%"
-            query = query.filter(
-                or_(
-                    Doctor.first_name.ilike(pattern),
-                    Doctor.last_name.ilike(pattern),
-                    Doctor.middle_name.ilike(pattern),
-                )
-            )
+    limit: Optional[int] = None,
+) -> Iterator[dict]:
+    """Doctor slots in (start, doctor_name) order. All DB reads happen before
+    this returns, so the iterator can outlive the session. With limit, the
+    iterator may end after the first limit + 1 slots past time_from."""
+    _, day_streams = _doctor_day_streams(
+        db, time_from, time_to, district, clinic_id, direction_id, doctor_name, doctor_id,
+        include_busy and is_admin, is_admin, limit,
+    )
+    return _merge_slots(day_streams)
+
+
+def _service_day_streams(
+    db: Session,
+    time_from: datetime,
+    time_to: datetime,
+    district: Optional[str],
+    clinic_id: Optional[int],
+    service_id: Optional[int],
+    with_busy: bool,
+    is_admin: bool,
+    limit: Optional[int] = None,
+    first_only: bool = False,
+) -> Tuple[set, Iterable[List[Iterator[dict]]]]:
+    """Candidate service ids and their per-schedule slot streams grouped by day.
+    All DB reads happen here; the streams themselves only touch memory.
+
+    limit and first_only only narrow what is read from the slot table, as in
+    _doctor_day_streams."""
+    catalog = reference_catalog.get(db)
+    services = {s.id: s for s in catalog.match_services(district, clinic_id, service_id)}
+    if not services:
+        return set(), []
+    clinics = {s.clinic_id: s.clinic for s in services.values()}
+
+    if SLOT_TABLE and time_from < slot_table.horizon_end():
+        service_ids = list(services) if len(services) < len(catalog.services) else None
+        table_to = min(time_to, slot_table.horizon_end())
+        if first_only:
+            rows = slot_table.first_free_slots(db, "SERVICE", time_from, table_to, service_ids)
         else:
-            # Multiple words: each word must match at least one name field
-            # This allows "Hans Müller" or "Müller Hans" to both work
-            for part in name_parts:
-                pattern = f"%{part}%"
-                query = query.filter(
-                    or_(
-                        Doctor.first_name.ilike(pattern),
-                        Doctor.last_name.ilike(pattern),
-                        Doctor.middle_name.ilike(pattern),
-                    )
-                )
+            rows = slot_table.search_slots(db, "SERVICE", time_from, table_to, service_ids, None, with_busy, limit)
+        day_streams = _slot_table_day_streams(rows, services, clinics, is_admin, _service_slot)
+        if table_to == time_to or _table_rows_suffice(rows, time_from, limit, first_only, services):
+            return set(services), day_streams
+        later_ids, later = _service_window_streams(
+            db, catalog, services, clinics, table_to, time_to, with_busy, is_admin,
+        )
+        return set(services) | later_ids, itertools.chain(day_streams, later)
+
+    return _service_window_streams(db, catalog, services, clinics, time_from, time_to, with_busy, is_admin)
 
 
-    query = query.filter(
-        DoctorSchedule.work_date >= time_from.date(),
-        DoctorSchedule.work_date <= time_to.date(),
+def _service_window_streams(db: Session, catalog, services: dict, clinics: dict, time_from: datetime,
+                            time_to: datetime, with_busy: bool, is_admin: bool):
+    """_service_day_streams from the availability engine or the schedule windows."""
+    if availability_engine.covers(time_from.date(), time_to.date()):
+        # Schedules and occupancy come from memory.
+        return set(services), _memory_day_streams(
+            "SERVICE", services, clinics, time_from, time_to, with_busy, is_admin, _service_slot,
+        )
+
+    windows = load_windows(
+        db, "SERVICE", time_from.date(), time_to.date(),
+        services if len(services) < len(catalog.services) else None,
     )
+    windows = [w for w in windows if w.resource_id in services]
+    service_ids = {w.resource_id for w in windows}
+    visits_by_day = _load_service_visits(db, service_ids, time_from.date(), time_to.date())
 
-    schedules = query.all()
-
-    slots = []
-    for sched in schedules:
-        doc = sched.doctor
-        clinic = sched.clinic
-        window_start = _combine(sched.work_date, sched.time_start)
-        window_end = _combine(sched.work_date, sched.time_end)
-
-        visits = _get_doctor_visits(db, doc.id, sched.work_date)
-
-        # Generate fixed time slots based on duration + buffer
-        slot_interval = doc.duration_minutes + doc.buffer_minutes
-
-        # Align first slot to grid, but not before time_from
-        if time_from > window_start:
-            # Calculate how many intervals from window_start to time_from
-            delta_minutes = (time_from - window_start).total_seconds() / 60
-            intervals_to_skip = int(delta_minutes / slot_interval)
-            # If time_from falls within an interval, move to next interval
-            if delta_minutes % slot_interval > 0:
-                intervals_to_skip += 1
-            t = window_start + timedelta(minutes=intervals_to_skip * slot_interval)
-        else:
-            t = window_start
-
-        while t + timedelta(minutes=doc.duration_minutes) <= window_end:
-            slot_end = t + timedelta(minutes=doc.duration_minutes)
-            # Only include slots that start at or after time_from and end at or before time_to
-            if t >= time_from and slot_end <= time_to:
-                busy_pid = _overlaps(t, doc.duration_minutes, doc.buffer_minutes, visits)
-                is_free = busy_pid is None
-
-                if is_free or (include_busy and is_admin):
-                    directions_str = ", ".join(d.name for d in doc.directions) if doc.directions else ""
-                    slot = {
-                        "slot_type": "DOCTOR",
-                        "clinic_id": clinic.id,
-                        "clinic_name": clinic.name,
-                        "district": clinic.district,
-                        "doctor_id": doc.id,
-                        "doctor_name": _doctor_name(doc),
-                        "doctor_directions": directions_str,
-                        "doctor_photo": doc.photo_path,
-                        "doctor_bio": doc.bio_text,
-                        "service_id": None,
-                        "service_name": None,
-                        "start": t.strftime("%Y-%m-%dT%H:%M:%S"),
-                        "end": slot_end.strftime("%Y-%m-%dT%H:%M:%S"),
-                        "is_free": is_free,
-                        "busy_patient_id": busy_pid if is_admin else None,
-                    }
-                    slots.append(slot)
-
-            t += timedelta(minutes=slot_interval)
-
-    slots.sort(key=lambda s: (s["start"], s["doctor_name"] or ""))
-    return slots
-
-
-def search_service_slots(
+    return service_ids, _schedule_day_streams(windows, lambda window: _schedule_stream(
+        services[window.resource_id], services[window.resource_id].clinic,
+        _combine(window.work_date, window.time_start), _combine(window.work_date, window.time_end),
+        visits_by_day.get((window.resource_id, window.work_date), EMPTY_INDEX),
+        time_from, time_to, with_busy, is_admin, _service_slot,
+    ))
+
+
+def iter_service_slots(
     db: Session,
     time_from: datetime,
     time_to: datetime,
@@ -190,78 +571,204 @@ def search_service_slots(
     service_id: Optional[int] = None,
     include_busy: bool = False,
     is_admin: bool = False,
+    limit: Optional[int] = None,
+) -> Iterator[dict]:
+    """Service slots in (start, service_name) order. All DB reads happen before
+    this returns, so the iterator can outlive the session. With limit, the
+    iterator may end after the first limit + 1 slots past time_from."""
+    _, day_streams = _service_day_streams(
+        db, time_from, time_to, district, clinic_id, service_id, include_busy and is_admin, is_admin, limit,
+    )
+    return _merge_slots(day_streams)
+
+
+def _first_free_per_resource(resource_ids: set, day_streams: Iterable[List[Iterator[dict]]]) -> list:
+    """Walk days forward and keep the earliest free slot of every resource.
+
+    Each per-schedule stream is advanced by at most one slot, and the walk
+    stops as soon as every candidate resource has a slot.
+    """
+    found = {}
+    remaining = set(resource_ids)
+    for streams in day_streams:
+        if not remaining:
+            break
+        day_found = {}
+        for stream in streams:
+            slot = next(stream, None)
+            if slot is None:
+                continue
+            key = slot["doctor_id"] or slot["service_id"]
+            if key not in remaining:
+                continue
+            if key not in day_found or _slot_order(slot) < _slot_order(day_found[key]):
+                day_found[key] = slot
+        found.update(day_found)
+        remaining.difference_update(day_found)
+    return sorted(found.values(), key=_slot_order)
+
+
+def next_doctor_slots(
+    db: Session,
+    time_from: datetime,
+    time_to: datetime,
+    district: Optional[str] = None,
+    clinic_id: Optional[int] = None,
+    direction_id: Optional[int] = None,
+    doctor_id: Optional[int] = None,
 ) -> list:
-    query = db.query(ServiceSchedule).join(Service).join(Clinic, Service.clinic_id == Clinic.id)
-
-    if district:
-        query = query.filter(Clinic.district == district)
-    if clinic_id:
-        query = query.filter(Service.clinic_id == clinic_id)
-    if service_id:
-        query = query.filter(ServiceSchedule.service_id == service_id)
-
-    query = query.filter(
-        ServiceSchedule.work_date >= time_from.date(),
-        ServiceSchedule.work_date <= time_to.date(),
+    """Earliest free slot per matching doctor in [time_from, time_to]."""
+    doctor_ids, day_streams = _doctor_day_streams(
+        db, time_from, time_to, district, clinic_id, direction_id, None, doctor_id, False, False,
+        first_only=True,
     )
+    return _first_free_per_resource(doctor_ids, day_streams)
 
-    schedules = query.all()
-
-    slots = []
-    for sched in schedules:
-        svc = sched.service
-        clinic = svc.clinic
-        window_start = _combine(sched.work_date, sched.time_start)
-        window_end = _combine(sched.work_date, sched.time_end)
-
-        visits = _get_service_visits(db, svc.id, sched.work_date)
-
-        # Generate fixed time slots based on duration + buffer
-        slot_interval = svc.duration_minutes + svc.buffer_minutes
-
-        # Align first slot to grid, but not before time_from
-        if time_from > window_start:
-            # Calculate how many intervals from window_start to time_from
-            delta_minutes = (time_from - window_start).total_seconds() / 60
-            intervals_to_skip = int(delta_minutes / slot_interval)
-            # If time_from falls within an interval, move to next interval
-            if delta_minutes % slot_interval > 0:
-                intervals_to_skip += 1
-            t = window_start + timedelta(minutes=intervals_to_skip * slot_interval)
-        else:
-            t = window_start
-
-        while t + timedelta(minutes=svc.duration_minutes) <= window_end:
-            slot_end = t + timedelta(minutes=svc.duration_minutes)
-            # Only include slots that start at or after time_from and end at or before time_to
-            if t >= time_from and slot_end <= time_to:
-                busy_pid = _overlaps(t, svc.duration_minutes, svc.buffer_minutes, visits)
-                is_free = busy_pid is None
-
-                if is_free or (include_busy and is_admin):
-                    slot = {
-                        "slot_type": "SERVICE",
-                        "clinic_id": clinic.id,
-                        "clinic_name": clinic.name,
-                        "district": clinic.district,
-                        "doctor_id": None,
-                        "doctor_name": None,
-                        "doctor_directions": None,
-                        "doctor_photo": None,
-                        "doctor_bio": None,
-                        "service_id": svc.id,
-                        "service_name": svc.name,
-                        "start": t.strftime("%Y-%m-%dT%H:%M:%S"),
-                        "end": slot_end.strftime("%Y-%m-%dT%H:%M:%S"),
-                        "is_free": is_free,
-                        "busy_patient_id": busy_pid if is_admin else None,
-                    }
-                    slots.append(slot)
-
-            t += timedelta(minutes=slot_interval)
-
-    slots.sort(key=lambda s: (s["start"], s["service_name"] or ""))
-    return slots
+
+def next_service_slots(
+    db: Session,
+    time_from: datetime,
+    time_to: datetime,
+    district: Optional[str] = None,
+    clinic_id: Optional[int] = None,
+    service_id: Optional[int] = None,
+) -> list:
+    """Earliest free slot per matching service in [time_from, time_to]."""
+    service_ids, day_streams = _service_day_streams(
+        db, time_from, time_to, district, clinic_id, service_id, False, False, first_only=True,
+    )
+    return _first_free_per_resource(service_ids, day_streams)
+
+
+def search_resource_ids(
+    db: Session,
+    slot_type: str,
+    district: Optional[str] = None,
+    clinic_id: Optional[int] = None,
+    direction_id: Optional[int] = None,
+    doctor_name: Optional[str] = None,
+    service_id: Optional[int] = None,
+) -> set:
+    """Ids of the doctors or services a slot search can return slots of."""
+    catalog = reference_catalog.get(db)
+    if slot_type == "doctor":
+        return {d.id for d in catalog.match_doctors(direction_id, doctor_name, split_words=True)}
+    return {s.id for s in catalog.match_services(district, clinic_id, service_id)}
+
+
+def search_doctor_slots(db: Session, time_from: datetime, time_to: datetime, **filters) -> list:
+    return list(iter_doctor_slots(db, time_from, time_to, **filters))
+
+
+def search_service_slots(db: Session, time_from: datetime, time_to: datetime, **filters) -> list:
+    return list(iter_service_slots(db, time_from, time_to, **filters))
+
+
+def list_visits(db: Session, time_from: datetime, time_to: datetime,
+                patient_id: Optional[int] = None) -> List[Visit]:
+    """Visits starting in [time_from, time_to], of one patient unless patient_id is None."""
+    q = db.query(Visit).filter(
+        Visit.start_datetime >= time_from,
+        Visit.start_datetime <= time_to,
+    )
+    if patient_id is not None:
+        q = q.filter(Visit.patient_id == patient_id)
+    return q.order_by(Visit.start_datetime).all()
+
+
+def _book_slot(
+    db: Session,
+    patient_id: int,
+    visit_type: str,
+    resource_id: int,
+    clinic_id: int,
+    start: datetime,
+    duration: int,
+    buffer: int,
+) -> Tuple[Optional[int], Optional[str]]:
+    """Slot table booking: insert the visit and claim its slot with one
+    conditional UPDATE. Schedule, idempotency and overlap are only looked
+    into when the claim fails."""
+    visit = Visit(
+        patient_id=patient_id,
+        visit_type=visit_type,
+        doctor_id=resource_id if visit_type == "DOCTOR" else None,
+        service_id=resource_id if visit_type == "SERVICE" else None,
+        clinic_id=clinic_id,
+        start_datetime=start,
+        duration_minutes=duration,
+        buffer_minutes=buffer,
+        created_at=datetime.now(),
+    )
+    db.add(visit)
+    try:
+        db.flush()
+        claimed = slot_table.claim_slot(db, visit_type, resource_id, clinic_id, start, visit.id)
+        if claimed:
+            record_changes(db, [(visit_type, resource_id, start.date())])
+            db.commit()
+    except IntegrityError:
+        # Another visit already starts at this time.
+        claimed = False
+    except DataError:
+        db.rollback()
+        logger.exception("Failed to store patient_id=%s for %s visit", patient_id, visit_type.lower())
+        return None, "invalid_request"
+    except Exception:
+        db.rollback()
+        logger.exception("Unexpected DB error while booking %s visit", visit_type.lower())
+        return None, "database_error"
+
+    if not claimed:
+        db.rollback()
+        if not slot_table.slot_exists(db, visit_type, resource_id, clinic_id, start):
+            return None, "not_in_schedule"
+        # Idempotency check
+        resource_column = Visit.doctor_id if visit_type == "DOCTOR" else Visit.service_id
+        existing = (
+            db.query(Visit.id, Visit.patient_id)
+            .filter(
+                Visit.visit_type == visit_type,
+                resource_column == resource_id,
+                Visit.start_datetime == start,
+            )
+            .first()
+        )
+        if existing and existing.patient_id == patient_id:
+            return existing.id, None
+        return None, "slot_busy"
+
+    db.refresh(visit)
+    availability_engine.add_visit(visit_type, resource_id, _visit_record(visit))
+    return visit.id, None
+
+
+def _resource_day(visit_type: str, doctor_id: Optional[int], service_id: Optional[int],
+                  start: Optional[datetime]) -> Optional[ResourceDay]:
+    """Lock key of a booking, or None if it is rejected before touching visits."""
+    if start is None:
+        return None
+    if visit_type == "DOCTOR" and doctor_id:
+        return ("DOCTOR", doctor_id, start.date())
+    if visit_type == "SERVICE" and service_id:
+        return ("SERVICE", service_id, start.date())
+    return None
+
+
+def _claims_slot(start: datetime) -> bool:
+    """Whether a booking at start goes through the slot table (SLOT_TABLE, within its horizon)."""
+    return SLOT_TABLE and start < slot_table.horizon_end()
+
+
+def _booking_lock_keys(items: Iterable[dict]) -> List[ResourceDay]:
+    # The slot table's conditional UPDATE already serializes claims, and grid
+    # slots never overlap, so bookings through it need no locks.
+    keys = (
+        _resource_day(i.get("visit_type"), i.get("doctor_id"), i.get("service_id"), i.get("start"))
+        for i in items
+        if i.get("start") is None or not _claims_slot(i["start"])
+    )
+    return [k for k in keys if k is not None]
 
 
 def book_visit(
@@ -273,34 +780,51 @@ def book_visit(
     clinic_id: Optional[int],
     start: datetime,
 ) -> Tuple[Optional[int], Optional[str]]:
-    """Book a visit. Returns (visit_id, None) on success or (None, error_code) on failure."""
+    """Book a visit. Returns (visit_id, None) on success or (None, error_code) on failure.
+
+    The resource-day is locked from the overlap check to the commit, so
+    overlapping bookings with different starts cannot both succeed.
+    """
+    keys = _booking_lock_keys([{
+        "visit_type": visit_type, "doctor_id": doctor_id, "service_id": service_id, "start": start,
+    }])
+    try:
+        with resource_days_locked(db, keys):
+            return _book_visit(db, patient_id, visit_type, doctor_id, service_id, clinic_id, start)
+    except LockTimeout:
+        logger.warning("Timed out waiting for booking lock %s", keys)
+        return None, LOCK_TIMEOUT
+
 
+def _book_visit(
+    db: Session,
+    patient_id: int,
+    visit_type: str,
+    doctor_id: Optional[int],
+    service_id: Optional[int],
+    clinic_id: Optional[int],
+    start: datetime,
+) -> Tuple[Optional[int], Optional[str]]:
     if visit_type == "DOCTOR":
         if not doctor_id:
             return None, "invalid_request"
-        doc = db.query(Doctor).filter(Doctor.id == doctor_id).first()
+        catalog = reference_catalog.get(db)
+        doc = catalog.doctors.get(doctor_id)
         if not doc:
             return None, "not_found"
         if not clinic_id:
             return None, "invalid_request"
-        clinic = db.query(Clinic).filter(Clinic.id == clinic_id).first()
+        clinic = catalog.clinics.get(clinic_id)
         if not clinic:
             return None, "not_found"
 
         duration = doc.duration_minutes
         buffer = doc.buffer_minutes
+        if _claims_slot(start):
+            return _book_slot(db, patient_id, "DOCTOR", doctor_id, clinic_id, start, duration, buffer)
 
         # Check schedule
-        sched = (
-            db.query(DoctorSchedule)
-            .filter(
-                DoctorSchedule.doctor_id == doctor_id,
-                DoctorSchedule.clinic_id == clinic_id,
-                DoctorSchedule.work_date == start.date(),
-                DoctorSchedule.time_start <= start.time(),
-            )
-            .all()
-        )
+        sched = load_windows(db, "DOCTOR", start.date(), start.date(), [doctor_id], [clinic_id])
         in_schedule = False
         for s in sched:
             ws = _combine(s.work_date, s.time_start)
@@ -328,8 +852,8 @@ def book_visit(
                 return None, "slot_busy"
 
         # Overlap check
-        visits = _get_doctor_visits(db, doctor_id, start.date())
-        if _overlaps(start, duration, buffer, visits) is not None:
+        visits = VisitIntervalIndex(_get_doctor_visits(db, doctor_id, start.date()))
+        if visits.conflict(start, start + timedelta(minutes=duration + buffer)) is not None:
             return None, "slot_busy"
 
         visit = Visit(
@@ -345,6 +869,10 @@ def book_visit(
         )
         db.add(visit)
         try:
+            if SLOT_TABLE:
+                db.flush()
+                slot_table.occupy_slots(db, "DOCTOR", doctor_id, start, duration + buffer, visit.id)
+            record_changes(db, [("DOCTOR", doctor_id, start.date())])
             db.commit()
         except IntegrityError:
             db.rollback()
@@ -358,29 +886,24 @@ def book_visit(
             logger.exception("Unexpected DB error while booking doctor visit")
             return None, "database_error"
         db.refresh(visit)
+        availability_engine.add_visit("DOCTOR", doctor_id, _visit_record(visit))
         return visit.id, None
 
     elif visit_type == "SERVICE":
         if not service_id:
             return None, "invalid_request"
-        svc = db.query(Service).filter(Service.id == service_id).first()
+        svc = reference_catalog.get(db).services.get(service_id)
         if not svc:
             return None, "not_found"
 
         derived_clinic_id = svc.clinic_id
         duration = svc.duration_minutes
         buffer = svc.buffer_minutes
+        if _claims_slot(start):
+            return _book_slot(db, patient_id, "SERVICE", service_id, derived_clinic_id, start, duration, buffer)
 
         # Check schedule
-        sched = (
-            db.query(ServiceSchedule)
-            .filter(
-                ServiceSchedule.service_id == service_id,
-                ServiceSchedule.work_date == start.date(),
-                ServiceSchedule.time_start <= start.time(),
-            )
-            .all()
-        )
+        sched = load_windows(db, "SERVICE", start.date(), start.date(), [service_id])
         in_schedule = False
         for s in sched:
             ws = _combine(s.work_date, s.time_start)
@@ -408,8 +931,8 @@ def book_visit(
                 return None, "slot_busy"
 
         # Overlap check
-        visits = _get_service_visits(db, service_id, start.date())
-        if _overlaps(start, duration, buffer, visits) is not None:
+        visits = VisitIntervalIndex(_get_service_visits(db, service_id, start.date()))
+        if visits.conflict(start, start + timedelta(minutes=duration + buffer)) is not None:
             return None, "slot_busy"
 
         visit = Visit(
@@ -425,6 +948,10 @@ def book_visit(
         )
         db.add(visit)
         try:
+            if SLOT_TABLE:
+                db.flush()
+                slot_table.occupy_slots(db, "SERVICE", service_id, start, duration + buffer, visit.id)
+            record_changes(db, [("SERVICE", service_id, start.date())])
             db.commit()
         except IntegrityError:
             db.rollback()
@@ -438,6 +965,322 @@ def book_visit(
             logger.exception("Unexpected DB error while booking service visit")
             return None, "database_error"
         db.refresh(visit)
+        availability_engine.add_visit("SERVICE", service_id, _visit_record(visit))
         return visit.id, None
 
     return None, "invalid_request"
+
+
+# Error of bookings that could not lock their resource-day in time.
+LOCK_TIMEOUT = "lock_timeout"
+
+# Error of valid items left unbooked because another item of an
+# all-or-nothing batch failed.
+BATCH_ABORTED = "batch_aborted"
+
+
+class _Planned(NamedTuple):
+    index: int
+    kind: str
+    resource_id: int
+    clinic_id: int
+    start: datetime
+    duration: int
+    buffer: int
+
+
+def _plan_batch_item(catalog, item: dict) -> Tuple[Optional[_Planned], Optional[str]]:
+    """Validate one batch item against the catalog, like book_visit does."""
+    start = item.get("start")
+    if start is None:
+        return None, "invalid_request"
+    if item.get("visit_type") == "DOCTOR":
+        doctor_id, clinic_id = item.get("doctor_id"), item.get("clinic_id")
+        if not doctor_id:
+            return None, "invalid_request"
+        doc = catalog.doctors.get(doctor_id)
+        if not doc:
+            return None, "not_found"
+        if not clinic_id:
+            return None, "invalid_request"
+        if clinic_id not in catalog.clinics:
+            return None, "not_found"
+        return _Planned(0, "DOCTOR", doctor_id, clinic_id, start, doc.duration_minutes, doc.buffer_minutes), None
+    if item.get("visit_type") == "SERVICE":
+        service_id = item.get("service_id")
+        if not service_id:
+            return None, "invalid_request"
+        svc = catalog.services.get(service_id)
+        if not svc:
+            return None, "not_found"
+        return _Planned(0, "SERVICE", service_id, svc.clinic_id, start, svc.duration_minutes, svc.buffer_minutes), None
+    return None, "invalid_request"
+
+
+def _load_batch_windows(db: Session, planned: List[_Planned]) -> Dict[tuple, List[Tuple[datetime, datetime]]]:
+    """Schedule windows per (kind, resource_id, clinic_id, work_date) of the batch."""
+    days = {p.start.date() for p in planned}
+    doctor_ids = {p.resource_id for p in planned if p.kind == "DOCTOR"}
+    service_ids = {p.resource_id for p in planned if p.kind == "SERVICE"}
+    windows = defaultdict(list)
+    if doctor_ids:
+        for w in load_windows(db, "DOCTOR", min(days), max(days), doctor_ids):
+            if w.work_date in days:
+                windows[("DOCTOR", w.resource_id, w.clinic_id, w.work_date)].append(
+                    (_combine(w.work_date, w.time_start), _combine(w.work_date, w.time_end))
+                )
+    if service_ids:
+        services = reference_catalog.get(db).services
+        for w in load_windows(db, "SERVICE", min(days), max(days), service_ids):
+            if w.work_date in days:
+                windows[("SERVICE", w.resource_id, services[w.resource_id].clinic_id, w.work_date)].append(
+                    (_combine(w.work_date, w.time_start), _combine(w.work_date, w.time_end))
+                )
+    return windows
+
+
+def _load_batch_visits(db: Session, planned: List[_Planned]) -> Dict[Tuple[str, int, date], List[VisitRecord]]:
+    """Existing visits per (kind, resource_id, day) of the batch, with one query."""
+    doctor_ids = {p.resource_id for p in planned if p.kind == "DOCTOR"}
+    service_ids = {p.resource_id for p in planned if p.kind == "SERVICE"}
+    resources = []
+    if doctor_ids:
+        resources.append(and_(Visit.visit_type == "DOCTOR", Visit.doctor_id.in_(doctor_ids)))
+    if service_ids:
+        resources.append(and_(Visit.visit_type == "SERVICE", Visit.service_id.in_(service_ids)))
+    days = [p.start.date() for p in planned]
+    visits = defaultdict(list)
+    for vid, kind, doctor_id, service_id, start, duration, buffer, patient_id in db.query(
+        Visit.id, Visit.visit_type, Visit.doctor_id, Visit.service_id,
+        Visit.start_datetime, Visit.duration_minutes, Visit.buffer_minutes, Visit.patient_id,
+    ).filter(
+        or_(*resources),
+        Visit.start_datetime >= _combine(min(days), dt_time(0, 0)),
+        Visit.start_datetime < _combine(max(days) + timedelta(days=1), dt_time(0, 0)),
+    ):
+        key = (kind, doctor_id if kind == "DOCTOR" else service_id, start.date())
+        visits[key].append(VisitRecord(vid, start, duration, buffer, patient_id))
+    return visits
+
+
+def book_visits(
+    db: Session,
+    patient_id: int,
+    items: List[dict],
+    atomic: bool = True,
+) -> List[Tuple[Optional[int], Optional[str]]]:
+    """Book several visits for one patient in one transaction.
+
+    items are dicts with book_visit's visit_type, doctor_id, service_id,
+    clinic_id and start (None if it could not be parsed). Schedules and
+    visits of all items are loaded up front, overlap checks (including
+    between items) run in memory, and new visits are stored with one
+    multi-row INSERT. Returns (visit_id, error) per item, in order. With
+    atomic nothing is booked unless every item can be; the otherwise valid
+    items then fail with batch_aborted.
+    """
+    keys = _booking_lock_keys(items)
+    try:
+        with resource_days_locked(db, keys):
+            return _book_visits(db, patient_id, items, atomic)
+    except LockTimeout:
+        logger.warning("Timed out waiting for batch booking locks %s", keys)
+        return [(None, LOCK_TIMEOUT)] * len(items)
+
+
+def _book_visits(
+    db: Session,
+    patient_id: int,
+    items: List[dict],
+    atomic: bool,
+) -> List[Tuple[Optional[int], Optional[str]]]:
+    results: List[Tuple[Optional[int], Optional[str]]] = [(None, None)] * len(items)
+    catalog = reference_catalog.get(db)
+    planned = []
+    for i, item in enumerate(items):
+        plan, err = _plan_batch_item(catalog, item)
+        if err:
+            results[i] = (None, err)
+        else:
+            planned.append(plan._replace(index=i))
+
+    accepted = []
+    # Items repeating the start of an accepted item: index -> that item's index
+    duplicates = {}
+    if planned:
+        windows = _load_batch_windows(db, planned)
+        visits = _load_batch_visits(db, planned)
+        indexes = {}
+        batch_starts = {}
+        for p in planned:
+            day = p.start.date()
+            end = p.start + timedelta(minutes=p.duration)
+            if not any(ws <= p.start and end <= we for ws, we in windows.get((p.kind, p.resource_id, p.clinic_id, day), ())):
+                results[p.index] = (None, "not_in_schedule")
+                continue
+            key = (p.kind, p.resource_id, day)
+            # Idempotency check
+            existing = next((v for v in visits[key] if v.id is not None and v.start_datetime == p.start), None)
+            if existing:
+                results[p.index] = (existing.id, None) if existing.patient_id == patient_id else (None, "slot_busy")
+                continue
+            # An earlier item of this batch books the same start for this
+            # patient, which a repeated single booking would return.
+            first = batch_starts.get((key, p.start))
+            if first is not None:
+                duplicates[p.index] = first
+                continue
+            # Overlap check, including items accepted earlier in this batch
+            if key not in indexes:
+                indexes[key] = VisitIntervalIndex(visits[key])
+            if indexes[key].conflict(p.start, p.start + timedelta(minutes=p.duration + p.buffer)) is not None:
+                results[p.index] = (None, "slot_busy")
+                continue
+            visits[key].append(VisitRecord(None, p.start, p.duration, p.buffer, patient_id))
+            del indexes[key]
+            batch_starts[(key, p.start)] = p.index
+            accepted.append(p)
+
+    if atomic and any(err for _, err in results):
+        for p in accepted:
+            results[p.index] = (None, BATCH_ABORTED)
+        return _copy_duplicates(results, duplicates)
+    if not accepted:
+        return results
+
+    now = datetime.now()
+    rows = [
+        {
+            "patient_id": patient_id,
+            "visit_type": p.kind,
+            "doctor_id": p.resource_id if p.kind == "DOCTOR" else None,
+            "service_id": p.resource_id if p.kind == "SERVICE" else None,
+            "clinic_id": p.clinic_id,
+            "start_datetime": p.start,
+            "duration_minutes": p.duration,
+            "buffer_minutes": p.buffer,
+            "created_at": now,
+        }
+        for p in accepted
+    ]
+    errors = {}
+    try:
+        try:
+            db.execute(insert(Visit), rows)
+        except IntegrityError:
+            # A concurrent booking took one of the starts; find it row by row.
+            db.rollback()
+            for p, row in zip(accepted, rows):
+                try:
+                    with db.begin_nested():
+                        db.execute(insert(Visit), [row])
+                except IntegrityError:
+                    errors[p.index] = "slot_busy"
+
+        ids = {
+            (kind, doctor_id if kind == "DOCTOR" else service_id, start): vid
+            for vid, kind, doctor_id, service_id, start in db.query(
+                Visit.id, Visit.visit_type, Visit.doctor_id, Visit.service_id, Visit.start_datetime,
+            ).filter(
+                Visit.patient_id == patient_id,
+                Visit.start_datetime.in_({p.start for p in accepted}),
+            )
+        }
+        if SLOT_TABLE:
+            for p in accepted:
+                if p.index in errors:
+                    continue
+                vid = ids[(p.kind, p.resource_id, p.start)]
+                if not _claims_slot(p.start):
+                    slot_table.occupy_slots(db, p.kind, p.resource_id, p.start, p.duration + p.buffer, vid)
+                    continue
+                if not slot_table.claim_slot(db, p.kind, p.resource_id, p.clinic_id, p.start, vid):
+                    exists = slot_table.slot_exists(db, p.kind, p.resource_id, p.clinic_id, p.start)
+                    errors[p.index] = "slot_busy" if exists else "not_in_schedule"
+                    db.query(Visit).filter(Visit.id == vid).delete(synchronize_session=False)
+
+        if atomic and errors:
+            db.rollback()
+        else:
+            record_changes(db, [
+                (p.kind, p.resource_id, p.start.date()) for p in accepted if p.index not in errors
+            ])
+            db.commit()
+    except DataError:
+        db.rollback()
+        logger.exception("Failed to store patient_id=%s for batch booking", patient_id)
+        errors = {p.index: "invalid_request" for p in accepted}
+    except Exception:
+        db.rollback()
+        logger.exception("Unexpected DB error while booking visit batch")
+        errors = {p.index: "database_error" for p in accepted}
+
+    for p in accepted:
+        if p.index in errors:
+            results[p.index] = (None, errors[p.index])
+        elif atomic and errors:
+            results[p.index] = (None, BATCH_ABORTED)
+        else:
+            vid = ids[(p.kind, p.resource_id, p.start)]
+            results[p.index] = (vid, None)
+            availability_engine.add_visit(
+                p.kind, p.resource_id, VisitRecord(vid, p.start, p.duration, p.buffer, patient_id),
+            )
+    return _copy_duplicates(results, duplicates)
+
+
+def _copy_duplicates(results: list, duplicates: Dict[int, int]) -> list:
+    for index, first in duplicates.items():
+        results[index] = results[first]
+    return results
+
+
+# Async versions for the async endpoints. db is an AsyncSession (ASYNC_DB=1),
+# whose DB reads then go through the async driver, or a sync Session, whose
+# calls are moved to a worker thread. Returned iterators never touch the DB.
+
+async def iter_doctor_slots_async(db, time_from: datetime, time_to: datetime, **filters) -> Iterator[dict]:
+    return await run_db(db, iter_doctor_slots, time_from, time_to, **filters)
+
+
+async def iter_service_slots_async(db, time_from: datetime, time_to: datetime, **filters) -> Iterator[dict]:
+    return await run_db(db, iter_service_slots, time_from, time_to, **filters)
+
+
+async def next_doctor_slots_async(db, time_from: datetime, time_to: datetime, **filters) -> list:
+    return await run_db(db, next_doctor_slots, time_from, time_to, **filters)
+
+
+async def next_service_slots_async(db, time_from: datetime, time_to: datetime, **filters) -> list:
+    return await run_db(db, next_service_slots, time_from, time_to, **filters)
+
+
+async def book_visit_async(db, **kwargs) -> Tuple[Optional[int], Optional[str]]:
+    if not isinstance(db, AsyncSession):
+        # A sync session books in a worker thread, which may wait for the locks itself.
+        return await run_db(db, book_visit, **kwargs)
+    # The booking runs on the event loop thread, so the locks are awaited here.
+    keys = _booking_lock_keys([kwargs])
+    try:
+        async with resource_days_locked_async(db, keys):
+            return await run_db(db, _book_visit, **kwargs)
+    except LockTimeout:
+        logger.warning("Timed out waiting for booking lock %s", keys)
+        return None, LOCK_TIMEOUT
+
+
+async def book_visits_async(db, **kwargs) -> List[Tuple[Optional[int], Optional[str]]]:
+    if not isinstance(db, AsyncSession):
+        return await run_db(db, book_visits, **kwargs)
+    keys = _booking_lock_keys(kwargs["items"])
+    try:
+        async with resource_days_locked_async(db, keys):
+            return await run_db(db, _book_visits, **kwargs)
+    except LockTimeout:
+        logger.warning("Timed out waiting for batch booking locks %s", keys)
+        return [(None, LOCK_TIMEOUT)] * len(kwargs["items"])
+
+
+async def list_visits_async(db, time_from: datetime, time_to: datetime,
+                            patient_id: Optional[int] = None) -> List[Visit]:
+    return await run_db(db, list_visits, time_from, time_to, patient_id)
@@ -0,0 +1,278 @@
+"""Optional materialized slot table.
+
+With ``SLOT_TABLE=1`` every grid slot of the schedule windows of the next
+``SCHEDULE_DAYS_AHEAD`` days (through ``horizon()``) is stored as a row of the
+``slot`` table, filled by ``database.ensure_future_schedules``. Booking claims
+a row with a single conditional ``UPDATE ... WHERE state = 'FREE'``,
+cancellation releases it, and slot search becomes an indexed range scan
+instead of grid generation and overlap checks in Python. Searches and
+bookings after the horizon expand the schedule rules as without the table;
+such bookings mark any slots already materialized for them BUSY.
+
+Rows are only generated on the fixed grid (``duration + buffer`` steps from
+the window start), so within the horizon bookings must start on a grid slot.
+Schedule windows of one resource are assumed not to overlap.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import func, insert, tuple_, update
+from sqlalchemy.orm import Session
+
+from availability import SlotGrid, VisitIntervalIndex, VisitRecord
+from config import SCHEDULE_DAYS_AHEAD
+from models import Doctor, Service, Slot, Visit
+from schedule_rules import load_windows
+
+logger = logging.getLogger(__name__)
+
+# Rows per multi-row INSERT when filling the table.
+INSERT_CHUNK = 1000
+
+# (resource_id, clinic_id, start_datetime, busy_patient_id)
+SlotRow = Tuple[int, int, datetime, Optional[int]]
+
+
+def horizon() -> date:
+    """Last day served from the table. The same on every worker; the table is
+    filled one day further, so it is complete when the horizon moves at midnight."""
+    return date.today() + timedelta(days=max(SCHEDULE_DAYS_AHEAD - 1, 0))
+
+
+def horizon_end() -> datetime:
+    """Midnight after horizon(); slots starting from here are not in the table."""
+    return datetime.combine(horizon() + timedelta(days=1), datetime.min.time())
+
+
+def _windows(db: Session, day_from: date, day_to: date):
+    """Yield (kind, SlotGrid) for every schedule window in [day_from, day_to]."""
+    doctors = {
+        did: (duration, duration + buffer)
+        for did, duration, buffer in db.query(Doctor.id, Doctor.duration_minutes, Doctor.buffer_minutes)
+    }
+    for window in load_windows(db, "DOCTOR", day_from, day_to):
+        if window.resource_id not in doctors:
+            continue
+        duration, interval = doctors[window.resource_id]
+        yield "DOCTOR", SlotGrid(
+            window.resource_id, window.clinic_id, window.work_date,
+            datetime.combine(window.work_date, window.time_start),
+            datetime.combine(window.work_date, window.time_end),
+            duration, interval,
+        )
+
+    services = {
+        sid: (clinic_id, duration, duration + buffer)
+        for sid, clinic_id, duration, buffer in db.query(
+            Service.id, Service.clinic_id, Service.duration_minutes, Service.buffer_minutes,
+        )
+    }
+    for window in load_windows(db, "SERVICE", day_from, day_to):
+        if window.resource_id not in services:
+            continue
+        clinic_id, duration, interval = services[window.resource_id]
+        yield "SERVICE", SlotGrid(
+            window.resource_id, clinic_id, window.work_date,
+            datetime.combine(window.work_date, window.time_start),
+            datetime.combine(window.work_date, window.time_end),
+            duration, interval,
+        )
+
+
+def materialize_slots(db: Session, day_from: date, day_to: date) -> Tuple[int, int]:
+    """Bring the slot rows of [day_from, day_to] in line with the schedule windows.
+
+    Missing rows are inserted; slots overlapped by existing visits are
+    inserted as BUSY, so the table can be enabled on a database that already
+    has bookings. FREE rows that no longer match a window (changed rules,
+    durations or clinics) are deleted; BUSY rows stay with their visit.
+    Returns (rows inserted, rows deleted); the caller commits.
+    """
+    range_from = datetime.combine(day_from, datetime.min.time())
+    range_to = datetime.combine(day_to + timedelta(days=1), datetime.min.time())
+    # (kind, resource_id, start) -> (id, clinic_id, state)
+    existing = {
+        (kind, resource_id, start): (slot_id, clinic_id, state)
+        for slot_id, kind, resource_id, start, clinic_id, state in db.query(
+            Slot.id, Slot.resource_type, Slot.resource_id, Slot.start_datetime, Slot.clinic_id, Slot.state,
+        ).filter(Slot.start_datetime >= range_from, Slot.start_datetime < range_to)
+    }
+    visits = {}
+    for vid, kind, doctor_id, service_id, start, duration, buffer in (
+        db.query(
+            Visit.id, Visit.visit_type, Visit.doctor_id, Visit.service_id,
+            Visit.start_datetime, Visit.duration_minutes, Visit.buffer_minutes,
+        )
+        .filter(Visit.start_datetime >= range_from, Visit.start_datetime < range_to)
+    ):
+        key = (kind, doctor_id if kind == "DOCTOR" else service_id, start.date())
+        # sweep() reports the last record field; keep the visit id there.
+        visits.setdefault(key, []).append(VisitRecord(vid, start, duration, buffer, vid))
+
+    wanted = {}
+    for kind, grid in _windows(db, day_from, day_to):
+        index = VisitIntervalIndex(visits.get((kind, grid.resource_id, grid.work_date), ()))
+        starts = (grid.start_at(i) for i in range(grid.count))
+        for start, visit_id in index.sweep(starts, grid.interval):
+            wanted.setdefault((kind, grid.resource_id, start), {
+                "resource_type": kind,
+                "resource_id": grid.resource_id,
+                "clinic_id": grid.clinic_id,
+                "start_datetime": start,
+                "end_datetime": start + timedelta(minutes=grid.duration),
+                "state": "FREE" if visit_id is None else "BUSY",
+                "visit_id": visit_id,
+            })
+
+    stale = []
+    for key, (slot_id, clinic_id, state) in existing.items():
+        row = wanted.get(key)
+        if state == "FREE" and (row is None or row["clinic_id"] != clinic_id):
+            stale.append(slot_id)
+        else:
+            wanted.pop(key, None)
+    for i in range(0, len(stale), INSERT_CHUNK):
+        db.query(Slot).filter(Slot.id.in_(stale[i:i + INSERT_CHUNK])).delete(synchronize_session=False)
+
+    rows = list(wanted.values())
+    for i in range(0, len(rows), INSERT_CHUNK):
+        db.execute(insert(Slot), rows[i:i + INSERT_CHUNK])
+    if rows or stale:
+        logger.info(
+            "Materialized %s slots and removed %s for %s..%s.",
+            len(rows), len(stale), day_from.isoformat(), day_to.isoformat(),
+        )
+    return len(rows), len(stale)
+
+
+def claim_slot(db: Session, kind: str, resource_id: int, clinic_id: int, start: datetime,
+               visit_id: int) -> bool:
+    """Mark the slot at start BUSY for visit_id if it is still FREE."""
+    result = db.execute(
+        update(Slot)
+        .where(
+            Slot.resource_type == kind,
+            Slot.resource_id == resource_id,
+            Slot.start_datetime == start,
+            Slot.clinic_id == clinic_id,
+            Slot.state == "FREE",
+        )
+        .values(state="BUSY", visit_id=visit_id)
+    )
+    return result.rowcount == 1
+
+
+def slot_exists(db: Session, kind: str, resource_id: int, clinic_id: int, start: datetime) -> bool:
+    return db.query(Slot.id).filter(
+        Slot.resource_type == kind,
+        Slot.resource_id == resource_id,
+        Slot.start_datetime == start,
+        Slot.clinic_id == clinic_id,
+    ).first() is not None
+
+
+def occupy_slots(db: Session, kind: str, resource_id: int, start: datetime, interval: int,
+                 visit_id: int) -> int:
+    """Mark the FREE slots overlapping a visit booked without claiming a slot
+    (after the horizon) BUSY for it, so they are not offered once the horizon
+    reaches its day. interval is duration + buffer in minutes. The caller commits."""
+    span = timedelta(minutes=interval)
+    result = db.execute(
+        update(Slot)
+        .where(
+            Slot.resource_type == kind,
+            Slot.resource_id == resource_id,
+            Slot.state == "FREE",
+            Slot.start_datetime > start - span,
+            Slot.start_datetime < start + span,
+        )
+        .values(state="BUSY", visit_id=visit_id)
+    )
+    return result.rowcount
+
+
+def release_slots(db: Session, visit_id: int) -> int:
+    """Flip the slots held by visit_id back to FREE. The caller commits."""
+    result = db.execute(
+        update(Slot).where(Slot.visit_id == visit_id).values(state="FREE", visit_id=None)
+    )
+    return result.rowcount
+
+
+def _range_filters(kind: str, time_from: datetime, time_to: datetime,
+                   resource_ids: Optional[Iterable[int]], clinic_ids: Optional[Iterable[int]],
+                   states: Tuple[str, ...]) -> list:
+    filters = [
+        Slot.resource_type == kind,
+        Slot.state.in_(states),
+        Slot.start_datetime >= time_from,
+        Slot.start_datetime <= time_to,
+        Slot.end_datetime <= time_to,
+    ]
+    if resource_ids is not None:
+        filters.append(Slot.resource_id.in_(resource_ids))
+    if clinic_ids is not None:
+        filters.append(Slot.clinic_id.in_(clinic_ids))
+    return filters
+
+
+def search_slots(db: Session, kind: str, time_from: datetime, time_to: datetime,
+                 resource_ids: Optional[Iterable[int]] = None, clinic_ids: Optional[Iterable[int]] = None,
+                 with_busy: bool = False, limit: Optional[int] = None) -> List[SlotRow]:
+    """Slot rows in [time_from, time_to] ordered by start.
+
+    With limit, only whole start times are read up to the first one that
+    yields limit + 1 rows strictly after time_from, so a page that skips
+    cursor rows at time_from is still complete.
+    """
+    filters = _range_filters(
+        kind, time_from, time_to, resource_ids, clinic_ids, ("FREE", "BUSY") if with_busy else ("FREE",),
+    )
+    if limit is not None:
+        boundary = (
+            db.query(Slot.start_datetime)
+            .filter(*filters, Slot.start_datetime > time_from)
+            .order_by(Slot.start_datetime)
+            .offset(limit)
+            .limit(1)
+            .scalar()
+        )
+        if boundary is not None:
+            filters.append(Slot.start_datetime <= boundary)
+
+    if with_busy:
+        query = db.query(Slot.resource_id, Slot.clinic_id, Slot.start_datetime, Visit.patient_id) \
+            .outerjoin(Visit, Visit.id == Slot.visit_id)
+    else:
+        query = db.query(Slot.resource_id, Slot.clinic_id, Slot.start_datetime)
+    rows = query.filter(*filters).order_by(Slot.start_datetime, Slot.resource_id).all()
+    if with_busy:
+        return [tuple(row) for row in rows]
+    return [(rid, cid, start, None) for rid, cid, start in rows]
+
+
+def first_free_slots(db: Session, kind: str, time_from: datetime, time_to: datetime,
+                     resource_ids: Optional[Iterable[int]] = None,
+                     clinic_ids: Optional[Iterable[int]] = None) -> List[SlotRow]:
+    """The earliest FREE slot row of every matching resource, ordered by start."""
+    filters = _range_filters(kind, time_from, time_to, resource_ids, clinic_ids, ("FREE",))
+    firsts = (
+        db.query(Slot.resource_id, func.min(Slot.start_datetime))
+        .filter(*filters)
+        .group_by(Slot.resource_id)
+        .all()
+    )
+    if not firsts:
+        return []
+    rows = (
+        db.query(Slot.resource_id, Slot.clinic_id, Slot.start_datetime)
+        .filter(
+            Slot.resource_type == kind,
+            tuple_(Slot.resource_id, Slot.start_datetime).in_([tuple(f) for f in firsts]),
+        )
+        .order_by(Slot.start_datetime, Slot.resource_id)
+        .all()
+    )
+    return [(rid, cid, start, None) for rid, cid, start in rows]
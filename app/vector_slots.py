@@ -0,0 +1,69 @@
+"""NumPy slot kernel for one schedule window (optional).
+
+The window's grid becomes an array of minute offsets from midnight
+(``arange`` in ``duration + buffer`` steps) and every slot
+[start, start + step) is tested against the resource-day's visits with two
+``searchsorted`` calls over their sorted starts and running-maximum ends, the
+same test ``VisitIntervalIndex.sweep`` runs one slot at a time. Start and end
+strings are built only for the slots that are returned, from a per-minute
+clock table instead of strftime.
+
+Used by slot_service when numpy is installed and VECTOR_SLOTS is on; the
+pure Python loops stay as the fallback and give identical results.
+"""
+
+from datetime import datetime, time as dt_time, timedelta
+from typing import Iterator, Optional, Tuple
+
+from availability import VisitIntervalIndex
+from config import VECTOR_SLOTS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ENABLED = VECTOR_SLOTS and np is not None
+
+_MINUTES_PER_DAY = 24 * 60
+_CLOCK = [f"T{m // 60:02d}:{m % 60:02d}:00" for m in range(_MINUTES_PER_DAY)]
+
+
+def _minutes(t: datetime, midnight: datetime) -> float:
+    return (t - midnight).total_seconds() / 60
+
+
+def _stamp(prefix: str, midnight: datetime, minute: float) -> str:
+    if minute.is_integer() and 0 <= minute < _MINUTES_PER_DAY:
+        return prefix + _CLOCK[int(minute)]
+    return (midnight + timedelta(minutes=minute)).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def window_slots(window_start: datetime, count: int, duration: int, interval: int,
+                 visits: VisitIntervalIndex, time_from: datetime, time_to: datetime,
+                 with_busy: bool) -> Iterator[Tuple[str, str, Optional[int]]]:
+    """(start, end, busy_patient_id) of the first count grid slots of a window
+    that fit into [time_from, time_to]; busy slots only when with_busy."""
+    if count <= 0:
+        return
+    midnight = datetime.combine(window_start.date(), dt_time.min)
+    starts = _minutes(window_start, midnight) + interval * np.arange(count, dtype=np.float64)
+    keep = (starts >= _minutes(time_from, midnight)) & (starts + duration <= _minutes(time_to, midnight))
+
+    visit_starts, visit_max_ends, patients = visits.minutes(midnight)
+    if visit_starts:
+        # Visits starting before the slot ends minus visits whose running
+        # maximum end is at or before the slot start leave the overlapping ones.
+        hi = np.searchsorted(visit_starts, starts + interval, side="left")
+        lo = np.searchsorted(visit_max_ends, starts, side="right")
+        busy = lo < hi
+        if not with_busy:
+            keep &= ~busy
+    else:
+        lo = busy = None
+
+    prefix = window_start.date().isoformat()
+    selected = np.flatnonzero(keep)
+    for i, minute in zip(selected.tolist(), starts[selected].tolist()):
+        busy_pid = patients[lo[i]] if busy is not None and busy[i] else None
+        yield _stamp(prefix, midnight, minute), _stamp(prefix, midnight, minute + duration), busy_pid
@@ -0,0 +1 @@
+"""Benchmarks and load tests; see the usage in each module's docstring."""
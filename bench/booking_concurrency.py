@@ -0,0 +1,166 @@
+"""Concurrent booking throughput and double-booking check.
+
+Starts many threads that book overlapping visits (starts every --step
+minutes, so most candidates overlap a neighbour) for a few doctors on one
+future day through slot_service.book_visit, against the configured
+database. Afterwards the visits of those doctor-days are checked
+for overlap, the created visits are deleted again and the result is
+printed as one JSON object.
+
+Usage (app requirements installed, DB_* pointing at the MySQL instance):
+
+    python bench/booking_concurrency.py [--threads 32] [--attempts 50] [--doctors 3]
+
+Exits with status 1 if any doctor-day ends up double-booked. Run it against
+a database that is not serving traffic; the availability engine is not
+used for booking and is left untouched.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import database
+from models import Visit
+from schedule_rules import load_windows
+from slot_service import book_visit
+
+# Patient ids of the visits created here, so they can be found and removed.
+PATIENT_BASE = 900_000_000
+
+
+def candidates(db, doctors: int, step: int):
+    """(doctor_id, clinic_id, start) every step minutes in the windows of one future day."""
+    tomorrow = date.today() + timedelta(days=1)
+    windows = load_windows(db, "DOCTOR", tomorrow, tomorrow + timedelta(days=14))
+    if not windows:
+        raise SystemExit("No future doctor schedules to book against.")
+    day = windows[0].work_date
+    scheds = sorted(
+        (w for w in windows if w.work_date == day), key=lambda w: (w.resource_id, w.time_start),
+    )
+    chosen = sorted({s.resource_id for s in scheds})[:doctors]
+    out = []
+    for s in scheds:
+        if s.resource_id not in chosen:
+            continue
+        t = datetime.combine(day, s.time_start)
+        end = datetime.combine(day, s.time_end)
+        while t < end:
+            out.append((s.resource_id, s.clinic_id, t))
+            t += timedelta(minutes=step)
+    return day, chosen, out
+
+
+def overlaps(db, day: date, doctor_ids) -> int:
+    rows = (
+        db.query(Visit.doctor_id, Visit.start_datetime, Visit.duration_minutes, Visit.buffer_minutes)
+        .filter(
+            Visit.visit_type == "DOCTOR",
+            Visit.doctor_id.in_(doctor_ids),
+            Visit.start_datetime >= datetime.combine(day, datetime.min.time()),
+            Visit.start_datetime < datetime.combine(day + timedelta(days=1), datetime.min.time()),
+        )
+        .order_by(Visit.doctor_id, Visit.start_datetime)
+        .all()
+    )
+    bad = 0
+    prev_doctor, prev_end = None, None
+    for doctor_id, start, duration, buffer in rows:
+        if doctor_id == prev_doctor and start < prev_end:
+            bad += 1
+        end = start + timedelta(minutes=duration + buffer)
+        if doctor_id != prev_doctor or end > prev_end:
+            prev_doctor, prev_end = doctor_id, end
+    return bad
+
+
+def run(session_factory, threads: int, attempts: int, doctors: int, step: int, seed: int) -> dict:
+    setup = session_factory()
+    try:
+        day, doctor_ids, slots = candidates(setup, doctors, step)
+    finally:
+        setup.close()
+
+    outcomes = Counter()
+    latencies = []
+    guard = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(n: int):
+        rnd = random.Random(seed + n)
+        local, lat = Counter(), []
+        barrier.wait()
+        for i in range(attempts):
+            doctor_id, clinic_id, start = rnd.choice(slots)
+            # One session per booking, like one request.
+            db = session_factory()
+            started = time.perf_counter()
+            try:
+                _, err = book_visit(db, PATIENT_BASE + n * attempts + i, "DOCTOR", doctor_id, None, clinic_id, start)
+            finally:
+                db.close()
+            lat.append(time.perf_counter() - started)
+            local[err or "booked"] += 1
+        with guard:
+            outcomes.update(local)
+            latencies.extend(lat)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    db = session_factory()
+    try:
+        double_booked = overlaps(db, day, doctor_ids)
+        db.query(Visit).filter(Visit.patient_id >= PATIENT_BASE).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+    latencies.sort()
+    total = sum(outcomes.values())
+    return {
+        "day": day.isoformat(),
+        "doctors": doctor_ids,
+        "threads": threads,
+        "attempts": total,
+        "outcomes": dict(outcomes),
+        "elapsed_s": round(elapsed, 3),
+        "attempts_per_s": round(total / elapsed, 1),
+        "bookings_per_s": round(outcomes["booked"] / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+        "double_booked": double_booked,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--attempts", type=int, default=50, help="bookings per thread")
+    parser.add_argument("--doctors", type=int, default=3)
+    parser.add_argument("--step", type=int, default=5, help="minutes between candidate starts")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    database.init_db(max_retries=1)
+    result = run(database.SessionLocal, args.threads, args.attempts, args.doctors, args.step, args.seed)
+    print(json.dumps(result))
+    return 1 if result["double_booked"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+"""End-to-end load generator for the HTTP API.
+
+Replays a weighted mix of slot searches, bookings, visit listings and
+cancellations against a running app with as many concurrent asyncio
+workers as requested, then prints (and optionally writes) one JSON report
+with throughput, p50/p95/p99 latency, status codes and error rates per
+endpoint, tagged with the current git commit so runs can be compared.
+
+Bookings take free slots found by an initial search, use patient ids from
+PATIENT_BASE up, and cancellations only remove visits booked by this run;
+whatever is still booked at the end is cancelled again unless --keep.
+
+Usage (pip install -r bench/requirements.txt):
+
+    docker compose up -d
+    python -m bench.loadgen --duration 30 --concurrency 32 --out run.json
+    python -m bench.loadgen --mix search=90,book=5,list=5 --compare run.json
+
+--start-app starts `uvicorn main:app` from app/ against the configured DB
+instead of using an already running app.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+PATIENT_BASE = 800_000_000
+DEFAULT_MIX = "search=70,book=15,list=10,cancel=5"
+
+
+def percentile(ordered: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("search", "book", "list", "cancel"):
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}")
+        mix[name] = int(weight)
+    return mix
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Counter = Counter()
+
+    def add(self, endpoint: str, seconds: float, status):
+        self.latencies[endpoint].append(seconds * 1000)
+        self.statuses[endpoint][str(status)] += 1
+        # Rejected bookings (409) are expected under contention; 5xx and
+        # transport failures are errors.
+        if status == "exception" or status >= 500:
+            self.errors[endpoint] += 1
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in sorted(self.latencies):
+            ordered = sorted(self.latencies[name])
+            n = len(ordered)
+            endpoints[name] = {
+                "requests": n,
+                "rps": round(n / elapsed, 1),
+                "p50_ms": round(percentile(ordered, 50), 2),
+                "p95_ms": round(percentile(ordered, 95), 2),
+                "p99_ms": round(percentile(ordered, 99), 2),
+                "max_ms": round(ordered[-1], 2),
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / n, 4),
+                "status": dict(self.statuses[name]),
+            }
+        total = sum(e["requests"] for e in endpoints.values())
+        errors = sum(e["errors"] for e in endpoints.values())
+        return {
+            "endpoints": endpoints,
+            "total": {
+                "requests": total,
+                "rps": round(total / elapsed, 1),
+                "errors": errors,
+                "error_rate": round(errors / total, 4) if total else None,
+            },
+        }
+
+
+class LoadRun:
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.recorder = Recorder()
+        self.day_from = date.today() + timedelta(days=1)
+        self.free: List[dict] = []
+        self.booked: List[dict] = []
+        self.directions: List[int] = []
+        self.clinics: List[int] = []
+        self.next_patient = PATIENT_BASE
+
+    async def call(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.add(endpoint, time.perf_counter() - started, "exception")
+            return None
+        self.recorder.add(endpoint, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def prepare(self):
+        self.clinics = [c["id"] for c in (await self.client.get("/api/v1/clinics")).json()]
+        self.directions = [d["id"] for d in (await self.client.get("/api/v1/directions")).json()]
+        for slot_type in ("doctor", "service"):
+            response = await self.client.get("/api/v1/slots/search", params={
+                "patient_id": 1,
+                "type": slot_type,
+                "time_from": f"{self.day_from.isoformat()}T00:00:00",
+                "time_to": f"{(self.day_from + timedelta(days=self.args.days)).isoformat()}T00:00:00",
+            }, timeout=120)
+            response.raise_for_status()
+            self.free.extend(response.json()["items"])
+        self.rnd.shuffle(self.free)
+
+    def search_params(self) -> dict:
+        day = self.day_from + timedelta(days=self.rnd.randrange(self.args.days))
+        params = {
+            "patient_id": 1,
+            "type": self.rnd.choice(("doctor", "doctor", "service")),
+            "time_from": f"{day.isoformat()}T00:00:00",
+            "time_to": f"{(day + timedelta(days=self.rnd.choice((1, 1, 7)))).isoformat()}T00:00:00",
+        }
+        roll = self.rnd.random()
+        if roll < 0.3 and self.clinics:
+            params["clinic_id"] = self.rnd.choice(self.clinics)
+        elif roll < 0.6 and self.directions and params["type"] == "doctor":
+            params["direction_id"] = self.rnd.choice(self.directions)
+        return params
+
+    async def op_search(self):
+        await self.call("GET /api/v1/slots/search", "GET", "/api/v1/slots/search", params=self.search_params())
+
+    async def op_book(self):
+        if not self.free:
+            return await self.op_search()
+        slot = self.free.pop()
+        self.next_patient += 1
+        patient_id = self.next_patient
+        body = {"visit_type": "DOCTOR" if slot["doctor_id"] else "SERVICE", "start": slot["start"]}
+        if slot["doctor_id"]:
+            body.update(doctor_id=slot["doctor_id"], clinic_id=slot["clinic_id"])
+        else:
+            body["service_id"] = slot["service_id"]
+        response = await self.call(
+            "POST /api/v1/visits", "POST", "/api/v1/visits", params={"patient_id": patient_id}, json=body,
+        )
+        if response is not None and response.status_code == 200:
+            self.booked.append({"visit_id": response.json()["visit_id"], "patient_id": patient_id, "slot": slot})
+
+    async def op_list(self):
+        patient_id = self.rnd.choice(self.booked)["patient_id"] if self.booked else PATIENT_BASE
+        await self.call("GET /api/v1/visits", "GET", "/api/v1/visits", params={"patient_id": patient_id})
+
+    async def op_cancel(self):
+        if not self.booked:
+            return await self.op_book()
+        visit = self.booked.pop(self.rnd.randrange(len(self.booked)))
+        response = await self.call(
+            "DELETE /api/v1/visits/{id}", "DELETE", f"/api/v1/visits/{visit['visit_id']}",
+            params={"patient_id": visit["patient_id"]},
+        )
+        if response is not None and response.status_code == 200:
+            self.free.append(visit["slot"])
+
+    async def worker(self, deadline: float, ops: list, weights: list):
+        while time.perf_counter() < deadline:
+            op = self.rnd.choices(ops, weights)[0]
+            await op()
+
+    async def run(self, duration: float, warmup: float) -> float:
+        ops = [getattr(self, f"op_{name}") for name in self.args.mix]
+        weights = list(self.args.mix.values())
+        if warmup > 0:
+            deadline = time.perf_counter() + warmup
+            await asyncio.gather(*(self.worker(deadline, ops, weights) for _ in range(self.args.concurrency)))
+            self.recorder = Recorder()
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self.worker(deadline, ops, weights) for _ in range(self.args.concurrency)))
+        return time.perf_counter() - started
+
+    async def cleanup(self):
+        for visit in self.booked:
+            await self.client.delete(
+                f"/api/v1/visits/{visit['visit_id']}", params={"patient_id": visit["patient_id"]},
+            )
+        self.booked.clear()
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """Relative change of rps and latency percentiles per endpoint."""
+    def delta(new, old):
+        return round((new - old) / old * 100, 1) if old else None
+
+    out = {}
+    for name, new in report["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(name)
+        if old:
+            out[name] = {f"{k}_change_pct": delta(new[k], old[k]) for k in ("rps", "p50_ms", "p95_ms", "p99_ms")}
+    return {"baseline_commit": baseline.get("meta", {}).get("commit"), "endpoints": out}
+
+
+def start_app(base_url: str) -> subprocess.Popen:
+    port = httpx.URL(base_url).port or 80
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=APP_DIR,
+    )
+    for _ in range(120):
+        try:
+            if httpx.get(f"{base_url}/api/v1/clinics", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise SystemExit("App exited during startup.")
+        time.sleep(1)
+    proc.terminate()
+    raise SystemExit("App did not become ready.")
+
+
+async def main_async(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        run = LoadRun(client, args)
+        await run.prepare()
+        free_slots = len(run.free)
+        try:
+            elapsed = await run.run(args.duration, args.warmup)
+        finally:
+            if not args.keep:
+                await run.cleanup()
+    report = run.recorder.report(elapsed)
+    report["meta"] = {
+        "commit": git_commit(),
+        "label": args.label,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "base_url": args.base_url,
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 2),
+        "mix": args.mix,
+        "seed": args.seed,
+        "free_slots_at_start": free_slots,
+    }
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of unmeasured load first")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--days", type=int, default=7, help="days ahead covered by searches and bookings")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", help="free-form tag stored in the report")
+    parser.add_argument("--out", help="also write the report to this file")
+    parser.add_argument("--compare", help="report changes against an earlier report")
+    parser.add_argument("--keep", action="store_true", help="do not cancel the visits booked by this run")
+    parser.add_argument("--start-app", action="store_true", help="start the app with uvicorn first")
+    args = parser.parse_args()
+
+    proc = start_app(args.base_url) if args.start_app else None
+    try:
+        report = asyncio.run(main_async(args))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Before/after benchmark of the slot and visit response serialization.
+
+Serves the same payloads through a throwaway FastAPI app in two ways: as
+plain dicts validated against the response_model (the previous path) and as
+TrustedJSONResponse (the current path), and times in-process requests. No
+database is needed.
+
+Usage:
+
+    python bench/serialization.py [--sizes 100,1000,5000] [--repeat 20]
+
+Prints one JSON object per payload and size with median milliseconds per
+request.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from catalog import ClinicEntry, DirectionEntry, DoctorEntry
+from responses import TrustedJSONResponse, orjson
+from schemas import SlotSearchResponse, VisitItem, VisitListResponse
+from slot_service import _doctor_slot
+
+BIO = "Board-certified internist with a focus on preventive care. " * 12
+
+
+def make_slots(n: int) -> list:
+    clinic = ClinicEntry(1, "Family Health Mitte", "Mitte", "Invalidenstr. 1")
+    directions = [DirectionEntry(1, "Therapist"), DirectionEntry(2, "Cardiologist")]
+    doctors = [
+        DoctorEntry(i, f"First{i}", f"Last{i}", None, BIO, f"/photos/{i}.png", 30, 5, directions)
+        for i in range(1, 11)
+    ]
+    start = datetime(2030, 1, 7, 8, 0)
+    return [
+        _doctor_slot(doctors[i % 10], clinic, start + timedelta(minutes=35 * (i // 10)), 30, None, False)
+        for i in range(n)
+    ]
+
+
+def make_visits(n: int) -> list:
+    start = datetime(2030, 1, 7, 8, 0)
+    return [
+        {
+            "visit_id": i, "patient_id": 1000 + i, "visit_type": "DOCTOR", "clinic_id": 1,
+            "clinic_name": "Family Health Mitte", "doctor_id": i % 10 + 1, "doctor_name": f"Last{i} First{i}",
+            "doctor_photo": f"/photos/{i}.png", "doctor_bio": BIO, "service_id": None, "service_name": None,
+            "start": (start + timedelta(minutes=35 * i)).strftime("%Y-%m-%dT%H:%M:%S"),
+            "end": (start + timedelta(minutes=35 * i + 30)).strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        for i in range(n)
+    ]
+
+
+def build_app(slots: list, visits: list) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/slots/validated", response_model=SlotSearchResponse)
+    def slots_validated():
+        return {"items": slots, "next_cursor": None}
+
+    @app.get("/slots/trusted", response_model=SlotSearchResponse)
+    def slots_trusted():
+        return TrustedJSONResponse({"items": slots, "next_cursor": None})
+
+    @app.get("/visits/validated", response_model=VisitListResponse)
+    def visits_validated():
+        return {"items": [VisitItem(**v) for v in visits]}
+
+    @app.get("/visits/trusted", response_model=VisitListResponse)
+    def visits_trusted():
+        return TrustedJSONResponse({"items": visits})
+
+    return app
+
+
+def median_ms(client: TestClient, path: str, repeat: int) -> float:
+    client.get(path)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+    return statistics.median(samples)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="100,1000,5000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for n in (int(s) for s in args.sizes.split(",")):
+        client = TestClient(build_app(make_slots(n), make_visits(n)))
+        for payload in ("slots", "visits"):
+            before = median_ms(client, f"/{payload}/validated", args.repeat)
+            after = median_ms(client, f"/{payload}/trusted", args.repeat)
+            if client.get(f"/{payload}/validated").json() != client.get(f"/{payload}/trusted").json():
+                raise SystemExit(f"{payload}: responses differ")
+            print(json.dumps({
+                "payload": payload,
+                "items": n,
+                "encoder": "orjson" if orjson is not None else "json",
+                "validated_ms": round(before, 2),
+                "trusted_ms": round(after, 2),
+                "speedup": round(before / after, 1),
+            }))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -49,7 +49,12 @@ CREATE TABLE IF NOT EXISTS doctor_schedule (
     time_start TIME NOT NULL,
     time_end   TIME NOT NULL,
     FOREIGN KEY (doctor_id) REFERENCES doctor(id),
-    FOREIGN KEY (clinic_id) REFERENCES clinic(id)
+    FOREIGN KEY (clinic_id) REFERENCES clinic(id),
+    -- Slot search: date range + clinic; booking: doctor + date
+    KEY idx_doctor_schedule_date (work_date, clinic_id, doctor_id),
+    KEY idx_doctor_schedule_doctor_date (doctor_id, work_date),
+    -- One row per window
+    UNIQUE KEY uq_doctor_schedule_window (doctor_id, work_date, clinic_id, time_start, time_end)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 CREATE TABLE IF NOT EXISTS service_schedule (
@@ -58,7 +63,35 @@ CREATE TABLE IF NOT EXISTS service_schedule (
     work_date  DATE NOT NULL,
     time_start TIME NOT NULL,
     time_end   TIME NOT NULL,
-    FOREIGN KEY (service_id) REFERENCES service(id)
+    FOREIGN KEY (service_id) REFERENCES service(id),
+    -- Slot search: date range; booking: service + date
+    KEY idx_service_schedule_date (work_date, service_id),
+    KEY idx_service_schedule_service_date (service_id, work_date),
+    -- One row per window
+    UNIQUE KEY uq_service_schedule_window (service_id, work_date, time_start, time_end)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Weekly recurring schedules, expanded by the app for the requested dates.
+-- doctor_schedule / service_schedule rows override them per resource-day.
+CREATE TABLE IF NOT EXISTS schedule_rule (
+    id            INT AUTO_INCREMENT PRIMARY KEY,
+    resource_type ENUM('DOCTOR','SERVICE') NOT NULL,
+    resource_id   INT NOT NULL,
+    clinic_id     INT DEFAULT NULL,          -- doctor rules only
+    weekday_mask  INT NOT NULL,              -- bit 0 = Monday ... bit 6 = Sunday
+    time_start    TIME NOT NULL,
+    time_end      TIME NOT NULL,
+    valid_from    DATE NOT NULL,
+    valid_to      DATE DEFAULT NULL,         -- inclusive, NULL = open-ended
+    FOREIGN KEY (clinic_id) REFERENCES clinic(id),
+    KEY idx_schedule_rule_resource (resource_type, resource_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS schedule_rule_exception (
+    rule_id        INT NOT NULL,
+    exception_date DATE NOT NULL,
+    PRIMARY KEY (rule_id, exception_date),
+    FOREIGN KEY (rule_id) REFERENCES schedule_rule(id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 CREATE TABLE IF NOT EXISTS visit (
@@ -77,5 +110,38 @@ CREATE TABLE IF NOT EXISTS visit (
     FOREIGN KEY (clinic_id) REFERENCES clinic(id),
     -- Uniqueness: one resource + start time can only be booked once
     UNIQUE KEY uq_doctor_visit (doctor_id, start_datetime),
-    UNIQUE KEY uq_service_visit (service_id, start_datetime)
+    UNIQUE KEY uq_service_visit (service_id, start_datetime),
+    -- Per-resource day lookups, patient visit lists and range scans
+    KEY idx_visit_doctor_start (visit_type, doctor_id, start_datetime),
+    KEY idx_visit_service_start (visit_type, service_id, start_datetime),
+    KEY idx_visit_patient_start (patient_id, start_datetime),
+    KEY idx_visit_start (start_datetime)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Materialized grid slots, filled by the app when SLOT_TABLE=1
+CREATE TABLE IF NOT EXISTS slot (
+    id             INT AUTO_INCREMENT PRIMARY KEY,
+    resource_type  ENUM('DOCTOR','SERVICE') NOT NULL,
+    resource_id    INT NOT NULL,
+    clinic_id      INT NOT NULL,
+    start_datetime DATETIME NOT NULL,
+    end_datetime   DATETIME NOT NULL,
+    state          ENUM('FREE','BUSY') NOT NULL DEFAULT 'FREE',
+    visit_id       INT DEFAULT NULL,
+    FOREIGN KEY (clinic_id) REFERENCES clinic(id),
+    UNIQUE KEY uq_slot_resource_start (resource_type, resource_id, start_datetime),
+    -- Slot search: free slots of one type in a time range; cancel: slots of a visit
+    KEY idx_slot_search (resource_type, state, start_datetime),
+    KEY idx_slot_visit (visit_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Bookings and cancellations per doctor/service day, read by every app worker
+CREATE TABLE IF NOT EXISTS resource_day_change (
+    id             INT AUTO_INCREMENT PRIMARY KEY,
+    resource_type  ENUM('DOCTOR','SERVICE') NOT NULL,
+    resource_id    INT NOT NULL,
+    work_date      DATE NOT NULL,
+    created_at     DATETIME NOT NULL,
+    -- Pruning of old changes
+    KEY idx_resource_day_change_created (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
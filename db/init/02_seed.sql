@@ -75,120 +75,27 @@ INSERT INTO service (id, name, clinic_id, duration_minutes, buffer_minutes) VALU
 (6, 'ECG',                3, 20, 5);
 
 -- ============================================================
--- Doctor Schedules (next 14 days generated via procedure)
--- We use a stored procedure to generate dates dynamically
+-- Weekly schedule rules (weekday_mask: bit 0 = Monday ... bit 6 = Sunday;
+-- 63 = Mon-Sat, 31 = Mon-Fri, 21 = Mon/Wed/Fri, 10 = Tue/Thu).
+-- Same ids and patterns as schedule_rules.DOCTOR_TEMPLATES / SERVICE_TEMPLATES.
 -- ============================================================
-DELIMITER //
-CREATE PROCEDURE seed_schedules()
-BEGIN
-    DECLARE d INT DEFAULT 0;
-    DECLARE cur_date DATE;
-
-    WHILE d < 14 DO
-        SET cur_date = DATE_ADD(CURDATE(), INTERVAL d DAY);
-
-        -- Skip Sundays (DAYOFWEEK: 1=Sunday)
-        IF DAYOFWEEK(cur_date) != 1 THEN
-
-            -- Müller @ Mitte, Mon-Sat
-            INSERT INTO doctor_schedule (doctor_id, clinic_id, work_date, time_start, time_end)
-            VALUES (1, 1, cur_date, '09:00', '17:00');
-
-            -- Schmidt @ Mitte, Mon-Fri
-            IF DAYOFWEEK(cur_date) NOT IN (1, 7) THEN
-                INSERT INTO doctor_schedule (doctor_id, clinic_id, work_date, time_start, time_end)
-                VALUES (2, 1, cur_date, '10:00', '18:00');
-            END IF;
-
-            -- Fischer @ West, Mon-Fri
-            IF DAYOFWEEK(cur_date) NOT IN (1, 7) THEN
-                INSERT INTO doctor_schedule (doctor_id, clinic_id, work_date, time_start, time_end)
-                VALUES (3, 2, cur_date, '08:00', '16:00');
-            END IF;
-
-            -- Weber @ Pankow, Mon-Fri
-            IF DAYOFWEEK(cur_date) NOT IN (1, 7) THEN
-                INSERT INTO doctor_schedule (doctor_id, clinic_id, work_date, time_start, time_end)
-                VALUES (4, 3, cur_date, '09:00', '15:00');
-            END IF;
-
-            -- Wagner @ Mitte, Mon/Wed/Fri
-            IF DAYOFWEEK(cur_date) IN (2, 4, 6) THEN
-                INSERT INTO doctor_schedule (doctor_id, clinic_id, work_date, time_start, time_end)
-                VALUES (5, 1, cur_date, '10:00', '14:00');
-            END IF;
-
-            -- Becker @ Pankow, Mon-Sat
-            INSERT INTO doctor_schedule (doctor_id, clinic_id, work_date, time_start, time_end)
-            VALUES (6, 3, cur_date, '08:00', '14:00');
-
-            -- Hoffmann @ West, Tue/Thu
-            IF DAYOFWEEK(cur_date) IN (3, 5) THEN
-                INSERT INTO doctor_schedule (doctor_id, clinic_id, work_date, time_start, time_end)
-                VALUES (7, 2, cur_date, '09:00', '17:00');
-            END IF;
-
-            -- Schröder @ West, Mon-Fri
-            IF DAYOFWEEK(cur_date) NOT IN (1, 7) THEN
-                INSERT INTO doctor_schedule (doctor_id, clinic_id, work_date, time_start, time_end)
-                VALUES (8, 2, cur_date, '08:00', '16:00');
-            END IF;
-
-            -- Koch @ Mitte, Mon-Fri
-            IF DAYOFWEEK(cur_date) NOT IN (1, 7) THEN
-                INSERT INTO doctor_schedule (doctor_id, clinic_id, work_date, time_start, time_end)
-                VALUES (9, 1, cur_date, '11:00', '19:00');
-            END IF;
-
-            -- Zimmermann @ Pankow, Mon/Wed/Fri
-            IF DAYOFWEEK(cur_date) IN (2, 4, 6) THEN
-                INSERT INTO doctor_schedule (doctor_id, clinic_id, work_date, time_start, time_end)
-                VALUES (10, 3, cur_date, '09:00', '15:00');
-            END IF;
-
-            -- Service schedules (all Mon-Sat where applicable)
-
-            -- Blood Test @ Mitte
-            INSERT INTO service_schedule (service_id, work_date, time_start, time_end)
-            VALUES (1, cur_date, '07:00', '12:00');
-
-            -- Ultrasound @ Mitte, Mon-Fri
-            IF DAYOFWEEK(cur_date) NOT IN (1, 7) THEN
-                INSERT INTO service_schedule (service_id, work_date, time_start, time_end)
-                VALUES (2, cur_date, '08:00', '17:00');
-            END IF;
-
-            -- MRI @ West, Mon-Fri
-            IF DAYOFWEEK(cur_date) NOT IN (1, 7) THEN
-                INSERT INTO service_schedule (service_id, work_date, time_start, time_end)
-                VALUES (3, cur_date, '08:00', '20:00');
-            END IF;
-
-            -- CT Scan @ West, Mon-Fri
-            IF DAYOFWEEK(cur_date) NOT IN (1, 7) THEN
-                INSERT INTO service_schedule (service_id, work_date, time_start, time_end)
-                VALUES (4, cur_date, '08:00', '18:00');
-            END IF;
-
-            -- X-Ray @ Pankow
-            INSERT INTO service_schedule (service_id, work_date, time_start, time_end)
-            VALUES (5, cur_date, '08:00', '16:00');
-
-            -- ECG @ Pankow, Mon-Fri
-            IF DAYOFWEEK(cur_date) NOT IN (1, 7) THEN
-                INSERT INTO service_schedule (service_id, work_date, time_start, time_end)
-                VALUES (6, cur_date, '09:00', '15:00');
-            END IF;
-
-        END IF;
-
-        SET d = d + 1;
-    END WHILE;
-END //
-DELIMITER ;
-
-CALL seed_schedules();
-DROP PROCEDURE IF EXISTS seed_schedules;
+INSERT INTO schedule_rule (id, resource_type, resource_id, clinic_id, weekday_mask, time_start, time_end, valid_from) VALUES
+(1,  'DOCTOR',  1,  1,    63, '09:00', '17:00', CURDATE()),  -- Müller @ Mitte
+(2,  'DOCTOR',  2,  1,    31, '10:00', '18:00', CURDATE()),  -- Schmidt @ Mitte
+(3,  'DOCTOR',  3,  2,    31, '08:00', '16:00', CURDATE()),  -- Fischer @ West
+(4,  'DOCTOR',  4,  3,    31, '09:00', '15:00', CURDATE()),  -- Weber @ Pankow
+(5,  'DOCTOR',  5,  1,    21, '10:00', '14:00', CURDATE()),  -- Wagner @ Mitte
+(6,  'DOCTOR',  6,  3,    63, '08:00', '14:00', CURDATE()),  -- Becker @ Pankow
+(7,  'DOCTOR',  7,  2,    10, '09:00', '17:00', CURDATE()),  -- Hoffmann @ West
+(8,  'DOCTOR',  8,  2,    31, '08:00', '16:00', CURDATE()),  -- Schröder @ West
+(9,  'DOCTOR',  9,  1,    31, '11:00', '19:00', CURDATE()),  -- Koch @ Mitte
+(10, 'DOCTOR',  10, 3,    21, '09:00', '15:00', CURDATE()),  -- Zimmermann @ Pankow
+(11, 'SERVICE', 1,  NULL, 63, '07:00', '12:00', CURDATE()),  -- Blood Test @ Mitte
+(12, 'SERVICE', 2,  NULL, 31, '08:00', '17:00', CURDATE()),  -- Ultrasound @ Mitte
+(13, 'SERVICE', 3,  NULL, 31, '08:00', '20:00', CURDATE()),  -- MRI @ West
+(14, 'SERVICE', 4,  NULL, 31, '08:00', '18:00', CURDATE()),  -- CT Scan @ West
+(15, 'SERVICE', 5,  NULL, 63, '08:00', '16:00', CURDATE()),  -- X-Ray @ Pankow
+(16, 'SERVICE', 6,  NULL, 31, '09:00', '15:00', CURDATE());  -- ECG @ Pankow
 
 -- ============================================================
 -- Pre-booked visits (for admin demo)
@@ -0,0 +1 @@
+"""Automated checks; see tests/conftest.py for the database requirements."""
@@ -0,0 +1,62 @@
+"""Shared fixtures.
+
+Tests marked ``mysql`` run against the MySQL instance configured by DB_*
+(e.g. ``DB_HOST=127.0.0.1 python -m pytest -m mysql tests``). They are skipped when
+it cannot be reached, unless they were selected explicitly with ``-m mysql``,
+in which case an unreachable database is an error.
+"""
+
+import os
+import sys
+from datetime import date, time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+SQLITE_DOCTORS = 2
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mysql: needs the MySQL database configured by DB_*")
+
+
+@pytest.fixture(scope="session")
+def mysql_engine(request):
+    import database
+
+    try:
+        database.init_db(max_retries=1)
+    except RuntimeError as e:
+        if "mysql" in (request.config.option.markexpr or ""):
+            raise
+        pytest.skip(f"MySQL not reachable: {e}")
+    return database.engine
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    """SQLite database with one clinic and SQLITE_DOCTORS doctors working
+    9:00-13:00 every day from today; the reference catalog is loaded from it."""
+    from catalog import reference_catalog
+    from models import Base, Clinic, Doctor, ScheduleRule
+
+    path = tmp_path / "booking.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        db.add(Clinic(id=1, name="Mitte", district="Mitte", address="Street 1"))
+        for doctor_id in range(1, SQLITE_DOCTORS + 1):
+            db.add(Doctor(id=doctor_id, first_name="Test", last_name=f"Doctor {doctor_id}",
+                          duration_minutes=30, buffer_minutes=5))
+            db.add(ScheduleRule(resource_type="DOCTOR", resource_id=doctor_id, clinic_id=1, weekday_mask=0b1111111,
+                                time_start=time(9, 0), time_end=time(13, 0), valid_from=date.today()))
+        db.commit()
+        reference_catalog.invalidate(db)
+    finally:
+        db.close()
+        engine.dispose()
+    return path
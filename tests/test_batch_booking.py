@@ -0,0 +1,60 @@
+"""POST /api/v1/visits/batch with an item repeated in the batch.
+
+A repeated item must get the outcome of its first copy, as if it were
+booked again on its own, instead of failing the overlap check against it.
+"""
+
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import get_session
+from main import app
+from models import Visit
+
+
+@pytest.fixture
+def client(sqlite_path):
+    engine = create_engine(f"sqlite:///{sqlite_path}", connect_args={"check_same_thread": False})
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+
+    def sqlite_session():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_session] = sqlite_session
+    try:
+        yield TestClient(app), session_factory
+    finally:
+        app.dependency_overrides.pop(get_session, None)
+        engine.dispose()
+
+
+@pytest.mark.parametrize("mode", ["all_or_nothing", "best_effort"])
+def test_duplicated_item_gets_the_first_copy_outcome(client, mode):
+    http, session_factory = client
+    day = date.today() + timedelta(days=1)
+    item = {"visit_type": "DOCTOR", "doctor_id": 1, "clinic_id": 1,
+            "start": datetime.combine(day, time(9, 0)).isoformat()}
+    other = dict(item, start=datetime.combine(day, time(10, 0)).isoformat())
+
+    response = http.post("/api/v1/visits/batch", params={"patient_id": 7},
+                         json={"mode": mode, "items": [item, other, item]})
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["status"] == "booked", body
+    first, second, repeated = body["items"]
+    assert [first["status_code"], second["status_code"], repeated["status_code"]] == [200, 200, 200]
+    assert repeated["visit_id"] == first["visit_id"] != second["visit_id"]
+    db = session_factory()
+    try:
+        assert db.query(Visit).filter(Visit.patient_id == 7).count() == 2
+    finally:
+        db.close()
@@ -0,0 +1,120 @@
+"""No double bookings under concurrency, on the thread and the asyncio path.
+
+Overlapping bookings (starts every 5 minutes, visits of 30) race for the
+same doctor-days; afterwards no two visits of a doctor may overlap. The
+SQLite variants exercise the in-process stripes, the mysql ones also the
+GET_LOCK named locks shared by workers.
+"""
+
+import asyncio
+import random
+from collections import Counter
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import booking_locks
+import database
+from bench.booking_concurrency import PATIENT_BASE, candidates, overlaps, run
+from catalog import reference_catalog
+from config import BOOKING_LOCK_STRIPES
+from models import Visit
+from slot_service import book_visit_async
+
+THREADS = 8
+ATTEMPTS = 25
+DOCTORS = 2
+STEP = 5
+
+
+@pytest.fixture
+def fresh_async_stripes(monkeypatch):
+    # asyncio locks stay bound to the event loop they first waited on.
+    monkeypatch.setattr(booking_locks, "booking_stripes", booking_locks.StripedLocks(BOOKING_LOCK_STRIPES))
+
+
+def _async_run(url: str, check_factory, **engine_kwargs) -> dict:
+    """Book concurrently through book_visit_async on AsyncSessions of url;
+    returns the outcomes and the overlap count."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    check = check_factory()
+    try:
+        day, doctor_ids, slots = candidates(check, DOCTORS, STEP)
+    finally:
+        check.close()
+
+    rnd = random.Random(1)
+    picks = [rnd.choice(slots) for _ in range(THREADS * ATTEMPTS)]
+
+    async def book(session_factory, n: int, doctor_id: int, clinic_id: int, start) -> str:
+        async with session_factory() as db:
+            _, err = await book_visit_async(
+                db, patient_id=PATIENT_BASE + n, visit_type="DOCTOR", doctor_id=doctor_id,
+                service_id=None, clinic_id=clinic_id, start=start,
+            )
+        return err or "booked"
+
+    async def book_all():
+        async_engine = create_async_engine(url, **engine_kwargs)
+        try:
+            session_factory = async_sessionmaker(bind=async_engine, autoflush=False)
+            return await asyncio.gather(*(book(session_factory, n, *pick) for n, pick in enumerate(picks)))
+        finally:
+            await async_engine.dispose()
+
+    outcomes = Counter(asyncio.run(book_all()))
+    check = check_factory()
+    try:
+        double_booked = overlaps(check, day, doctor_ids)
+        check.query(Visit).filter(Visit.patient_id >= PATIENT_BASE).delete(synchronize_session=False)
+        check.commit()
+    finally:
+        check.close()
+    return {"outcomes": dict(outcomes), "double_booked": double_booked}
+
+
+def test_threads_never_double_book_on_sqlite(sqlite_path):
+    engine = create_engine(f"sqlite:///{sqlite_path}", connect_args={"check_same_thread": False, "timeout": 30})
+    try:
+        result = run(sessionmaker(bind=engine, autoflush=False), THREADS, ATTEMPTS, DOCTORS, STEP, seed=1)
+    finally:
+        engine.dispose()
+    assert result["outcomes"].get("booked"), result
+    assert result["double_booked"] == 0, result
+
+
+def test_async_path_never_double_books_on_sqlite(sqlite_path, fresh_async_stripes):
+    pytest.importorskip("aiosqlite")
+    engine = create_engine(f"sqlite:///{sqlite_path}")
+    try:
+        result = _async_run(
+            f"sqlite+aiosqlite:///{sqlite_path}", sessionmaker(bind=engine), connect_args={"timeout": 30},
+        )
+    finally:
+        engine.dispose()
+    assert result["outcomes"].get("booked"), result
+    assert result["double_booked"] == 0, result
+
+
+@pytest.mark.mysql
+def test_threads_never_double_book_on_mysql(mysql_engine):
+    db = database.SessionLocal()
+    try:
+        reference_catalog.invalidate(db)
+    finally:
+        db.close()
+    result = run(database.SessionLocal, THREADS, ATTEMPTS, DOCTORS, STEP, seed=1)
+    assert result["double_booked"] == 0, result
+
+
+@pytest.mark.mysql
+def test_async_path_never_double_books_on_mysql(mysql_engine, fresh_async_stripes):
+    db = database.SessionLocal()
+    try:
+        reference_catalog.invalidate(db)
+    finally:
+        db.close()
+    result = _async_run(database.ASYNC_DATABASE_URL, database.SessionLocal)
+    assert result["double_booked"] == 0, result
@@ -0,0 +1,16 @@
+"""Query plan regression check of explain_check under pytest."""
+
+import pytest
+
+pytestmark = pytest.mark.mysql
+
+
+def test_no_full_scans_on_schedule_or_visit_tables(mysql_engine):
+    from explain_check import check_plans
+
+    failures = []
+    with mysql_engine.connect() as conn:
+        for name, checked, bad in check_plans(conn):
+            assert checked, f"{name}: no queries captured"
+            failures += [f"{name}: full scan on {', '.join(scans)}: {sql[:300]}" for scans, sql in bad]
+    assert not failures, "\n".join(failures)